@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# account.py
+import asyncio
+import itertools
+import json
+import logging
+import time
+import aiohttp
+from config import ACCOUNT_MAX_AGE, STREAM_RECONNECT_DELAY
+
+LISTEN_KEY_KEEPALIVE = 30 * 60  # Binance закрывает listenKey через 60 минут без продления
+
+
+class Reservation:
+    def __init__(self, reservation_id, asset, amount):
+        self.id = reservation_id
+        self.asset = asset
+        self.amount = amount
+
+    def __repr__(self):
+        return f"Reservation({self.id}, {self.asset}, {self.amount})"
+
+
+class AccountState:
+    """Свободные и заблокированные балансы аккаунта, общие для всех задач пар.
+
+    Балансы обновляются одним совмещённым запросом fetch_balance не чаще
+    ACCOUNT_MAX_AGE секунд или событиями user-data stream. Перед выставлением
+    ордера задача резервирует сумму через reserve: резерв сразу уменьшает
+    доступный остаток, поэтому параллельные пары не тратят одни и те же USDT.
+    После выставления ордера резерв фиксируется (commit) — сумма переходит в
+    used до следующего снимка биржи, — а при ошибке освобождается (release).
+    """
+
+    def __init__(self, exchange, max_age=ACCOUNT_MAX_AGE):
+        self.exchange = exchange
+        self.max_age = max_age
+        self.free = {}
+        self.used = {}
+        self.updated_at = None
+        self.stream_healthy = False
+        self.refreshes = 0
+        self._inflight = None
+        self._reservations = {}
+        self._commits = []  # (время фиксации, актив, сумма) — ещё не отражённые в снимке биржи
+        self._ids = itertools.count(1)
+
+    @property
+    def age(self):
+        return time.monotonic() - self.updated_at if self.updated_at is not None else float('inf')
+
+    def reserved(self, asset):
+        return sum(r.amount for r in self._reservations.values() if r.asset == asset)
+
+    def available(self, asset):
+        """Свободный остаток актива за вычетом локальных резервов."""
+        return max(0.0, self.free.get(asset, 0.0) - self.reserved(asset))
+
+    async def refresh(self, force=False):
+        """Обновляет балансы, если они старше max_age; параллельные вызовы ждут один запрос."""
+        if not force and (self.stream_healthy or self.age <= self.max_age):
+            return
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._load())
+        await asyncio.shield(self._inflight)
+
+    async def _load(self):
+        try:
+            started = time.monotonic()
+            balance = await self.exchange.fetch_balance()
+            self.refreshes += 1
+            self.apply_balance(balance, started)
+        finally:
+            self._inflight = None
+
+    def apply_balance(self, balance, as_of=None):
+        """Применяет снимок баланса ccxt, полученный по состоянию на as_of (time.monotonic)."""
+        self.free = {asset: float(amount or 0) for asset, amount in balance.get('free', {}).items()}
+        self.used = {asset: float(amount or 0) for asset, amount in balance.get('used', {}).items()}
+        self.updated_at = time.monotonic()
+        # Ордера, выставленные после начала запроса, в снимке ещё не видны
+        if as_of is not None:
+            self._commits = [c for c in self._commits if c[0] >= as_of]
+            for _, asset, amount in self._commits:
+                self._move_to_used(asset, amount)
+        else:
+            self._commits = []
+
+    def apply_event(self, event):
+        """Событие user-data stream Binance: outboundAccountPosition или balanceUpdate."""
+        if event.get('e') == 'outboundAccountPosition':
+            for item in event.get('B', []):
+                self.free[item['a']] = float(item['f'])
+                self.used[item['a']] = float(item['l'])
+            # Позиция аккаунта уже учитывает все ордера до этого события
+            self._commits = []
+            self.updated_at = time.monotonic()
+        elif event.get('e') == 'balanceUpdate':
+            self.free[event['a']] = self.free.get(event['a'], 0.0) + float(event['d'])
+            self.updated_at = time.monotonic()
+
+    async def reserve(self, asset, amount):
+        """Резервирует amount актива; None, если с учётом других резервов средств не хватает."""
+        await self.refresh()
+        if amount <= 0 or self.available(asset) < amount:
+            return None
+        reservation = Reservation(next(self._ids), asset, amount)
+        self._reservations[reservation.id] = reservation
+        return reservation
+
+    def commit(self, reservation):
+        """Ордер выставлен: резерв становится заблокированной суммой до следующего снимка."""
+        if self._reservations.pop(reservation.id, None) is not None:
+            self._commits.append((time.monotonic(), reservation.asset, reservation.amount))
+            self._move_to_used(reservation.asset, reservation.amount)
+
+    def release(self, reservation):
+        self._reservations.pop(reservation.id, None)
+
+    def _move_to_used(self, asset, amount):
+        self.free[asset] = max(0.0, self.free.get(asset, 0.0) - amount)
+        self.used[asset] = self.used.get(asset, 0.0) + amount
+
+    async def run_user_stream(self, url):
+        """Держит балансы актуальными по user-data stream; при его сбое работает REST."""
+        while True:
+            try:
+                listen_key = (await self.exchange.request('public_post_userdatastream'))['listenKey']
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(f"{url.rstrip('/')}/ws/{listen_key}", heartbeat=20) as ws:
+                        await self.refresh(force=True)
+                        self.stream_healthy = True
+                        logging.info("User-data stream подключён")
+                        keepalive = asyncio.ensure_future(self._keepalive(listen_key))
+                        try:
+                            async for msg in ws:
+                                if msg.type == aiohttp.WSMsgType.TEXT:
+                                    self.apply_event(json.loads(msg.data))
+                                elif msg.type in (aiohttp.WSMsgType.ERROR, aiohttp.WSMsgType.CLOSED):
+                                    break
+                        finally:
+                            keepalive.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка user-data stream: {str(e)}")
+            finally:
+                self.stream_healthy = False
+            await asyncio.sleep(STREAM_RECONNECT_DELAY)
+
+    async def _keepalive(self, listen_key):
+        while True:
+            await asyncio.sleep(LISTEN_KEY_KEEPALIVE)
+            try:
+                await self.exchange.request('public_put_userdatastream', {'listenKey': listen_key})
+            except Exception as e:
+                logging.error(f"Ошибка продления listenKey: {str(e)}")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# artifacts.py
+import os
+import json
+import time
+import itertools
+import pickle
+import shutil
+import logging
+from config import ARTIFACTS_DIR, MODEL_MAX_AGE, LOOKBACK, INFERENCE_BACKEND
+from data import FEATURES
+from inference import NumpyRNNModel
+
+ARTIFACT_FORMAT = 1
+
+
+class ModelArtifact:
+    """Обученная модель пары вместе со своим скейлером и метаданными обучения."""
+
+    def __init__(self, model, scaler, meta, path=None):
+        self.model = model
+        self.scaler = scaler
+        self.meta = meta
+        self.path = path
+
+    @property
+    def version(self):
+        return self.meta.get('version')
+
+
+def pair_dir(pair, root=ARTIFACTS_DIR):
+    return os.path.join(root, pair.replace('/', '_'))
+
+
+def save_artifact(pair, model, scaler, meta, root=ARTIFACTS_DIR, publish=True):
+    """Сохраняет Keras-модель, её NumPy-веса, скейлер и метаданные в новую версию.
+
+    Версия сначала пишется во временный каталог и публикуется переименованием,
+    поэтому load_latest_artifact никогда не увидит наполовину записанную версию.
+    При publish=False возвращается путь временного каталога, который затем
+    публикуется publish_artifact или удаляется discard_artifact.
+    """
+    version, tmp = _claim_version(pair, root)
+    try:
+        meta = dict(meta, pair=pair, version=version, format=ARTIFACT_FORMAT, lookback=LOOKBACK,
+                    features=list(FEATURES), created_at=time.time())
+        model.save(os.path.join(tmp, 'model.keras'))
+        NumpyRNNModel.from_keras(model).save(os.path.join(tmp, 'weights.npz'))
+        with open(os.path.join(tmp, 'scaler.pkl'), 'wb') as f:
+            pickle.dump(scaler, f)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    if not publish:
+        return tmp
+    return publish_artifact(tmp)
+
+
+def _claim_version(pair, root):
+    """Имя новой версии и её временный каталог, созданный эксклюзивно.
+
+    Имя — время с точностью до миллисекунды; если такая версия уже есть
+    (два сохранения в одну миллисекунду), добавляется суффикс -01, -02, ...
+    """
+    now = time.time()
+    base = time.strftime('%Y%m%d-%H%M%S', time.gmtime(now)) + f"-{int(now * 1000) % 1000:03d}"
+    for attempt in itertools.count():
+        version = base if not attempt else f"{base}-{attempt:02d}"
+        target = os.path.join(pair_dir(pair, root), version)
+        if os.path.exists(target):
+            continue
+        try:
+            os.makedirs(target + '.tmp')
+        except FileExistsError:
+            continue
+        return version, target + '.tmp'
+
+
+def publish_artifact(path):
+    target = path[:-len('.tmp')]
+    os.replace(path, target)
+    logging.info(f"Сохранён артефакт модели: {target}")
+    return target
+
+
+def discard_artifact(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def is_compatible(meta, max_age=MODEL_MAX_AGE):
+    if meta.get('format') != ARTIFACT_FORMAT:
+        return False, f"формат {meta.get('format')} != {ARTIFACT_FORMAT}"
+    if meta.get('lookback') != LOOKBACK:
+        return False, f"LOOKBACK {meta.get('lookback')} != {LOOKBACK}"
+    if meta.get('features') != list(FEATURES):
+        return False, "другой набор признаков"
+    if max_age is not None and time.time() - meta.get('created_at', 0) > max_age:
+        return False, "устарел"
+    return True, ""
+
+
+def load_artifact(path, backend=INFERENCE_BACKEND):
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    with open(os.path.join(path, 'scaler.pkl'), 'rb') as f:
+        scaler = pickle.load(f)
+    if backend == 'numpy':
+        model = NumpyRNNModel.load(os.path.join(path, 'weights.npz'))
+    elif backend == 'keras':
+        from tensorflow.keras.models import load_model  # TensorFlow нужен только этому бэкенду
+        model = load_model(os.path.join(path, 'model.keras'))
+    else:
+        raise ValueError(f"Неизвестный бэкенд инференса: {backend}")
+    return ModelArtifact(model, scaler, meta, path)
+
+
+def list_versions(pair, root=ARTIFACTS_DIR):
+    directory = pair_dir(pair, root)
+    if not os.path.isdir(directory):
+        return []
+    versions = [name for name in os.listdir(directory)
+                if not name.endswith('.tmp') and os.path.isfile(os.path.join(directory, name, 'meta.json'))]
+    return [os.path.join(directory, name) for name in sorted(versions, reverse=True)]
+
+
+def load_latest_artifact(pair, backend=INFERENCE_BACKEND, max_age=MODEL_MAX_AGE, root=ARTIFACTS_DIR):
+    """Самая свежая совместимая версия модели пары или None, если её нет или она устарела."""
+    for path in list_versions(pair, root):
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            compatible, reason = is_compatible(meta, max_age)
+            if not compatible:
+                logging.info(f"Артефакт {path} пропущен: {reason}")
+                # Более старые версии тем более устарели
+                if reason == "устарел":
+                    return None
+                continue
+            artifact = load_artifact(path, backend)
+            logging.info(f"Загружен артефакт модели {pair}: {path}")
+            return artifact
+        except Exception as e:
+            logging.error(f"Ошибка загрузки артефакта {path}: {str(e)}")
+    return None
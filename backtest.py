@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# backtest.py
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from config import TRADING_PAIRS, LOOKBACK, MAX_PREDICTION, BACKTEST_DATA_DIR, BACKTEST_SPREAD, \
+    BACKTEST_FEE, BACKTEST_BATCH, BACKTEST_WORKERS
+from data import OHLCV_COLUMNS, prepare_lstm_data
+from indicators import compute_features
+from strategy import MIN_ATR, MIN_SPREAD, BUY_THRESHOLD, SELL_THRESHOLD, balance_report, buy_signal, is_profitable, \
+    sell_signal
+
+DEFAULT_PARAMS = {
+    'buy_threshold': BUY_THRESHOLD,
+    'sell_threshold': SELL_THRESHOLD,
+    'max_prediction': MAX_PREDICTION,
+    'min_atr': MIN_ATR,
+    'min_spread': MIN_SPREAD,
+    'spread': BACKTEST_SPREAD,
+    'fee': BACKTEST_FEE,
+    'max_positions': 1,  # calculate_optimal_limit при нулевом балансе BingX всегда даёт 1
+}
+
+
+class PairHistory:
+    """История пары, подготовленная для бэктеста: свечи, ATR и предсказание модели на каждой свече.
+
+    Решение на свече i принимается по окну закрытых свечей i - LOOKBACK .. i - 1
+    (как prepare_inference_window в торговле) и ATR свечи i, цена — её close.
+    """
+
+    def __init__(self, pair, timestamp, close, high, low, atr, prediction):
+        self.pair = pair
+        self.timestamp = np.asarray(timestamp, dtype=np.int64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.atr = np.asarray(atr, dtype=np.float64)
+        self.prediction = np.asarray(prediction, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.close)
+
+
+def load_candles(pair, directory=BACKTEST_DATA_DIR):
+    path = os.path.join(directory, pair.replace('/', '_') + '.csv')
+    df = pd.read_csv(path)
+    return df[OHLCV_COLUMNS]
+
+
+def batch_predict(model, X, batch_size=BACKTEST_BATCH):
+    """Предсказания по всем окнам истории пачками по batch_size."""
+    predictions = np.empty(len(X), dtype=np.float64)
+    for start in range(0, len(X), batch_size):
+        predictions[start:start + batch_size] = model.predict(X[start:start + batch_size], verbose=0)[:, 0]
+    return predictions
+
+
+def prepare_history(pair, candles, model, scaler, batch_size=BACKTEST_BATCH):
+    """Признаки, окна и предсказания по всей истории пары за один проход.
+
+    Без scaler он подгоняется по всей истории, что заглядывает в будущее —
+    для сравнимых результатов нужен скейлер обученной модели.
+    """
+    df = candles[OHLCV_COLUMNS].copy()
+    if not np.issubdtype(df['timestamp'].dtype, np.integer):
+        df['timestamp'] = pd.to_datetime(df['timestamp']).astype('int64') // 10 ** 6
+    df = compute_features(df).reset_index(drop=True)
+    X, _, _ = prepare_lstm_data(df, scaler)
+    if not len(X):
+        raise ValueError(f"Недостаточно истории для {pair}: {len(df)} свечей после расчёта признаков")
+    # make_windows отбрасывает последнее окно, поэтому решение есть для свечей LOOKBACK .. n - 2
+    decided = df.iloc[LOOKBACK:LOOKBACK + len(X)]
+    return PairHistory(pair, decided['timestamp'], decided['close'], decided['high'], decided['low'],
+                       decided['ATR'], batch_predict(model, X, batch_size))
+
+
+def signals(history, params):
+    """Векторные сигналы пары: исполненные покупки и продажи, цены bid и ask.
+
+    Лимитный ордер ставится по bid (покупка) или ask (продажа) свечи i и
+    исполняется, если следующая свеча дошла до его цены; иначе его отменяет
+    сверка ордеров и баланс не меняется. Отбор и пороги — те же предикаты
+    is_profitable, buy_signal и sell_signal, что и в торговле.
+    """
+    spread = params['spread']
+    bid = history.close * (1 - spread / 2)
+    ask = history.close * (1 + spread / 2)
+    prediction = history.prediction
+    # Как в analyze_pair: спред относительно меньшей из цен
+    profitable = is_profitable(spread / (1 - spread / 2), history.atr, prediction, params['min_spread'],
+                               params['max_prediction'], params['min_atr'])
+    buy_fill = np.zeros(len(history), dtype=bool)
+    sell_fill = np.zeros(len(history), dtype=bool)
+    buy_fill[:-1] = history.low[1:] <= bid[:-1]
+    sell_fill[:-1] = history.high[1:] >= ask[:-1]
+    buy = profitable & buy_signal(prediction, params['buy_threshold']) & buy_fill
+    sell = profitable & sell_signal(prediction, params['sell_threshold']) & sell_fill
+    return buy, sell, bid, ask
+
+
+def run_backtest(histories, params=None, initial_total_usdt=1000.0, log=False):
+    """Прогон логики trade_pair по истории всех пар; возвращает отчёт balance_report и число сделок.
+
+    Векторно считаются только сигналы; последовательно, в порядке времени по
+    всем парам, обходятся лишь исполненные ордера, так как баланс и лимит
+    открытых позиций зависят от предыдущих сделок. Если на свече сработали
+    оба порога (buy_threshold < sell_threshold), как и в trade_pair сначала
+    исполняется покупка, затем продажа. Расхождения с торговлей: лимит
+    позиций max_positions вместо отбора по score и объём покупки за вычетом
+    комиссии (в торговле такую покупку отклонил бы резерв USDT).
+    """
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    fee_rate = params['fee']
+    balances = {history.pair: {
+        'base': 0.0,
+        'quote_binance': initial_total_usdt / len(histories),
+        'quote_bingx': 0.0,
+        'entry_price': 0.0,
+        'total_fees': 0.0,
+        'cost': 0.0,
+        'revenue': 0.0
+    } for history in histories}
+
+    events = []
+    prices = []
+    for index, history in enumerate(histories):
+        buy, sell, bid, ask = signals(history, params)
+        for side, mask in ((0, buy), (1, sell)):
+            candles = np.flatnonzero(mask)
+            events.append(np.column_stack([history.timestamp[candles], np.full(len(candles), index), candles,
+                                           np.full(len(candles), side)]))
+        prices.append((bid, ask))
+    events = np.concatenate(events) if events else np.empty((0, 4), dtype=np.int64)
+    # По времени, затем по паре; на одной свече покупка (0) раньше продажи (1)
+    events = events[np.lexsort((events[:, 3], events[:, 1], events[:, 0]))]
+
+    trades = 0
+    active = 0
+    for _, index, candle, is_sell in events.tolist():
+        history = histories[index]
+        balance = balances[history.pair]
+        bid, ask = prices[index]
+        if not is_sell:
+            if balance['quote_binance'] <= 0 or (balance['base'] <= 0 and active >= params['max_positions']):
+                continue
+            price = bid[candle]
+            # Объём с учётом комиссии, чтобы резерв USDT не превышал доступный баланс
+            amount = balance['quote_binance'] / (price * (1 + fee_rate))
+            cost = amount * price
+            fee = cost * fee_rate
+            if balance['base'] <= 0:
+                active += 1
+            balance['quote_binance'] -= cost + fee
+            balance['base'] += amount
+            balance['cost'] += cost
+            balance['total_fees'] += fee
+            balance['entry_price'] = price
+        else:
+            if balance['base'] <= 0:
+                continue
+            price = ask[candle]
+            amount = balance['base']
+            revenue = amount * price
+            fee = revenue * fee_rate
+            balance['quote_binance'] += revenue - fee
+            balance['base'] = 0.0
+            balance['revenue'] += revenue
+            balance['total_fees'] += fee
+            balance['entry_price'] = 0
+            active -= 1
+        trades += 1
+
+    # Остатки продаются по последнему ask, как в finalize_report
+    for index, history in enumerate(histories):
+        balance = balances[history.pair]
+        if balance['base'] > 0:
+            balance['revenue'] += balance['base'] * prices[index][1][-1]
+            balance['base'] = 0
+    report = balance_report(balances, initial_total_usdt, log=log)
+    report['trades'] = trades
+    report['candles'] = sum(len(history) for history in histories)
+    return report
+
+
+_worker_histories = None
+
+
+def _init_worker(histories):
+    global _worker_histories
+    _worker_histories = histories
+
+
+def _run_params(params):
+    return params, run_backtest(_worker_histories, params)
+
+
+def parameter_grid(grid):
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def sweep(histories, grid, workers=BACKTEST_WORKERS, initial_total_usdt=1000.0):
+    """Перебор параметров решения по сетке grid ({параметр: [значения]}).
+
+    Признаки и предсказания не зависят от порогов, поэтому считаются один раз;
+    процессы получают историю при старте и прогоняют свою часть сетки.
+    Результат — [(params, отчёт)] по убыванию прибыли.
+    """
+    combos = parameter_grid(grid)
+    if workers <= 1 or len(combos) == 1:
+        results = [(params, run_backtest(histories, params, initial_total_usdt)) for params in combos]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(combos)), mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(histories,)) as pool:
+            chunksize = max(1, len(combos) // (workers * 4))
+            results = list(pool.map(_run_params, combos, chunksize=chunksize))
+    results.sort(key=lambda item: item[1]['profit_loss'], reverse=True)
+    return results
+
+
+def parse_grid(items):
+    grid = {}
+    for item in items:
+        key, _, values = item.partition('=')
+        if key not in DEFAULT_PARAMS:
+            raise ValueError(f"Неизвестный параметр бэктеста: {key}")
+        grid[key] = [type(DEFAULT_PARAMS[key])(value) for value in values.split(',')]
+    return grid
+
+
+def main():
+    from artifacts import load_latest_artifact
+
+    parser = argparse.ArgumentParser(description="Бэктест стратегии по сохранённым свечам")
+    parser.add_argument('--data', default=BACKTEST_DATA_DIR)
+    parser.add_argument('--pairs', nargs='+', default=TRADING_PAIRS)
+    parser.add_argument('--grid', nargs='*', default=[], help="параметр=значение1,значение2 ...")
+    parser.add_argument('--workers', type=int, default=BACKTEST_WORKERS)
+    parser.add_argument('--balance', type=float, default=1000.0)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    histories = []
+    for pair in args.pairs:
+        # Для бэктеста возраст модели не важен
+        artifact = load_latest_artifact(pair, max_age=None)
+        if artifact is None:
+            logging.error(f"Нет модели для {pair}, пара пропущена")
+            continue
+        histories.append(prepare_history(pair, load_candles(pair, args.data), artifact.model, artifact.scaler))
+    if not histories:
+        return
+
+    if args.grid:
+        for params, report in sweep(histories, parse_grid(args.grid), args.workers, args.balance)[:args.top]:
+            print(json.dumps({'params': params, **report}, ensure_ascii=False))
+    else:
+        report = run_backtest(histories, initial_total_usdt=args.balance, log=True)
+        logging.info(f"Сделок: {report['trades']}, свечей: {report['candles']}")
+
+
+if __name__ == "__main__":
+    main()
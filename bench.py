@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# bench.py
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from config import LOOKBACK, BENCH_REPEAT, BENCH_THRESHOLD
+from data import FEATURES, get_historical_data, add_features, update_features, prepare_lstm_data, \
+    ohlcv_cache, feature_engines
+from indicators import compute_features
+from inference import BatchPredictor, NumpyRNNModel
+from price_calculator import get_best_price_and_amount
+
+# Сетки масштабирования: полная и быстрая (--quick)
+GRID = {
+    'get_historical_data': {'history': [LOOKBACK + 100, 1000]},
+    'add_features': {'history': [500, 2000, 10000]},
+    'update_features': {'history': [LOOKBACK + 100, 1000]},
+    'prepare_lstm_data': {'history': [500, 2000, 10000]},
+    'predict': {'batch': [1, 16, 64, 256]},
+    'get_best_price_and_amount': {'levels': [20, 100, 1000]},
+    'cycle': {'pairs': [1, 10, 50]},
+    'decision': {'pairs': [1, 10, 50]},
+    'loop_lag': {'pairs': [1, 8]},
+}
+QUICK_GRID = {
+    'get_historical_data': {'history': [LOOKBACK + 100]},
+    'add_features': {'history': [500]},
+    'update_features': {'history': [LOOKBACK + 100]},
+    'prepare_lstm_data': {'history': [500]},
+    'predict': {'batch': [1, 64]},
+    'get_best_price_and_amount': {'levels': [20]},
+    'cycle': {'pairs': [2]},
+    'decision': {'pairs': [2]},
+    'loop_lag': {'pairs': [2]},
+}
+
+
+def synthetic_candles(rows, seed=0, start_ms=1_700_000_000_000):
+    """Случайное блуждание цены с фиксированным seed: одинаковые данные при каждом запуске."""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, rows)))
+    spread = np.abs(rng.normal(0, 0.001, rows))
+    return pd.DataFrame({
+        'timestamp': start_ms + np.arange(rows, dtype=np.int64) * 60_000,
+        'open': np.r_[close[0], close[:-1]],
+        'high': close * (1 + spread),
+        'low': close * (1 - spread),
+        'close': close,
+        'volume': rng.random(rows) * 100 + 1,
+    })
+
+
+def synthetic_order_book(levels, seed=0, mid=100.0):
+    rng = np.random.default_rng(seed)
+    steps = np.cumsum(rng.random(levels) * 0.01 + 0.001)
+    return {'bids': np.column_stack([mid - steps, rng.random(levels) * 5]).tolist(),
+            'asks': np.column_stack([mid + steps, rng.random(levels) * 5]).tolist()}
+
+
+def synthetic_model(units=50, features=len(FEATURES), seed=0):
+    """Модель формы build_lstm_model (два LSTM по units и Dense) со случайными весами."""
+    rng = np.random.default_rng(seed)
+    recurrent = []
+    for inputs in (features, units):
+        recurrent.append((rng.normal(0, 0.1, (inputs, 4 * units)), rng.normal(0, 0.1, (units, 4 * units)),
+                          np.zeros(4 * units)))
+    return NumpyRNNModel('lstm', recurrent, (rng.normal(0, 0.1, (units, 1)), np.zeros(1)))
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else None
+
+
+async def measure(run, repeat, units=1, setup=None, warmup=1, profile=None):
+    """Задержки вызова run (обычного или корутины) и пик памяти отдельного прогона под tracemalloc.
+
+    setup вызывается перед каждым вызовом вне замера; units — сколько единиц
+    работы (свечей, окон, пар) делает один вызов, для расчёта пропускной способности.
+    tracemalloc видит только этот процесс: если run отдаёт работу в пул
+    процессов, память меряется на profile — той же работе в процессе, а при
+    profile=False не меряется вовсе (peak_mb=None).
+    """
+    async def call(func=run):
+        result = func()
+        if inspect.isawaitable(result):
+            await result
+
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        await call()
+    latencies = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - start)
+
+    peak = None
+    if profile is not False:
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            await call(profile or run)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    total = sum(latencies)
+    return {
+        'repeat': repeat,
+        'mean_ms': total / repeat * 1000,
+        'p50_ms': percentile(latencies, 50),
+        'p90_ms': percentile(latencies, 90),
+        'p99_ms': percentile(latencies, 99),
+        'throughput': units * repeat / total if total else None,
+        'peak_mb': peak / 2 ** 20 if peak is not None else None,
+    }
+
+
+def sim_setup(pairs, history):
+    from rate_limiter import RequestScheduler
+    from sim_exchange import SimulatedVenue, sim_exchange
+    candles = {pair: synthetic_candles(history + 1000, seed=i) for i, pair in enumerate(pairs)}
+    venue = SimulatedVenue(candles, balance={'USDT': 1e9}, latency=0.0, jitter=0.0, weight_limit=10 ** 12,
+                           history=history, seed=0)
+    exchange = sim_exchange(venue)
+    # Бенчмарк меряет код бота, а не ожидание бюджета запросов
+    exchange.scheduler = RequestScheduler(capacity=10 ** 12)
+    return venue, exchange
+
+
+def bench_pairs(count):
+    return [f"P{i:03d}/USDT" for i in range(count)]
+
+
+async def bench_get_historical_data(history, repeat):
+    venue, exchange = sim_setup(bench_pairs(1), history)
+    pair = venue.symbols[0]
+    await get_historical_data(exchange, pair, limit=history)
+    # Тёплый кэш: на каждой итерации появляется одна новая свеча
+    result = await measure(lambda: get_historical_data(exchange, pair, limit=history), repeat, units=1,
+                           setup=venue.step)
+    ohlcv_cache.clear()
+    return result
+
+
+async def bench_add_features(history, repeat):
+    df = synthetic_candles(history)
+    # add_features считает в пуле процессов, поэтому память меряется на compute_features здесь
+    return await measure(lambda: add_features(df.copy()), repeat, units=history,
+                         profile=lambda: compute_features(df.copy()))
+
+
+async def bench_update_features(history, repeat):
+    candles = synthetic_candles(history + repeat + 3)
+    feature_engines.clear()
+    position = [0]
+
+    def advance():
+        position[0] += 1
+
+    await update_features('BENCH/USDT', candles.iloc[:history])
+    result = await measure(lambda: update_features('BENCH/USDT', candles.iloc[position[0]:position[0] + history]),
+                           repeat, units=1, setup=advance)
+    feature_engines.clear()
+    return result
+
+
+async def bench_prepare_lstm_data(history, repeat):
+    features = compute_features(synthetic_candles(history))
+    _, _, scaler = prepare_lstm_data(features)
+    return await measure(lambda: prepare_lstm_data(features, scaler), repeat, units=len(features) - LOOKBACK)
+
+
+async def bench_predict(batch, repeat):
+    model = synthetic_model()
+    X = np.random.default_rng(0).random((batch, LOOKBACK, len(FEATURES))).astype(np.float32)
+    return await measure(lambda: model.predict(X, verbose=0), repeat, units=batch)
+
+
+async def bench_get_best_price_and_amount(levels, repeat):
+    book = synthetic_order_book(levels)
+    balances = {'BENCH/USDT': {'quote_binance': 1000.0, 'quote_bingx': 0.0}}
+    return await measure(lambda: get_best_price_and_amount(None, 'BENCH/USDT', book, 'buy', 3.0, balances, 0.1,
+                                                           None, None, 'binance'), repeat)
+
+
+def trading_setup(pairs):
+    """Симулятор, предиктор, аккаунт и балансы для бенчмарков торгового цикла."""
+    from account import AccountState
+
+    venue, exchange = sim_setup(pairs, LOOKBACK + 200)
+    features = compute_features(synthetic_candles(LOOKBACK + 200))
+    _, _, scaler = prepare_lstm_data(features)
+    model = synthetic_model()
+    predictor = BatchPredictor({pair: (model, scaler) for pair in pairs})
+    balances = {pair: {'base': 0.0, 'quote_binance': 1000.0, 'quote_bingx': 0.0, 'entry_price': 0.0,
+                       'total_fees': 0.0, 'cost': 0.0, 'revenue': 0.0} for pair in pairs}
+    return venue, {'binance': exchange, 'bingx': exchange}, predictor, AccountState(exchange), balances
+
+
+async def bench_cycle(pairs, repeat):
+    """Части цикла без окна пакета: select_profitable_pairs и trade_pair по всем парам на симуляторе."""
+    from strategy import select_profitable_pairs, trade_pair
+
+    pairs = bench_pairs(pairs)
+    venue, exchanges, predictor, account, balances = trading_setup(pairs)
+
+    async def cycle():
+        selected = await select_profitable_pairs(exchanges, None, predictor, balances, pairs)
+        predictions = {pair: prediction for pair, prediction, _, _ in selected}
+        # Торгуют все пары, чтобы нагрузка не зависела от результата отбора
+        await asyncio.gather(*(trade_pair(exchanges, pair, predictions.get(pair, 0.5), balances, reason='bench',
+                                          account=account) for pair in pairs))
+
+    result = await measure(cycle, repeat, units=len(pairs), setup=venue.step)
+    ohlcv_cache.clear()
+    feature_engines.clear()
+    return result
+
+
+async def bench_decision(pairs, repeat):
+    """Путь, который запускает планировщик на закрытии свечи: evaluate_pair всех пар через PairScanner.
+
+    Пары срабатывают одновременно и собираются в один пакет, поэтому в
+    задержку входит и окно PAIR_BATCH_WINDOW.
+    """
+    from strategy import PairScanner, evaluate_pair
+
+    pairs = bench_pairs(pairs)
+    venue, exchanges, predictor, account, balances = trading_setup(pairs)
+    scanner = PairScanner(exchanges, predictor, balances)
+
+    async def decision():
+        await asyncio.gather(*(evaluate_pair(exchanges, pair, scanner, balances, account, 'candle')
+                               for pair in pairs))
+
+    result = await measure(decision, repeat, units=len(pairs), setup=venue.step)
+    ohlcv_cache.clear()
+    feature_engines.clear()
+    return result
+
+
+async def bench_loop_lag(pairs, repeat):
+    """Задержка цикла событий, пока идёт расчёт признаков: update_features по pairs парам и пакетный add_features.
+
+    Кроме задержек самого цикла расчёта отчёт содержит lag_p99_ms и
+    lag_max_ms — насколько опаздывала задача, просыпающаяся каждую миллисекунду.
+    По нему проверяется, что IndicatorEngine.sync на новую свечу можно
+    вызывать в цикле событий, а compute_features в процессе его не держит.
+    """
+    history = LOOKBACK + 100
+    candles = synthetic_candles(history + repeat + 3)
+    names = bench_pairs(pairs)
+    feature_engines.clear()
+    for pair in names:
+        await update_features(pair, candles.iloc[:history])
+    position = [0]
+    lags = []
+    running = [True]
+
+    async def monitor():
+        loop = asyncio.get_running_loop()
+        while running[0]:
+            start = loop.time()
+            await asyncio.sleep(0.001)
+            lags.append(max(0.0, loop.time() - start - 0.001))
+
+    async def cycle():
+        position[0] += 1
+        window = candles.iloc[position[0]:position[0] + history]
+        await asyncio.gather(*(update_features(pair, window) for pair in names), add_features(window.copy()))
+
+    task = asyncio.create_task(monitor())
+    try:
+        # Память пакетного add_features в пуле процессов отсюда не видна
+        result = await measure(cycle, repeat, units=pairs, profile=False)
+    finally:
+        running[0] = False
+        await task
+        feature_engines.clear()
+    return dict(result, lag_p99_ms=percentile(lags, 99), lag_max_ms=max(lags) * 1000)
+
+
+BENCHMARKS = {
+    'get_historical_data': bench_get_historical_data,
+    'add_features': bench_add_features,
+    'update_features': bench_update_features,
+    'prepare_lstm_data': bench_prepare_lstm_data,
+    'predict': bench_predict,
+    'get_best_price_and_amount': bench_get_best_price_and_amount,
+    'cycle': bench_cycle,
+    'decision': bench_decision,
+    'loop_lag': bench_loop_lag,
+}
+
+
+def case_key(name, params):
+    return f"{name}[{','.join(f'{key}={value}' for key, value in params.items())}]"
+
+
+async def run_suite(quick=False, only=None, repeat=BENCH_REPEAT):
+    grid = QUICK_GRID if quick else GRID
+    results = {}
+    for name, axes in grid.items():
+        if only and name not in only:
+            continue
+        for param, values in axes.items():
+            for value in values:
+                key = case_key(name, {param: value})
+                logging.info(f"Бенчмарк {key}")
+                result = await BENCHMARKS[name](value, repeat)
+                results[key] = dict(result, name=name, params={param: value})
+    return {'meta': environment(quick, repeat), 'results': results}
+
+
+def environment(quick, repeat):
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'quick': quick,
+        'repeat': repeat,
+    }
+
+
+def save(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(report, baseline, threshold=BENCH_THRESHOLD, metric='p50_ms'):
+    """Сравнение с базовым прогоном по metric: [(ключ, база, сейчас, отношение, регрессия)]."""
+    rows = []
+    for key, result in report['results'].items():
+        base = baseline['results'].get(key)
+        if base is None or not base.get(metric) or result.get(metric) is None:
+            continue
+        ratio = result[metric] / base[metric]
+        rows.append((key, base[metric], result[metric], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки горячих путей бота на синтетических данных")
+    parser.add_argument('--out', default='bench.json', help="куда сохранить результаты (JSON)")
+    parser.add_argument('--baseline', help="JSON прошлого прогона для сравнения")
+    parser.add_argument('--threshold', type=float, default=BENCH_THRESHOLD,
+                        help="допустимый рост p50 относительно базы (доля)")
+    parser.add_argument('--quick', action='store_true', help="уменьшенная сетка для быстрой проверки")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=BENCH_REPEAT)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Логи самих функций бота не должны попадать в замеры
+    logging.getLogger().handlers[0].addFilter(lambda record: record.module == 'bench')
+
+    from executor import compute
+    try:
+        report = asyncio.run(run_suite(args.quick, args.only, args.repeat))
+    finally:
+        compute.close()
+    save(report, args.out)
+    for key, result in report['results'].items():
+        print(f"{key:45s} p50 {result['p50_ms']:9.3f} мс  p99 {result['p99_ms']:9.3f} мс  "
+              f"{result['throughput']:12.1f}/с  пик " +
+              (f"{result['peak_mb']:8.2f} МБ" if result['peak_mb'] is not None else "       —"))
+
+    if args.baseline:
+        regressions = 0
+        for key, base, current, ratio, regression in compare(report, load(args.baseline), args.threshold):
+            regressions += regression
+            print(f"{key:45s} {base:9.3f} -> {current:9.3f} мс ({ratio:5.2f}x){'  РЕГРЕССИЯ' if regression else ''}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
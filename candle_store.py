@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# candle_store.py
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+from config import LOOKBACK, CANDLE_STORE_DIR, CANDLE_STORE_PAGE, CANDLE_STORE_CHUNK, FEATURE_WARMUP, \
+    TRAINING_HISTORY_DAYS, TRAINING_BATCH_SIZE
+from data import FEATURES, OHLCV_COLUMNS, make_windows, timeframe_to_ms
+from indicators import compute_features
+
+COLUMN_DTYPES = {column: np.dtype(np.int64 if column == 'timestamp' else np.float64) for column in OHLCV_COLUMNS}
+
+
+class CandleSeries:
+    """Свечи одной пары и таймфрейма, открытые через memory map только для чтения.
+
+    Столбцы — отдельные файлы, поэтому чтение close или volume не трогает
+    страницы остальных столбцов. Снимок фиксирован на момент открытия: после
+    дозаписи нужен новый series().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = {}
+        length = min((_rows(path, column) for column in OHLCV_COLUMNS), default=0)
+        for column, dtype in COLUMN_DTYPES.items():
+            if length:
+                self.columns[column] = np.memmap(os.path.join(path, column + '.bin'), dtype=dtype, mode='r',
+                                                 shape=(length,))
+            else:
+                self.columns[column] = np.empty(0, dtype=dtype)
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def timestamps(self):
+        return self.columns['timestamp']
+
+    @property
+    def first_timestamp(self):
+        return int(self.timestamps[0]) if self.length else None
+
+    @property
+    def last_timestamp(self):
+        return int(self.timestamps[-1]) if self.length else None
+
+    def index_of(self, timestamp):
+        """Индекс первой свечи не раньше timestamp (мс)."""
+        return int(np.searchsorted(self.timestamps, timestamp, side='left'))
+
+    def frame(self, start=0, stop=None):
+        """Копия свечей [start, stop) как DataFrame в формате get_historical_data без разбора времени."""
+        return pd.DataFrame({column: np.array(values[start:stop]) for column, values in self.columns.items()})
+
+
+def _rows(path, column):
+    try:
+        return os.path.getsize(os.path.join(path, column + '.bin')) // COLUMN_DTYPES[column].itemsize
+    except FileNotFoundError:
+        return 0
+
+
+class CandleStore:
+    """Локальная история свечей: каталог на пару и таймфрейм, в нём по файлу на столбец.
+
+    Файлы только дописываются. Если запись оборвалась посередине, при
+    следующей дозаписи все столбцы обрезаются до числа полных строк.
+    """
+
+    def __init__(self, root=CANDLE_STORE_DIR):
+        self.root = root
+
+    def path(self, symbol, timeframe):
+        return os.path.join(self.root, symbol.replace('/', '_'), timeframe)
+
+    def series(self, symbol, timeframe='1m'):
+        return CandleSeries(self.path(symbol, timeframe))
+
+    def _repair(self, path):
+        rows = min(_rows(path, column) for column in OHLCV_COLUMNS)
+        for column, dtype in COLUMN_DTYPES.items():
+            file_path = os.path.join(path, column + '.bin')
+            if os.path.exists(file_path) and os.path.getsize(file_path) != rows * dtype.itemsize:
+                logging.warning(f"Хранилище свечей {path}: {column} обрезан до {rows} строк")
+                os.truncate(file_path, rows * dtype.itemsize)
+        return rows
+
+    def append(self, symbol, timeframe, candles):
+        """Дописывает свечи [[timestamp, o, h, l, c, v], ...] новее последней сохранённой; возвращает их число."""
+        path = self.path(symbol, timeframe)
+        os.makedirs(path, exist_ok=True)
+        rows = self._repair(path)
+        candles = np.asarray(candles, dtype=np.float64).reshape(-1, len(OHLCV_COLUMNS))
+        if not len(candles):
+            return 0
+        timestamps = candles[:, 0].astype(np.int64)
+        last = None
+        if rows:
+            last = int(np.memmap(os.path.join(path, 'timestamp.bin'), dtype=np.int64, mode='r', shape=(rows,))[-1])
+        # Только строго возрастающие и новые свечи: повтор страницы при возобновлении не дублирует строки
+        _, unique = np.unique(timestamps, return_index=True)
+        keep = unique[timestamps[unique] > last] if last is not None else unique
+        if not len(keep):
+            return 0
+        for index, (column, dtype) in enumerate(COLUMN_DTYPES.items()):
+            values = timestamps[keep] if column == 'timestamp' else candles[keep, index]
+            with open(os.path.join(path, column + '.bin'), 'ab') as f:
+                f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        return len(keep)
+
+    async def backfill(self, exchange, symbol, timeframe='1m', since=None, page=CANDLE_STORE_PAGE):
+        """Догружает закрытые свечи постранично с fetch_ohlcv, начиная с последней сохранённой.
+
+        Пустое хранилище заполняется с since (мс), по умолчанию за
+        TRAINING_HISTORY_DAYS дней. Прерванная загрузка продолжается с места
+        остановки. Возвращает число дописанных свечей.
+        """
+        step = timeframe_to_ms(timeframe)
+        last = self.series(symbol, timeframe).last_timestamp
+        if last is not None:
+            since = last + step
+        elif since is None:
+            since = int(time.time() * 1000) - TRAINING_HISTORY_DAYS * 86_400_000
+        added = 0
+        while True:
+            now_ms = int(time.time() * 1000)
+            if since + step > now_ms:
+                break
+            candles = await exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=page)
+            # Последняя свеча ещё формируется и в хранилище не попадает
+            closed = [candle for candle in candles if candle[0] >= since and candle[0] + step <= now_ms]
+            if not closed:
+                break
+            added += self.append(symbol, timeframe, closed)
+            since = int(closed[-1][0]) + step
+            logging.debug("Хранилище свечей %s %s: догружено %d", symbol, timeframe, added)
+        if added:
+            logging.info(f"Хранилище свечей {symbol} {timeframe}: догружено {added} свечей")
+        return added
+
+
+class TrainingWindows:
+    """Окна (X, y) для обучения по истории из хранилища, без загрузки всей истории в память.
+
+    Свечи читаются частями по chunk. Признаки каждой части считаются с запасом
+    FEATURE_WARMUP свечей до её начала (скользящие средние и EMA успевают
+    сойтись) и с перекрытием LOOKBACK, поэтому окна на границах частей
+    совпадают с prepare_lstm_data по всей истории. Память зависит от chunk и
+    batch_size, а не от длины истории. Объект сериализуется без открытых
+    memory map и пригоден для передачи в процесс обучения.
+    """
+
+    def __init__(self, store, symbol, timeframe='1m', start=None, stop=None, scaler=None, chunk=CANDLE_STORE_CHUNK,
+                 warmup=FEATURE_WARMUP):
+        self.store = store
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.start = start
+        self.stop = stop
+        self.scaler = scaler
+        self.chunk = chunk
+        self.warmup = warmup
+
+    def series(self):
+        return self.store.series(self.symbol, self.timeframe)
+
+    def _bounds(self, series):
+        start = series.index_of(self.start) if self.start is not None else 0
+        stop = series.index_of(self.stop) if self.stop is not None else len(series)
+        return start, stop
+
+    def feature_chunks(self):
+        """Признаки по частям; первые LOOKBACK строк каждой части, кроме первой, — перекрытие с предыдущей."""
+        series = self.series()
+        start, stop = self._bounds(series)
+        position = start
+        while position < stop:
+            end = min(stop, position + self.chunk)
+            low = max(start, position - self.warmup - LOOKBACK) if position > start else start
+            features = compute_features(series.frame(low, end))
+            if position > start:
+                features = features[features['timestamp'] >= series.timestamps[position - LOOKBACK]]
+            yield features.reset_index(drop=True)
+            position = end
+
+    def fit_scaler(self):
+        """MinMaxScaler по признакам всей истории за один проход (partial_fit по частям)."""
+        scaler = MinMaxScaler()
+        for features in self.feature_chunks():
+            if len(features):
+                scaler.partial_fit(features[FEATURES])
+        self.scaler = scaler
+        return scaler
+
+    def windows(self):
+        """(X, y) каждой части: X — представления без копирования над масштабированными признаками части."""
+        if self.scaler is None:
+            self.fit_scaler()
+        for features in self.feature_chunks():
+            if len(features) <= LOOKBACK:
+                continue
+            scaled = (features[FEATURES].to_numpy(dtype=np.float64) * self.scaler.scale_ +
+                      self.scaler.min_).astype(np.float32)
+            yield make_windows(scaled, features['close'].to_numpy())
+
+    def batches(self, batch_size=TRAINING_BATCH_SIZE, shuffle=True, seed=None):
+        """Пачки (X, y); при shuffle окна перемешиваются в пределах части."""
+        rng = np.random.default_rng(seed)
+        for X, y in self.windows():
+            order = rng.permutation(len(X)) if shuffle else np.arange(len(X))
+            for i in range(0, len(order), batch_size):
+                index = order[i:i + batch_size]
+                yield X[index], y[index]
+
+    def time_range(self):
+        series = self.series()
+        start, stop = self._bounds(series)
+        if stop <= start:
+            return None, None
+        return (pd.to_datetime(int(series.timestamps[start]), unit='ms'),
+                pd.to_datetime(int(series.timestamps[stop - 1]), unit='ms'))
+
+
+async def training_windows(exchange, store, pair, timeframe='1m', days=TRAINING_HISTORY_DAYS):
+    """Догружает историю пары в хранилище и готовит по ней окна обучения со скейлером."""
+    start = int(time.time() * 1000) - days * 86_400_000
+    await store.backfill(exchange, pair, timeframe, since=start)
+    windows = TrainingWindows(store, pair, timeframe, start=start)
+    first, last = windows._bounds(windows.series())
+    # compute_features отбрасывает первые 49 строк, ещё LOOKBACK уходит на первое окно
+    if last - first <= LOOKBACK + 50:
+        logging.error(f"Недостаточно истории в хранилище для {pair}: {last - first} свечей")
+        return None
+    windows.fit_scaler()
+    return windows
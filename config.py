@@ -7,18 +7,84 @@ load_dotenv()
 
 MODE = "test"
 
-CACHE_TIMEOUT = 60
+CACHE_TIMEOUT = 60  # Максимальный возраст тикера в снимке рынка (сек)
+TICKER_MAX_AGE = 5  # Допустимый возраст тикера для торговых решений (сек)
+ACCOUNT_MAX_AGE = 5  # Возраст снимка баланса, после которого он запрашивается заново (сек)
 BASE_PRICE_ADJUSTMENT = 0.002
-DEPTH_LEVELS = 5
+DEPTH_LEVELS = 5  # Уровней стакана для расчёта цены и объёма ордера
+MAX_SLIPPAGE = 0.001  # Допустимое отклонение VWAP исполнения от лучшей цены
 BASE_MAX_POSITION_SIZE = 0.2
 INITIAL_MAX_OPEN_ORDERS = 2
 LOOKBACK = 120
+OHLCV_CACHE_SIZE = 1000  # Размер кольцевого буфера свечей на пару и таймфрейм
+OHLCV_MAX_AGE = 10  # Свечи, обновлённые не раньше (сек), отдаются из памяти до закрытия текущей свечи
 INITIAL_TOTAL_USDT = 228.0
 MIN_ORDER_SIZE = 10.0
 MIN_SELL_SIZE = 0.1  # Увеличенный порог для продажи остатков
 MAX_PREDICTION = 0.25
 MAX_PROB = 0.25  # Снижено с 0.3 до 0.25 для охвата всех пар
 TRADE_FRACTION = 0.3
+INFERENCE_BACKEND = "numpy"  # numpy — прямой проход без TensorFlow, keras — model.predict
+ARTIFACTS_DIR = "models"  # Каталог сохранённых моделей и скейлеров
+MODEL_MAX_AGE = 24 * 3600  # Возраст артефакта (сек), после которого модель переобучается
+TRAINING_MODE = "per_pair"  # per_pair — модель на каждую пару, pooled — одна модель на все пары
+TRAINING_WORKERS = max(1, (os.cpu_count() or 2) // 2)  # Процессов в пуле обучения
+TRAINING_THREADS_PER_JOB = 2  # Потоков TensorFlow на одну задачу обучения
+TRAINING_EPOCHS = 10
+TRAINING_BATCH_SIZE = 32
+TRAINING_HISTORY_DAYS = 90  # Глубина истории для обучения из хранилища свечей (дней)
+CANDLE_STORE_ENABLED = False  # Обучение на истории из локального хранилища вместо LOOKBACK + 100 свечей
+CANDLE_STORE_DIR = "candles"  # Каталог хранилища свечей
+CANDLE_STORE_PAGE = 1000  # Свечей в одном запросе fetch_ohlcv при догрузке
+CANDLE_STORE_CHUNK = 50000  # Свечей в одной части при потоковой подготовке окон
+FEATURE_WARMUP = 500  # Свечей разгона индикаторов перед каждой частью
+RETRAIN_INTERVAL = 3600  # Период фонового переобучения (сек), 0 — отключено
+RETRAIN_HISTORY = 1000  # Свечей для переобучения
+RETRAIN_HOLDOUT = 0.2  # Доля последних окон для сравнения новой и текущей модели
+RETRAIN_MIN_GAIN = 0.0  # Насколько новая модель должна быть точнее текущей
+RETRAIN_WORKERS = 1
+COMPUTE_THREADS = 4  # Потоков для признаков и инференса вне цикла событий
+COMPUTE_PROCESSES = os.cpu_count() or 1  # Процессов для пакетного расчёта признаков
+LOOP_LAG_WARNING = 0.005  # Задержка цикла событий (сек), выше которой отчёт пишется как предупреждение
+COMPUTE_STATS_INTERVAL = 60  # Период отчёта о задержке цикла и времени задач (сек)
+STREAM_ENABLED = False  # Рыночные данные из websocket; при нездоровом потоке — REST
+STREAM_URL = "wss://stream.binance.com:9443"
+STREAM_TESTNET_URL = "wss://testnet.binance.vision"
+STREAM_DEPTH_LIMIT = 1000  # Глубина REST-снимка для локального стакана
+STREAM_KLINE_HISTORY = 1000  # Минутных свечей в памяти потока
+STREAM_STALE_AFTER = 10  # Поток считается нездоровым без сообщений дольше (сек)
+STREAM_RECONNECT_DELAY = 1  # Пауза перед переподключением и повтором снимка (сек)
+RATE_LIMIT_WEIGHT = 4800  # Бюджет веса запросов за окно (лимит Binance 6000/мин с запасом)
+RATE_LIMIT_WINDOW = 60  # Окно восполнения бюджета (сек)
+RATE_LIMIT_RETRIES = 3  # Повторов запроса при временных ошибках
+RATE_LIMIT_BACKOFF = 0.5  # Начальная пауза перед повтором (сек), удваивается с каждой попыткой
+RATE_LIMIT_BACKOFF_MAX = 10  # Максимальная пауза перед повтором (сек)
+BACKTEST_DATA_DIR = "history"  # Каталог CSV со свечами для бэктеста (<BASE>_<QUOTE>.csv)
+BACKTEST_SPREAD = 0.0002  # Спред bid/ask вокруг close в бэктесте (доля цены)
+BACKTEST_FEE = 0.001  # Комиссия за сделку в бэктесте
+BACKTEST_BATCH = 4096  # Окон в одном вызове predict при расчёте предсказаний по истории
+BACKTEST_WORKERS = os.cpu_count() or 1  # Процессов для перебора параметров
+SIM_BALANCE = {'USDT': 10000.0}  # Начальный баланс симулятора
+SIM_FEE = 0.001  # Комиссия симулятора
+SIM_SPREAD = 0.0002  # Спред и шаг уровней маркет-мейкера симулятора (доля цены)
+SIM_DEPTH_LEVELS = 20  # Уровней маркет-мейкера на каждой стороне
+SIM_DEPTH_FRACTION = 0.1  # Доля объёма свечи, выставленная маркет-мейкером на сторону
+SIM_PARTICIPATION = 0.1  # Доля объёма свечи, которой могут исполниться заявки бота за шаг
+SIM_LATENCY = 0.02  # Средняя задержка ответа симулятора (сек)
+SIM_JITTER = 0.005  # Разброс задержки (сек)
+SIM_WEIGHT_LIMIT = 6000  # Лимит веса запросов в минуту, как у Binance
+SIM_HISTORY = 1000  # Свечей истории, доступной до начала воспроизведения
+BENCH_REPEAT = 20  # Замеров на каждый случай бенчмарка
+BENCH_THRESHOLD = 0.2  # Рост p50 относительно базового прогона, считающийся регрессией
+METRICS_ENABLED = False  # Гистограммы задержек и счётчики; выключенные почти ничего не стоят
+METRICS_HOST = '127.0.0.1'  # Эндпоинт /metrics слушает только локальный интерфейс
+METRICS_PORT = 9108
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # Границы корзин (сек)
+JOURNAL_ENABLED = True  # Журнал балансов и ордеров для восстановления после падения
+JOURNAL_DIR = 'journal'
+JOURNAL_FLUSH_INTERVAL = 0.05  # Период пакетной записи с fsync (сек): столько событий можно потерять при падении
+JOURNAL_SNAPSHOT_EVERY = 1000  # Событий между снимками состояния; ограничивает время восстановления
+JOURNAL_RECONCILE_INTERVAL = 600  # Период сверки ордеров журнала с биржей (сек)
 
 BINANCE_API_KEY = os.getenv('BINANCE_API_KEY')
 BINANCE_SECRET = os.getenv('BINANCE_SECRET')
@@ -26,9 +92,29 @@ BINGX_API_KEY = os.getenv('BINGX_API_KEY')
 BINGX_SECRET_KEY = os.getenv('BINGX_SECRET')
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+TELEGRAM_API_URL = "https://api.telegram.org"
+LOG_FILE = 'trading_bot.log'
+LOG_LEVEL = 'INFO'
+LOG_LEVELS = {'ccxt': 'WARNING', 'aiohttp': 'WARNING'}  # Уровни по модулям бота (data, strategy, ...) и логгерам библиотек
+LOG_DEBUG_SAMPLE = 10  # Из каждых N одинаковых DEBUG-записей пишется одна
+LOG_SAMPLE_KEYS = 1024  # Сколько последних шаблонов DEBUG-сообщений помнит выборка
+LOG_JSON = True  # JSON-строки вместо текстового формата
+LOG_QUEUE_SIZE = 10000  # Записей в очереди к файлу; при переполнении новые отбрасываются
+NOTIFY_QUEUE_SIZE = 100  # Сообщений в очереди уведомлений; сверх этого старые отбрасываются
+NOTIFY_DIGEST_WINDOW = 1.0  # За сколько секунд всплеск уведомлений собирается в одно сообщение
+NOTIFY_MIN_INTERVAL = 1.0  # Минимальный интервал между сообщениями в Telegram (сек)
+NOTIFY_RETRIES = 2
 
 TRADING_PAIRS = [
     'ETH/USDT', 'BTC/USDT', 'DOGE/USDT', 'XRP/USDT', 'BNB/USDT', 'ADA/USDT'
 ]
 
-ITERATIONS = 10
+PAIR_CONCURRENCY = 8  # Сколько пар одновременно обрабатывается планировщиком; не меньше числа пар, чтобы пакет свечи был целым
+PAIR_BATCH_WINDOW = 0.05  # Пары, сработавшие в пределах окна (сек), отбираются одним сканом и пакетным предсказанием
+PAIR_MOVE_THRESHOLD = 0.002  # Движение цены от последнего запуска, запускающее обработку пары
+PAIR_MAX_INTERVAL = 300  # Максимальный интервал между обработками пары (сек)
+PAIR_POLL_INTERVAL = 1  # Период проверки цены без потока (сек)
+PAIR_CANDLE_DELAY = 2  # Задержка после закрытия свечи перед обработкой (сек)
+PAIR_SHUTDOWN_TIMEOUT = 30  # Сколько ждать завершения начатых обработчиков при остановке (сек)
+SCAN_CONCURRENCY = 8  # Сколько пар анализируется одновременно при отборе
+SCAN_TIMEOUT = 15  # Таймаут анализа одной пары (сек)
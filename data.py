@@ -4,65 +4,219 @@ import ccxt.async_support as ccxt
 import pandas as pd
 import numpy as np
 import logging
-import tensorflow as tf
+import asyncio
+import time
+import weakref
+from collections import deque
+from numpy.lib.stride_tricks import sliding_window_view
 from sklearn.preprocessing import MinMaxScaler
-from config import LOOKBACK
+from config import LOOKBACK, OHLCV_CACHE_SIZE, OHLCV_MAX_AGE
+from indicators import FeatureWindow, IndicatorEngine, compute_features
+from executor import compute
+from logging_setup import lazy
+import metrics
 
+OHLCV_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+FEATURES = ['close', 'volume', 'MA10', 'MA50', 'RSI', 'MACD', 'MACD_signal', 'ATR', 'Volume_MA10', 'Volatility']
 
+
+def timeframe_to_ms(timeframe):
+    return ccxt.Exchange.parse_timeframe(timeframe) * 1000
+
+
+class OHLCVCache:
+    """Кэш свечей по клиенту биржи, паре и таймфрейму в кольцевом буфере.
+
+    Свечи, обновлённые не дольше max_age секунд назад, отдаются из памяти, пока
+    не закрылась последняя (формирующаяся) свеча: повторные решения по паре
+    в пределах свечи не тратят запрос к бирже. Иначе догружаются только свечи
+    начиная с последней закэшированной (она перезаписывается). Параллельные
+    запросы одного ключа ждут один и тот же запрос к бирже.
+
+    Кэш клиента хранится по слабой ссылке на него: свечи закрытого клиента не
+    достанутся новому, и два клиента одной биржи (основной и тестовый) их не делят.
+
+    В metrics.CACHE: 'hit' — ответ из памяти или присоединение к уже идущему
+    запросу, 'incremental' — догрузка хвоста, 'miss' — полная загрузка.
+    """
+
+    def __init__(self, capacity=OHLCV_CACHE_SIZE, max_age=OHLCV_MAX_AGE):
+        self.capacity = capacity
+        self.max_age = max_age
+        self._candles = weakref.WeakKeyDictionary()  # клиент -> {(пара, таймфрейм): (свечи, время обновления)}
+        self._inflight = weakref.WeakKeyDictionary()  # клиент -> {(пара, таймфрейм): (задача, limit)}
+
+    async def get(self, exchange, symbol, timeframe, limit):
+        key = (symbol, timeframe)
+        cached = self._candles.get(exchange, {}).get(key)
+        if cached is not None and self._fresh(cached, timeframe, limit):
+            metrics.CACHE.inc('ohlcv', 'hit')
+            return list(cached[0])[-limit:]
+        inflights = self._inflight.setdefault(exchange, {})
+        while True:
+            inflight = inflights.get(key)
+            joined = inflight is not None
+            if not joined:
+                inflight = (asyncio.ensure_future(self._refresh(exchange, key, limit)), limit)
+                inflights[key] = inflight
+            task, task_limit = inflight
+            candles = await asyncio.shield(task)
+            # Если уже шедший запрос был с меньшим limit, запрашиваем заново
+            if task_limit >= limit:
+                if joined:
+                    metrics.CACHE.inc('ohlcv', 'hit')
+                return candles[-limit:]
+
+    def clear(self):
+        self._candles.clear()
+
+    def _fresh(self, cached, timeframe, limit):
+        ring, refreshed = cached
+        now = time.time()
+        return len(ring) >= limit and now - refreshed <= self.max_age and \
+            now * 1000 < ring[-1][0] + timeframe_to_ms(timeframe)
+
+    async def _refresh(self, exchange, key, limit):
+        symbol, timeframe = key
+        try:
+            candles = self._candles.setdefault(exchange, {})
+            ring = candles[key][0] if key in candles else None
+            missing = None
+            if ring and len(ring) >= limit:
+                last_ts = ring[-1][0]
+                # Часы биржи (или ускоренного симулятора) могут опережать локальные
+                missing = max(1, int((time.time() * 1000 - last_ts) // timeframe_to_ms(timeframe)) + 1)
+            if missing is None or missing >= limit:
+                metrics.CACHE.inc('ohlcv', 'miss')
+                ohlcv = await exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+                ring = deque(ohlcv, maxlen=max(self.capacity, limit))
+                logging.debug("OHLCV кэш %s: полная загрузка %d свечей", key, len(ohlcv))
+            else:
+                metrics.CACHE.inc('ohlcv', 'incremental')
+                ohlcv = await exchange.fetch_ohlcv(symbol, timeframe, since=last_ts, limit=missing + 1)
+                if ohlcv:
+                    while ring and ring[-1][0] >= ohlcv[0][0]:
+                        ring.pop()
+                    ring.extend(ohlcv)
+                logging.debug("OHLCV кэш %s: догружено %d свечей", key, len(ohlcv))
+            candles[key] = (ring, time.time())
+            return list(ring)
+        finally:
+            self._inflight.get(exchange, {}).pop(key, None)
+
+
+ohlcv_cache = OHLCVCache()
+feature_engines = {}
+
+
+@metrics.timed('get_historical_data')
 async def get_historical_data(exchange, symbol, timeframe='1m', limit=LOOKBACK + 100):
     try:
-        ohlcv = await exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
-        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        ohlcv = await ohlcv_cache.get(exchange, symbol, timeframe, limit)
+        df = pd.DataFrame(ohlcv, columns=OHLCV_COLUMNS)
         df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        logging.info(f"Получены исторические данные для {symbol}: {df.shape}, columns={df.columns.tolist()}")
+        logging.debug("Получены исторические данные для %s: %s, columns=%s", symbol, df.shape, lazy(df.columns.tolist))
         return df
     except Exception as e:
         logging.error(f"Ошибка при получении данных для {symbol}: {str(e)}")
         return pd.DataFrame()
 
+@metrics.timed('add_features')
 async def add_features(df):
     try:
-        df = df.copy()
-        df['MA10'] = df['close'].rolling(window=10).mean()
-        df['MA50'] = df['close'].rolling(window=50).mean()
-        delta = df['close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        df['RSI'] = 100 - (100 / (1 + rs))
-        exp1 = df['close'].ewm(span=12, adjust=False).mean()
-        exp2 = df['close'].ewm(span=26, adjust=False).mean()
-        df['MACD'] = exp1 - exp2
-        df['MACD_signal'] = df['MACD'].ewm(span=9, adjust=False).mean()
-        df['BB_middle'] = df['close'].rolling(window=20).mean()
-        df['BB_std'] = df['close'].rolling(window=20).std()
-        df['BB_upper'] = df['BB_middle'] + 2 * df['BB_std']
-        df['BB_lower'] = df['BB_middle'] - 2 * df['BB_std']
-        df['TR'] = df[['high', 'low', 'close']].max(axis=1) - df[['high', 'low', 'close']].min(axis=1)
-        df['ATR'] = df['TR'].rolling(window=14).mean()
-        # Новые признаки
-        df['Volume_MA10'] = df['volume'].rolling(window=10).mean()
-        df['Volatility'] = df['close'].rolling(window=14).std()
-        df.dropna(inplace=True)
-        logging.info(f"Добавлены признаки: {df.shape}, columns={df.columns.tolist()}")
+        # Пакетный расчёт (обучение, начальная загрузка) идёт в пуле процессов, не блокируя цикл событий
+        df = await compute.run(compute_features, df, process=True)
+        logging.debug("Добавлены признаки: %s, columns=%s", df.shape, lazy(df.columns.tolist))
         return df
     except Exception as e:
         logging.error(f"Ошибка при добавлении признаков: {str(e)}")
         return df
 
-def prepare_lstm_data(df):
+@metrics.timed('update_features')
+async def update_features(pair, df):
+    """Инкрементальный аналог add_features: состояние индикаторов хранится по паре.
+
+    Возвращает FeatureWindow — последние строки признаков без построения DataFrame.
+    """
     try:
-        features = ['close', 'volume', 'MA10', 'MA50', 'RSI', 'MACD', 'MACD_signal', 'ATR', 'Volume_MA10', 'Volatility']
-        scaler = MinMaxScaler()
-        scaled_data = scaler.fit_transform(df[features])
-        X, y = [], []
-        for i in range(LOOKBACK, len(scaled_data)):
-            X.append(scaled_data[i-LOOKBACK:i])
-            y.append(1 if df['close'].iloc[i] > df['close'].iloc[i-1] else 0)
-        X = np.array(X)
-        y = np.array(y)
+        engine = feature_engines.get(pair)
+        if engine is None:
+            engine = feature_engines[pair] = IndicatorEngine()
+        if engine.needs_bootstrap(df) or engine.lock.locked():
+            # Полная загрузка пересчитывает всю историю: в пул потоков, как и раньше
+            features = await compute.run(engine.sync, df, name='IndicatorEngine.bootstrap')
+        else:
+            # Обновление на новую свечу — доли миллисекунды: поток добавил бы только ожидание GIL и очереди
+            features = engine.sync(df)
+        logging.debug("Обновлены признаки для %s: %s", pair, features.shape)
+        return features
+    except Exception as e:
+        logging.error(f"Ошибка при обновлении признаков для {pair}: {str(e)}")
+        feature_engines.pop(pair, None)
+        return FeatureWindow.from_frame(await add_features(df))
+
+def make_windows(scaled_data, close):
+    """Окна X[i] = scaled_data[i:i + LOOKBACK] как представления без копирования и метки роста цены."""
+    X = sliding_window_view(scaled_data, LOOKBACK, axis=0).transpose(0, 2, 1)[:-1]
+    y = (close[LOOKBACK:] > close[LOOKBACK - 1:-1]).astype(np.int64)
+    return X, y
+
+@metrics.timed('prepare_lstm_data')
+def prepare_lstm_data(df, scaler=None):
+    """Окна и метки для обучения. Без scaler подгоняет новый MinMaxScaler, иначе только масштабирует."""
+    try:
+        if scaler is None:
+            scaler = MinMaxScaler()
+            scaled_data = scaler.fit_transform(df[FEATURES]).astype(np.float32)
+        else:
+            scaled_data = (df[FEATURES].to_numpy(dtype=np.float64) * scaler.scale_ + scaler.min_).astype(np.float32)
+        X, y = make_windows(scaled_data, df['close'].to_numpy())
         logging.info(f"Подготовлены данные для LSTM: X.shape={X.shape}, y.mean={y.mean():.4f}")
         return X, y, scaler
     except Exception as e:
         logging.error(f"Ошибка при подготовке данных для LSTM: {str(e)}")
         return np.array([]), np.array([]), None
+
+@metrics.timed('prepare_inference_window')
+def prepare_inference_window(df, scaler=None):
+    """Окно для предсказания: то же, что X[-1:] из prepare_lstm_data, но без построения всех окон.
+
+    Если scaler не передан, масштаб берётся по min/max всей df, как при fit_transform.
+    """
+    try:
+        # DataFrame или FeatureWindow из update_features
+        values = np.asarray(df[FEATURES], dtype=np.float64)
+        if len(values) <= LOOKBACK:
+            return np.empty((0, LOOKBACK, len(FEATURES)), dtype=np.float32)
+        window = values[-LOOKBACK - 1:-1]
+        if scaler is None:
+            low = values.min(axis=0)
+            value_range = values.max(axis=0) - low
+            value_range[value_range == 0] = 1.0
+            scaled = (window - low) / value_range
+        else:
+            scaled = window * scaler.scale_ + scaler.min_
+        return scaled.astype(np.float32)[np.newaxis]
+    except Exception as e:
+        logging.error(f"Ошибка при подготовке окна для предсказания: {str(e)}")
+        return np.empty((0, LOOKBACK, len(FEATURES)), dtype=np.float32)
+
+async def prepare_training_data(exchange, pair, limit=LOOKBACK + 100):
+    # Получение исторических данных с биржи
+    historical_data = await get_historical_data(exchange, pair, limit=limit)
+    if historical_data is None or historical_data.empty:
+        logging.error(f"Не удалось получить исторические данные для {pair}")
+        return None
+
+    # Добавление признаков
+    data_with_features = await add_features(historical_data)
+    if data_with_features is None or data_with_features.empty:
+        logging.error(f"Не удалось добавить признаки для {pair}")
+        return None
+
+    # Подготовка данных для LSTM
+    X, y, scaler = prepare_lstm_data(data_with_features)
+    if X.size == 0 or y.size == 0:
+        logging.error(f"Подготовленные данные для {pair} пусты: X={X.shape}, y={y.shape}")
+        return None
+    return np.ascontiguousarray(X), y, scaler, data_with_features
@@ -4,19 +4,39 @@
 import ccxt.async_support as ccxt
 import asyncio
 import logging
-import telegram
 import os
-from config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, BINANCE_API_KEY, BINANCE_SECRET, BINGX_API_KEY, \
-    BINGX_SECRET_KEY
+import time
+from config import BINANCE_API_KEY, BINANCE_SECRET, BINGX_API_KEY, \
+    BINGX_SECRET_KEY, CACHE_TIMEOUT, TRADING_PAIRS, STREAM_URL, STREAM_TESTNET_URL
+import metrics
+from market_stream import MarketStream
+from notifier import notifier
+from price_calculator import DepthBook
+from rate_limiter import RequestScheduler, METHOD_PRIORITIES, PRIORITY_MARKET, request_weight
+
+
+class ScheduledClient:
+    """Клиент с интерфейсом ccxt, все вызовы которого идут через планировщик Exchange."""
+
+    def __init__(self, owner):
+        self._owner = owner
+
+    def __getattr__(self, method):
+        async def call(*args, **kwargs):
+            return await self._owner.request(method, *args, **kwargs)
+        return call
 
 
 class Exchange:
-    def __init__(self, exchange_name, testnet=False):
-        if exchange_name == 'binance':
+    def __init__(self, exchange_name, testnet=False, symbols=TRADING_PAIRS, client=None):
+        if client is not None:
+            # Готовый клиент с интерфейсом ccxt, например SimulatedVenue
+            self.exchange = client
+        elif exchange_name == 'binance':
             self.exchange = ccxt.binance({
                 'apiKey': BINANCE_API_KEY,
                 'secret': BINANCE_SECRET,
-                'enableRateLimit': True,
+                'enableRateLimit': False,  # лимиты соблюдает RequestScheduler
             })
             if testnet:
                 self.exchange.set_sandbox_mode(True)
@@ -25,36 +45,175 @@ class Exchange:
             self.exchange = ccxt.bingx({
                 'apiKey': BINGX_API_KEY,
                 'secret': BINGX_SECRET_KEY,
-                'enableRateLimit': True,
+                'enableRateLimit': False,
             })
             if testnet:
                 logging.info("bingx настроен в тестовом режиме")
         else:
             raise ValueError(f"Неизвестная биржа: {exchange_name}")
         self.name = exchange_name
+        self.testnet = testnet
+        self.symbols = list(symbols)
+        self._tickers = {}  # symbol -> (время получения, тикер)
+        self._tickers_inflight = None
+        self.scheduler = RequestScheduler()
+        self.rest = ScheduledClient(self)
+        self.stream = None
+        self._stream_task = None
+
+    async def request(self, method, *args, priority=None, **kwargs):
+        """Вызов метода ccxt через планировщик: вес эндпоинта, приоритет и повторы."""
+        if priority is None:
+            priority = METHOD_PRIORITIES.get(method, PRIORITY_MARKET)
+        metrics.REQUESTS.inc(self.name, method)
+        try:
+            result = await self.scheduler.submit(getattr(self.exchange, method), *args,
+                                                 weight=request_weight(method, args, kwargs),
+                                                 priority=priority, name=method, **kwargs)
+        except Exception:
+            metrics.ERRORS.inc(self.name, method)
+            raise
+        headers = getattr(self.exchange, 'last_response_headers', None) or {}
+        used = headers.get('x-mbx-used-weight-1m') or headers.get('X-MBX-USED-WEIGHT-1M')
+        if used is not None:
+            self.scheduler.sync_used(int(used))
+        return result
+
+    def start_stream(self, url=None):
+        """Включает потоковый режим: стаканы, тикеры и минутные свечи из websocket.
+
+        Пока поток здоров, fetch_ticker, fetch_order_book и fetch_ohlcv('1m')
+        отвечают из памяти, иначе — прежним запросом к REST.
+        """
+        if self.name != 'binance':
+            logging.warning(f"Потоковый режим для {self.name} не поддерживается, используется REST")
+            return None
+        if self.stream is None:
+            url = url or (STREAM_TESTNET_URL if self.testnet else STREAM_URL)
+            self.stream = MarketStream(self.rest, self.symbols, url)
+            self._stream_task = asyncio.create_task(self.stream.run())
+        return self.stream
+
+    async def wait_for_update(self, pair, timeout):
+        """Ждёт новой цены пары из потока; без здорового потока — просто timeout секунд."""
+        if self.stream is not None and self.stream.healthy():
+            await self.stream.wait_update(pair, timeout)
+        else:
+            await asyncio.sleep(timeout)
 
     async def fetch_balance(self):
-        return await self.exchange.fetch_balance()
+        return await self.rest.fetch_balance()
+
+    async def fetch_ticker(self, pair, max_age=CACHE_TIMEOUT):
+        """Тикер из снимка рынка, если он не старше max_age секунд.
 
-    async def fetch_ticker(self, pair):
-        return await self.exchange.fetch_ticker(pair)
+        Для отслеживаемых пар обновляется весь снимок одним fetch_tickers.
+        """
+        if self.stream is not None:
+            ticker = self.stream.ticker(pair)
+            if ticker is not None and ticker['last'] is not None:
+                metrics.CACHE.inc('ticker', 'stream')
+                return ticker
+        cached = self._tickers.get(pair)
+        if cached is not None and time.monotonic() - cached[0] <= max_age:
+            metrics.CACHE.inc('ticker', 'hit')
+            return cached[1]
+        metrics.CACHE.inc('ticker', 'miss')
+        if pair in self.symbols:
+            await self._refresh_tickers()
+            cached = self._tickers.get(pair)
+            # fetch_tickers мог не вернуть пару: старый тикер из кэша не годится
+            if cached is not None and time.monotonic() - cached[0] <= max_age:
+                return cached[1]
+        ticker = await self.rest.fetch_ticker(pair)
+        self._tickers[pair] = (time.monotonic(), ticker)
+        return ticker
 
-    async def fetch_order_book(self, pair):
-        return await self.exchange.fetch_order_book(pair)
+    async def fetch_tickers(self, symbols=None):
+        return await self.rest.fetch_tickers(symbols)
+
+    async def market_snapshot(self, max_age=CACHE_TIMEOUT):
+        """Тикеры всех отслеживаемых пар; запрос к бирже — только если какой-то из них старше max_age."""
+        if self.stream is not None:
+            streamed = {pair: self.stream.ticker(pair) for pair in self.symbols}
+            if all(ticker is not None and ticker['last'] is not None for ticker in streamed.values()):
+                return streamed
+        now = time.monotonic()
+        if any(pair not in self._tickers or now - self._tickers[pair][0] > max_age for pair in self.symbols):
+            await self._refresh_tickers()
+        return {pair: self._tickers[pair][1] for pair in self.symbols if pair in self._tickers}
+
+    def ticker_age(self, pair):
+        """Возраст закэшированного тикера в секундах (inf, если его нет)."""
+        cached = self._tickers.get(pair)
+        return time.monotonic() - cached[0] if cached is not None else float('inf')
+
+    async def _refresh_tickers(self):
+        # Параллельные вызовы ждут один и тот же запрос к бирже
+        if self._tickers_inflight is None:
+            self._tickers_inflight = asyncio.ensure_future(self._load_tickers())
+        await asyncio.shield(self._tickers_inflight)
+
+    async def _load_tickers(self):
+        try:
+            tickers = await self.rest.fetch_tickers(self.symbols)
+            received = time.monotonic()
+            for pair, ticker in tickers.items():
+                self._tickers[pair] = (received, ticker)
+        finally:
+            self._tickers_inflight = None
+
+    async def fetch_order_book(self, pair, limit=None):
+        if self.stream is not None:
+            book = self.stream.order_book(pair, limit)
+            if book is not None:
+                return book
+        return await self.rest.fetch_order_book(pair, limit)
+
+    async def fetch_depth_book(self, pair, limit=100):
+        """Стакан пары как DepthBook: из локального потока или одним REST-запросом."""
+        if self.stream is not None:
+            book = self.stream.depth_book(pair)
+            if book is not None:
+                metrics.CACHE.inc('order_book', 'stream')
+                return book
+        metrics.CACHE.inc('order_book', 'miss')
+        return DepthBook.from_order_book(await self.rest.fetch_order_book(pair, limit))
 
     async def fetch_order(self, order_id, pair):
-        return await self.exchange.fetch_order(order_id, pair)
+        return await self.rest.fetch_order(order_id, pair)
 
+    async def fetch_open_orders(self, pair=None):
+        return await self.rest.fetch_open_orders(pair)
+
+    async def fetch_orders(self, pair, since=None, limit=None):
+        return await self.rest.fetch_orders(pair, since, limit)
+
+    async def cancel_order(self, order_id, pair):
+        return await self.rest.cancel_order(order_id, pair)
+
+    @metrics.timed('place_order')
     async def create_limit_buy_order(self, pair, amount, price):
-        return await self.exchange.create_order(pair, 'limit', 'buy', amount, price)
+        return await self.rest.create_order(pair, 'limit', 'buy', amount, price)
 
+    @metrics.timed('place_order')
     async def create_limit_sell_order(self, pair, amount, price):
-        return await self.exchange.create_order(pair, 'limit', 'sell', amount, price)
+        return await self.rest.create_order(pair, 'limit', 'sell', amount, price)
 
-    async def fetch_ohlcv(self, pair, timeframe='1h', limit=100):
-        return await self.exchange.fetch_ohlcv(pair, timeframe, limit=limit)
+    async def fetch_ohlcv(self, pair, timeframe='1h', since=None, limit=100):
+        if self.stream is not None:
+            candles = self.stream.ohlcv(pair, timeframe, since, limit)
+            if candles is not None:
+                metrics.CACHE.inc('ohlcv', 'stream')
+                return candles
+        return await self.rest.fetch_ohlcv(pair, timeframe, since=since, limit=limit)
 
     async def close(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self._stream_task.cancel()
+            await asyncio.gather(self._stream_task, return_exceptions=True)
+            self.stream = None
         await self.exchange.close()
         logging.info(f"Соединение с {self.name} закрыто")
 
@@ -68,7 +227,10 @@ async def get_ticker(exchange, symbol):
 
 async def manage_request(exchange, method, *args, **kwargs):
     try:
-        func = getattr(exchange, method)
+        func = getattr(exchange, method, None)
+        if func is None:
+            # Методы ccxt без обёртки в Exchange идут напрямую через планировщик
+            return await exchange.request(method, *args, **kwargs)
         result = await func(*args, **kwargs)
         return result
     except Exception as e:
@@ -76,10 +238,5 @@ async def manage_request(exchange, method, *args, **kwargs):
         raise e
 
 async def send_telegram_message(message):
-    try:
-        from telegram import Bot  # Исправлено: импортируем Bot из модуля telegram
-        bot = Bot(token=TELEGRAM_BOT_TOKEN)
-        await bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message)
-        logging.info(f"Telegram сообщение: {message}")
-    except Exception as e:
-        logging.error(f"Ошибка отправки сообщения в Telegram: {str(e)}")
+    """Ставит сообщение в фоновую очередь уведомлений и сразу возвращается."""
+    notifier.notify(message)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# executor.py
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import globals
+from config import COMPUTE_THREADS, COMPUTE_PROCESSES, LOOP_LAG_WARNING, COMPUTE_STATS_INTERVAL
+
+
+def _timed_call(func, args, kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, start, time.perf_counter() - start
+
+
+class TaskStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.wait_max = 0.0
+
+    def add(self, run_time, wait):
+        self.count += 1
+        self.total += run_time
+        self.max = max(self.max, run_time)
+        self.wait_max = max(self.wait_max, wait)
+
+
+class ComputeExecutor:
+    """Выносит CPU-работу из цикла событий.
+
+    Пул потоков — для NumPy/TensorFlow/pandas, которые отпускают GIL; пул
+    процессов — для остального (функция и аргументы должны сериализоваться).
+    По каждой задаче копится время выполнения и ожидания в очереди, а
+    monitor_loop_lag измеряет задержку самого цикла событий.
+    """
+
+    def __init__(self, threads=COMPUTE_THREADS, processes=COMPUTE_PROCESSES):
+        self._threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='compute')
+        self._process_count = processes
+        self._processes = None
+        self.stats = defaultdict(TaskStats)
+        self.loop_lag = 0.0
+        self.loop_lag_max = 0.0
+
+    def _get_processes(self):
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=self._process_count,
+                                                  mp_context=multiprocessing.get_context('spawn'))
+        return self._processes
+
+    async def run(self, func, *args, process=False, name=None, **kwargs):
+        loop = asyncio.get_running_loop()
+        pool = self._get_processes() if process else self._threads
+        submitted = time.perf_counter()
+        result, started, run_time = await loop.run_in_executor(pool, _timed_call, func, args, kwargs)
+        # perf_counter в другом процессе несравним, поэтому ожидание считается только для потоков
+        wait = 0.0 if process else started - submitted
+        self.stats[name or getattr(func, '__qualname__', repr(func))].add(run_time, wait)
+        return result
+
+    async def monitor_loop_lag(self, interval=0.1, report_interval=COMPUTE_STATS_INTERVAL):
+        loop = asyncio.get_running_loop()
+        report_at = loop.time() + report_interval
+        while globals.running:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag = max(0.0, loop.time() - start - interval)
+            self.loop_lag_max = max(self.loop_lag_max, self.loop_lag)
+            if loop.time() >= report_at:
+                self.report()
+                report_at = loop.time() + report_interval
+
+    def report(self):
+        level = logging.WARNING if self.loop_lag_max > LOOP_LAG_WARNING else logging.INFO
+        tasks = ", ".join(f"{name}: {s.count} шт., ср. {s.total / s.count * 1000:.1f} мс, макс. {s.max * 1000:.1f} мс, "
+                          f"ожидание до {s.wait_max * 1000:.1f} мс" for name, s in self.stats.items() if s.count)
+        logging.log(level, f"Задержка цикла событий: макс. {self.loop_lag_max * 1000:.1f} мс; задачи: {tasks or 'нет'}")
+        self.loop_lag_max = 0.0
+        self.stats.clear()
+
+    def close(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+
+
+compute = ComputeExecutor()
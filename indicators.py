@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# indicators.py
+import math
+import threading
+from collections import deque
+import numpy as np
+import pandas as pd
+from config import LOOKBACK
+
+FEATURE_COLUMNS = [
+    'timestamp', 'open', 'high', 'low', 'close', 'volume', 'MA10', 'MA50', 'RSI', 'MACD', 'MACD_signal',
+    'BB_middle', 'BB_std', 'BB_upper', 'BB_lower', 'TR', 'ATR', 'Volume_MA10', 'Volatility'
+]
+OHLCV = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+VALUE_COLUMNS = FEATURE_COLUMNS[1:]
+VALUE_INDEX = {column: index for index, column in enumerate(VALUE_COLUMNS)}
+RESYNC_INTERVAL = 10000  # Через сколько сдвигов окна пересчитывать суммы заново (накопление ошибки округления)
+
+
+def compute_features(df):
+    """Пакетный расчёт всех признаков по всей истории (используется для начальной загрузки)."""
+    df['MA10'] = df['close'].rolling(window=10).mean()
+    df['MA50'] = df['close'].rolling(window=50).mean()
+    delta = df['close'].diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
+    rs = gain / loss
+    df['RSI'] = 100 - (100 / (1 + rs))
+    exp1 = df['close'].ewm(span=12, adjust=False).mean()
+    exp2 = df['close'].ewm(span=26, adjust=False).mean()
+    df['MACD'] = exp1 - exp2
+    df['MACD_signal'] = df['MACD'].ewm(span=9, adjust=False).mean()
+    df['BB_middle'] = df['close'].rolling(window=20).mean()
+    df['BB_std'] = df['close'].rolling(window=20).std()
+    df['BB_upper'] = df['BB_middle'] + 2 * df['BB_std']
+    df['BB_lower'] = df['BB_middle'] - 2 * df['BB_std']
+    df['TR'] = df[['high', 'low', 'close']].max(axis=1) - df[['high', 'low', 'close']].min(axis=1)
+    df['ATR'] = df['TR'].rolling(window=14).mean()
+    # Новые признаки
+    df['Volume_MA10'] = df['volume'].rolling(window=10).mean()
+    df['Volatility'] = df['close'].rolling(window=14).std()
+    df.dropna(inplace=True)
+    return df
+
+
+class RollingWindow:
+    """Окно фиксированной длины: среднее по бегущей сумме, дисперсия по Уэлфорду.
+
+    Как и pandas.rolling, до заполнения окна возвращает NaN.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.values = deque()
+        self.total = 0.0
+        self.m2 = 0.0
+        self.nonzero = 0
+        self._shifts = 0
+
+    def _next(self, x):
+        n = len(self.values)
+        if n < self.size:
+            old_mean = self.total / n if n else 0.0
+            total = self.total + x
+            new_mean = total / (n + 1)
+            m2 = self.m2 + (x - old_mean) * (x - new_mean)
+            return n + 1, total, m2
+        y = self.values[0]
+        old_mean = self.total / n
+        total = self.total + x - y
+        new_mean = total / n
+        m2 = self.m2 + (x - y) * (x - new_mean + y - old_mean)
+        return n, total, max(m2, 0.0)
+
+    def _stats(self, n, total, m2, nonzero):
+        if n < self.size:
+            return math.nan, math.nan
+        # Окно из одних нулей даёт ровно 0, как в pandas, а не остаток округления
+        mean = total / n if nonzero else 0.0
+        return mean, math.sqrt(m2 / (n - 1))
+
+    def peek(self, x):
+        """Среднее и std окна, если бы в него добавили x, без изменения состояния."""
+        n, total, m2 = self._next(x)
+        nonzero = self.nonzero + (x != 0)
+        if len(self.values) == self.size:
+            nonzero -= self.values[0] != 0
+        return self._stats(n, total, m2, nonzero)
+
+    def push(self, x):
+        n, self.total, self.m2 = self._next(x)
+        self.values.append(x)
+        self.nonzero += x != 0
+        if len(self.values) > self.size:
+            self.nonzero -= self.values.popleft() != 0
+            self._shifts += 1
+            if self._shifts >= RESYNC_INTERVAL:
+                self._resync()
+        return self._stats(n, self.total, self.m2, self.nonzero)
+
+    def seed(self, values):
+        self.values = deque(float(v) for v in values[-self.size:])
+        self._resync()
+
+    def _resync(self):
+        self._shifts = 0
+        self.total = math.fsum(self.values)
+        mean = self.total / len(self.values) if self.values else 0.0
+        self.m2 = math.fsum((v - mean) ** 2 for v in self.values)
+        self.nonzero = sum(1 for v in self.values if v != 0)
+
+
+class EMA:
+    """Рекуррентная EMA, совпадает с pandas ewm(span=..., adjust=False)."""
+
+    def __init__(self, span):
+        self.alpha = 2.0 / (span + 1)
+        self.value = None
+
+    def peek(self, x):
+        if self.value is None:
+            return x
+        return self.value + self.alpha * (x - self.value)
+
+    def push(self, x):
+        self.value = self.peek(x)
+        return self.value
+
+
+class FeatureWindow:
+    """Последние строки признаков: представления буфера IndicatorEngine без копирования.
+
+    Столбец по имени (или список столбцов) возвращается массивом NumPy, поэтому
+    окно подходит BatchPredictor.prepare и prepare_inference_window вместо
+    DataFrame. Представление действительно до следующего sync движка.
+    """
+
+    def __init__(self, timestamps, values):
+        self.timestamps = timestamps
+        self.values = values
+
+    @classmethod
+    def from_frame(cls, df):
+        """Окно из DataFrame пакетного расчёта; без столбцов признаков — пустое."""
+        if df.empty or not set(FEATURE_COLUMNS).issubset(df.columns):
+            return cls(np.empty(0, dtype='datetime64[ns]'), np.empty((0, len(VALUE_COLUMNS))))
+        return cls(df['timestamp'].to_numpy(), df[VALUE_COLUMNS].to_numpy(dtype=np.float64))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def empty(self):
+        return len(self.timestamps) == 0
+
+    @property
+    def shape(self):
+        return len(self.timestamps), len(FEATURE_COLUMNS)
+
+    def __getitem__(self, columns):
+        if isinstance(columns, str):
+            return self.timestamps if columns == 'timestamp' else self.values[:, VALUE_INDEX[columns]]
+        return self.values[:, [VALUE_INDEX[column] for column in columns]]
+
+    def to_frame(self):
+        df = pd.DataFrame(self.values, columns=VALUE_COLUMNS)
+        df.insert(0, 'timestamp', self.timestamps)
+        return df
+
+
+class IndicatorEngine:
+    """Потоковый расчёт признаков add_features для одной пары, O(1) на свечу.
+
+    Последняя свеча биржи ещё формируется, поэтому она хранится как
+    предварительная: её признаки пересчитываются от зафиксированного состояния
+    и фиксируются только при появлении следующей свечи.
+
+    Строки признаков лежат в заранее выделенном кольцевом буфере из двух копий
+    по history строк: строка i пишется в ячейки i % history и i % history +
+    history, поэтому последние history строк всегда идут подряд, и sync
+    возвращает их представлением без копирования. Предварительная строка
+    пишется в ячейку сразу за последней зафиксированной во второй копии.
+    """
+
+    def __init__(self, history=LOOKBACK + 100):
+        self.history = history
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, timestamp_dtype='datetime64[ns]'):
+        self.ma10 = RollingWindow(10)
+        self.ma50 = RollingWindow(50)
+        self.bb = RollingWindow(20)
+        self.volatility = RollingWindow(14)
+        self.gain = RollingWindow(14)
+        self.loss = RollingWindow(14)
+        self.tr = RollingWindow(14)
+        self.volume_ma = RollingWindow(10)
+        self.ema_fast = EMA(12)
+        self.ema_slow = EMA(26)
+        self.signal = EMA(9)
+        self.prev_close = None
+        self.timestamps = np.empty(2 * self.history + 1, dtype=timestamp_dtype)
+        self.values = np.empty((2 * self.history + 1, len(VALUE_COLUMNS)))
+        self.count = 0
+        self.pending = None
+        self.pending_row = None
+
+    @property
+    def last_timestamp(self):
+        return self.pending[0] if self.pending is not None else None
+
+    def _end(self):
+        # Конец зафиксированных строк во второй копии буфера; сюда же пишется предварительная строка
+        return (self.count - 1) % self.history + self.history + 1
+
+    def _append(self, row):
+        slot = self.count % self.history
+        for index in (slot, slot + self.history):
+            self.timestamps[index] = row[0]
+            self.values[index] = row[1:]
+        self.count += 1
+
+    def _step(self, candle, commit):
+        ts, o, h, l, c, v = candle
+        op = 'push' if commit else 'peek'
+        delta = c - self.prev_close if self.prev_close is not None else math.nan
+        gain, _ = getattr(self.gain, op)(delta if delta > 0 else 0.0)
+        loss, _ = getattr(self.loss, op)(-delta if delta < 0 else 0.0)
+        if loss == 0:
+            rsi = 100.0 if gain > 0 else math.nan
+        else:
+            rsi = 100 - 100 / (1 + gain / loss)
+        macd = getattr(self.ema_fast, op)(c) - getattr(self.ema_slow, op)(c)
+        macd_signal = getattr(self.signal, op)(macd)
+        ma10, _ = getattr(self.ma10, op)(c)
+        ma50, _ = getattr(self.ma50, op)(c)
+        bb_middle, bb_std = getattr(self.bb, op)(c)
+        tr_value = max(h, l, c) - min(h, l, c)
+        atr, _ = getattr(self.tr, op)(tr_value)
+        volume_ma, _ = getattr(self.volume_ma, op)(v)
+        _, volatility = getattr(self.volatility, op)(c)
+        if commit:
+            self.prev_close = c
+        row = (ts, o, h, l, c, v, ma10, ma50, rsi, macd, macd_signal, bb_middle, bb_std,
+               bb_middle + 2 * bb_std, bb_middle - 2 * bb_std, tr_value, atr, volume_ma, volatility)
+        # Строки с NaN (разгон окон, RSI на плоском рынке) отбрасываются, как dropna в compute_features
+        return None if any(x != x for x in row[1:]) else row
+
+    def update(self, candle):
+        """Принимает свечу (timestamp, open, high, low, close, volume)."""
+        if self.pending is not None:
+            if candle[0] < self.pending[0]:
+                return
+            if candle[0] > self.pending[0]:
+                row = self._step(self.pending, commit=True)
+                if row is not None:
+                    self._append(row)
+        self.pending = tuple(candle)
+        self.pending_row = self._step(self.pending, commit=False)
+        if self.pending_row is not None:
+            end = self._end()
+            self.timestamps[end] = self.pending_row[0]
+            self.values[end] = self.pending_row[1:]
+
+    def bootstrap(self, df):
+        """Начальная загрузка: признаки пакетно через compute_features, затем состояние окон."""
+        timestamps = df['timestamp'].to_numpy()
+        self.reset(timestamps.dtype)
+        if df.empty:
+            return
+        raw = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']]
+        committed = raw.iloc[:-1]
+        features = compute_features(committed.copy())
+        for row in features[FEATURE_COLUMNS].iloc[-self.history:].itertuples(index=False, name=None):
+            self._append(row)
+        close = committed['close'].to_numpy(dtype=float)
+        if len(close):
+            delta = np.diff(close)
+            self.prev_close = close[-1]
+            self.ma10.seed(close)
+            self.ma50.seed(close)
+            self.bb.seed(close)
+            self.volatility.seed(close)
+            self.gain.seed(np.concatenate(([0.0], np.where(delta > 0, delta, 0.0))))
+            self.loss.seed(np.concatenate(([0.0], np.where(delta < 0, -delta, 0.0))))
+            tr = committed[['high', 'low', 'close']].max(axis=1) - committed[['high', 'low', 'close']].min(axis=1)
+            self.tr.seed(tr.to_numpy(dtype=float))
+            self.volume_ma.seed(committed['volume'].to_numpy(dtype=float))
+            series = committed['close']
+            exp1 = series.ewm(span=12, adjust=False).mean()
+            exp2 = series.ewm(span=26, adjust=False).mean()
+            self.ema_fast.value = exp1.iloc[-1]
+            self.ema_slow.value = exp2.iloc[-1]
+            self.signal.value = (exp1 - exp2).ewm(span=9, adjust=False).mean().iloc[-1]
+        self.pending = None
+        self.update((timestamps[-1],) + tuple(float(raw[column].iloc[-1]) for column in OHLCV[1:]))
+
+    def _resume_index(self, timestamps):
+        """Позиция предварительной свечи в timestamps или None, если история разорвана."""
+        if self.pending is None:
+            return None
+        start = np.searchsorted(timestamps, self.pending[0])
+        if start == len(timestamps) or timestamps[start] != self.pending[0]:
+            return None
+        return start
+
+    def needs_bootstrap(self, df):
+        """Выполнит ли sync по df полную загрузку (первый вызов или разрыв истории)."""
+        return not df.empty and self._resume_index(df['timestamp'].to_numpy()) is None
+
+    def sync(self, df):
+        """Догоняет состояние по свежему DataFrame свечей и возвращает FeatureWindow признаков.
+
+        Если история разорвана (или это первый вызов), выполняется полная загрузка.
+        Потокобезопасен: полная загрузка вызывается из пула потоков.
+        """
+        with self.lock:
+            return self._sync(df)
+
+    def _sync(self, df):
+        if df.empty:
+            return FeatureWindow.from_frame(df)
+        timestamps = df['timestamp'].to_numpy()
+        start = self._resume_index(timestamps)
+        if start is None:
+            self.bootstrap(df)
+        else:
+            # Новых свечей обычно одна-две: в Python переводятся только они, а не весь DataFrame
+            columns = [df[column].to_numpy(dtype=float)[start:].tolist() for column in OHLCV[1:]]
+            for candle in zip(timestamps[start:], *columns):
+                self.update(candle)
+        return self.window()
+
+    def window(self):
+        """Последние history строк признаков (с предварительной, если она без NaN)."""
+        end = self._end()
+        if self.pending_row is not None:
+            rows = min(self.count, self.history - 1) + 1
+            end += 1
+        else:
+            rows = min(self.count, self.history)
+        return FeatureWindow(self.timestamps[end - rows:end], self.values[end - rows:end])
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# inference.py
+import logging
+import numpy as np
+from config import INFERENCE_BACKEND
+from data import prepare_inference_window
+import metrics
+
+
+class BatchPredictor:
+    """Предсказания моделей сразу по нескольким парам.
+
+    models — {pair: (model, scaler)}. Окна пар с общей моделью (режим pooled)
+    считаются одним вызовом predict. Результаты запоминаются по (пара, время
+    последней свечи), поэтому повторное срабатывание пары на той же свече
+    (движение цены, дедлайн) не считает предсказание заново.
+
+    Модель пары заменяется через swap. Запрос из prepare запоминает пару
+    (model, scaler), которой масштабировано окно, и предсказывается именно
+    ею, поэтому запрос, начатый до замены, не смешает старый скейлер с новой
+    моделью.
+    """
+
+    def __init__(self, models):
+        self.models = dict(models)
+        self._cache = {}  # pair -> (timestamp, entry, prediction)
+
+    def swap(self, pair, model, scaler):
+        # Новый словарь присваивается целиком: читатели видят либо старую, либо новую пару
+        models = dict(self.models)
+        models[pair] = (model, scaler)
+        self.models = models
+        self._cache.pop(pair, None)
+
+    def prepare(self, pair, df):
+        """Запрос на предсказание (timestamp, X, entry) или None, если модели или данных нет."""
+        entry = self.models.get(pair)
+        if entry is None:
+            logging.error(f"Нет модели для {pair}")
+            return None
+        X = prepare_inference_window(df, entry[1])
+        if X.size == 0:
+            return None
+        return np.asarray(df['timestamp'])[-1], X, entry
+
+    def cached(self, pair, request):
+        hit = self._cache.get(pair)
+        if hit is not None and hit[0] == request[0] and hit[1] is request[2]:
+            return hit[2]
+        return None
+
+    def predict_many(self, requests):
+        """requests: {pair: запрос из prepare}."""
+        results = {}
+        pending = {}
+        for pair, request in requests.items():
+            prediction = self.cached(pair, request)
+            if prediction is not None:
+                metrics.CACHE.inc('prediction', 'hit')
+                results[pair] = prediction
+            else:
+                metrics.CACHE.inc('prediction', 'miss')
+                model = request[2][0]
+                pending.setdefault(id(model), (model, []))[1].append((pair, request))
+        for model, items in pending.values():
+            batch = np.concatenate([request[1] for _, request in items])
+            with metrics.STAGE_LATENCY.time('predict'):
+                predictions = model.predict(batch, verbose=0)[:, 0]
+            for (pair, (timestamp, _, entry)), prediction in zip(items, predictions):
+                self._cache[pair] = (timestamp, entry, prediction)
+                results[pair] = prediction
+        if pending:
+            computed = sum(len(items) for _, items in pending.values())
+            logging.debug("Пакетное предсказание: %d пар за %d вызовов, из кэша: %d", computed, len(pending),
+                          len(results) - computed)
+        return results
+
+    def predict(self, pair, request):
+        return self.predict_many({pair: request})[pair]
+
+    def clear(self):
+        self._cache.clear()
+
+
+class NumpyRNNModel:
+    """Прямой проход моделей build_lstm_model/build_gru_model на NumPy.
+
+    Веса переносятся из обученной Keras-модели (from_keras) или из .npz
+    (load), поэтому торговому процессу не нужен TensorFlow. Интерфейс
+    predict совместим с Keras: возвращает массив формы (batch, 1).
+    """
+
+    def __init__(self, kind, recurrent, dense):
+        if kind not in ('lstm', 'gru'):
+            raise ValueError(f"Неизвестный тип рекуррентного слоя: {kind}")
+        self.kind = kind
+        self.recurrent = [tuple(np.asarray(w, dtype=np.float32) for w in layer) for layer in recurrent]
+        self.dense = tuple(np.asarray(w, dtype=np.float32) for w in dense)
+        self._layers = [self._fold(*layer) for layer in self.recurrent]
+
+    def _fold(self, kernel, recurrent_kernel, bias):
+        """Готовит веса к прямому проходу, где все гейты считаются одним tanh.
+
+        sigmoid(x) = 0.5 * tanh(x / 2) + 0.5, поэтому столбцы сигмоидных гейтов
+        заранее делятся на 2. Для LSTM гейты переставляются в порядок i, f, o, c.
+        """
+        units = recurrent_kernel.shape[0]
+        if self.kind == 'lstm':
+            order = np.r_[0:2 * units, 3 * units:4 * units, 2 * units:3 * units]
+            scale = np.r_[np.full(3 * units, 0.5), np.ones(units)].astype(np.float32)
+            return kernel[:, order] * scale, recurrent_kernel[:, order] * scale, bias[order] * scale
+        scale = np.r_[np.full(2 * units, 0.5), np.ones(units)].astype(np.float32)
+        input_bias, recurrent_bias = bias
+        return kernel * scale, recurrent_kernel * scale, (input_bias * scale, recurrent_bias * scale)
+
+    @classmethod
+    def from_keras(cls, model):
+        kind = None
+        recurrent = []
+        dense = None
+        for layer in model.layers:
+            name = type(layer).__name__
+            if name in ('LSTM', 'GRU'):
+                if name == 'GRU' and not layer.reset_after:
+                    raise ValueError("Поддерживается только GRU с reset_after=True")
+                kind = name.lower()
+                recurrent.append(layer.get_weights())
+            elif name == 'Dense':
+                dense = layer.get_weights()
+        if kind is None or dense is None:
+            raise ValueError("Модель не похожа на build_lstm_model/build_gru_model")
+        return cls(kind, recurrent, dense)
+
+    def save(self, path):
+        arrays = {'kind': np.array(self.kind), 'dense_kernel': self.dense[0], 'dense_bias': self.dense[1]}
+        for i, (kernel, recurrent_kernel, bias) in enumerate(self.recurrent):
+            arrays[f'rnn{i}_kernel'] = kernel
+            arrays[f'rnn{i}_recurrent_kernel'] = recurrent_kernel
+            arrays[f'rnn{i}_bias'] = bias
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            recurrent = []
+            i = 0
+            while f'rnn{i}_kernel' in arrays:
+                recurrent.append((arrays[f'rnn{i}_kernel'], arrays[f'rnn{i}_recurrent_kernel'], arrays[f'rnn{i}_bias']))
+                i += 1
+            return cls(str(arrays['kind']), recurrent, (arrays['dense_kernel'], arrays['dense_bias']))
+
+    def _lstm(self, x, kernel, recurrent_kernel, bias):
+        steps, batch = x.shape[0], x.shape[1]
+        units = recurrent_kernel.shape[0]
+        # Входная проекция сразу по всем шагам, в цикле остаётся только h @ U
+        projected = x @ kernel + bias
+        outputs = np.empty((steps, batch, units), dtype=np.float32)
+        z = np.empty((batch, 4 * units), dtype=np.float32)
+        c = np.zeros((batch, units), dtype=np.float32)
+        tmp = np.empty_like(c)
+        h = np.zeros_like(c)
+        gates = z[:, :3 * units]
+        input_gate, forget_gate, output_gate = z[:, :units], z[:, units:2 * units], z[:, 2 * units:3 * units]
+        candidate = z[:, 3 * units:]
+        for t in range(steps):
+            np.dot(h, recurrent_kernel, out=z)
+            z += projected[t]
+            np.tanh(z, out=z)
+            gates *= 0.5
+            gates += 0.5
+            c *= forget_gate
+            np.multiply(input_gate, candidate, out=tmp)
+            c += tmp
+            h = outputs[t]
+            np.tanh(c, out=h)
+            h *= output_gate
+        return outputs
+
+    def _gru(self, x, kernel, recurrent_kernel, bias):
+        steps, batch = x.shape[0], x.shape[1]
+        units = recurrent_kernel.shape[0]
+        input_bias, recurrent_bias = bias
+        projected = x @ kernel + input_bias
+        outputs = np.empty((steps, batch, units), dtype=np.float32)
+        hz = np.empty((batch, 3 * units), dtype=np.float32)
+        gates = np.empty((batch, 2 * units), dtype=np.float32)
+        candidate = np.empty((batch, units), dtype=np.float32)
+        h = np.zeros_like(candidate)
+        update_gate, reset_gate = gates[:, :units], gates[:, units:]
+        for t in range(steps):
+            np.dot(h, recurrent_kernel, out=hz)
+            hz += recurrent_bias
+            np.add(projected[t, :, :2 * units], hz[:, :2 * units], out=gates)
+            np.tanh(gates, out=gates)
+            gates *= 0.5
+            gates += 0.5
+            np.multiply(reset_gate, hz[:, 2 * units:], out=candidate)
+            candidate += projected[t, :, 2 * units:]
+            np.tanh(candidate, out=candidate)
+            # h = z * h_prev + (1 - z) * candidate
+            out = outputs[t]
+            np.subtract(h, candidate, out=out)
+            out *= update_gate
+            out += candidate
+            h = out
+        return outputs
+
+    def predict(self, X, verbose=0):
+        # Время — первая ось, чтобы состояние шага t было непрерывным срезом
+        x = np.ascontiguousarray(np.swapaxes(np.asarray(X, dtype=np.float32), 0, 1))
+        step = self._lstm if self.kind == 'lstm' else self._gru
+        for kernel, recurrent_kernel, bias in self._layers:
+            x = step(x, kernel, recurrent_kernel, bias)
+        return 0.5 * (1.0 + np.tanh(0.5 * (x[-1] @ self.dense[0] + self.dense[1])))
+
+
+def load_backend(model, backend=INFERENCE_BACKEND):
+    """Оборачивает обученную Keras-модель в выбранный бэкенд инференса."""
+    if backend == 'numpy':
+        return NumpyRNNModel.from_keras(model)
+    if backend == 'keras':
+        return model
+    raise ValueError(f"Неизвестный бэкенд инференса: {backend}")
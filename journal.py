@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# journal.py
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+import globals
+from config import JOURNAL_DIR, JOURNAL_FLUSH_INTERVAL, JOURNAL_SNAPSHOT_EVERY
+from order_management import FINISHED_STATUSES, fetch_open_orders_by_pair, fetch_finished_orders
+
+LOG_NAME = 'journal.log'
+SNAPSHOT_NAME = 'snapshot.json'
+_STOP = object()
+
+
+def empty_state():
+    return {'initial_total_usdt': None, 'balances': {}, 'orders': {}, 'daily_losses': {}, 'historical_losses': {},
+            'last_day': None}
+
+
+def apply_event(state, event):
+    """Применяет событие журнала к состоянию; одна функция и для записи, и для восстановления."""
+    kind = event['type']
+    if kind == 'balance':
+        state['balances'][event['pair']] = dict(event['values'])
+    elif kind == 'order':
+        state['orders'][event['order']['id']] = dict(event['order'])
+    elif kind == 'order_done':
+        state['orders'].pop(event['id'], None)
+    elif kind == 'start':
+        state['initial_total_usdt'] = event['initial_total_usdt']
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    """Журнал балансов пар и выставленных ордеров: восстановление состояния после падения.
+
+    Каждое изменение — JSON-строка с порядковым номером seq в journal.log,
+    файл только дописывается. record лишь применяет событие к состоянию в
+    памяти и кладёт его в очередь; сериализация, запись и fsync идут в фоновом
+    потоке пачками раз в flush_interval секунд, поэтому при падении теряется не
+    больше последнего интервала. Каждые snapshot_every событий копия состояния
+    целиком сериализуется и пишется в snapshot.json (через временный файл и переименование), а
+    журнал обрезается. Восстановление читает снимок и не больше snapshot_every
+    событий после него, сколько бы ни работал бот.
+    """
+
+    def __init__(self, directory=JOURNAL_DIR, flush_interval=JOURNAL_FLUSH_INTERVAL,
+                 snapshot_every=JOURNAL_SNAPSHOT_EVERY):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.state = empty_state()
+        self.seq = 0
+        self.since_snapshot = 0
+        self.replayed = 0
+        self.written = 0
+        self.snapshots = 0
+        self._queue = None
+        self._thread = None
+        self._file = None
+
+    @property
+    def enabled(self):
+        return self._thread is not None
+
+    @property
+    def log_path(self):
+        return os.path.join(self.directory, LOG_NAME)
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.directory, SNAPSHOT_NAME)
+
+    def open(self):
+        """Восстанавливает состояние из снимка и журнала и запускает фоновую запись."""
+        if self.enabled:
+            return self.state
+        os.makedirs(self.directory, exist_ok=True)
+        started = time.perf_counter()
+        self.state, self.seq, self.replayed = self._recover()
+        self.since_snapshot = self.replayed
+        self._file = open(self.log_path, 'ab')
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write, name='journal', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        logging.info(f"Журнал {self.directory}: восстановлено состояние seq={self.seq}, событий после снимка "
+                     f"{self.replayed}, ордеров без итога {len(self.state['orders'])} "
+                     f"за {time.perf_counter() - started:.3f} с")
+        return self.state
+
+    def _recover(self):
+        state, seq = empty_state(), 0
+        try:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            state.update(snapshot['state'])
+            seq = snapshot['seq']
+        except FileNotFoundError:
+            pass
+        replayed = 0
+        good = 0
+        try:
+            with open(self.log_path, 'rb') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # Оборванная последняя строка: всё после неё не было подтверждено fsync
+                        break
+                    good += len(line)
+                    # События до снимка остаются, если процесс упал между снимком и обрезкой журнала
+                    if event['seq'] <= seq:
+                        continue
+                    apply_event(state, event)
+                    seq = event['seq']
+                    replayed += 1
+            if good != os.path.getsize(self.log_path):
+                logging.warning(f"Журнал {self.log_path}: отброшен оборванный хвост")
+                os.truncate(self.log_path, good)
+        except FileNotFoundError:
+            pass
+        return state, seq, replayed
+
+    def record(self, kind, **fields):
+        """Событие в журнал без ожидания диска; до open ничего не делает."""
+        if not self.enabled:
+            return
+        self.seq += 1
+        event = dict(fields, type=kind, seq=self.seq, ts=time.time())
+        apply_event(self.state, event)
+        self._queue.put(event)
+        self.since_snapshot += 1
+        if self.since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def start(self, initial_total_usdt, balances):
+        """Начало торговли с нуля: исходный капитал и распределённые балансы пар."""
+        self.record('start', initial_total_usdt=initial_total_usdt)
+        for pair, values in balances.items():
+            self.balance(pair, values)
+
+    def balance(self, pair, values):
+        self.record('balance', pair=pair, values=dict(values))
+
+    def order(self, pair, order, side, amount, price, notional, fee, quote):
+        """Выставленный ордер, уже учтённый в балансе пары целиком.
+
+        notional — сумма, добавленная к cost (покупка) или revenue (продажа),
+        quote — изменение quote_binance с учётом комиссии fee.
+        """
+        self.record('order', order={'id': str(order['id']), 'pair': pair, 'side': side, 'amount': amount,
+                                    'price': price, 'notional': notional, 'fee': fee, 'quote': quote,
+                                    'timestamp': order.get('timestamp') or int(time.time() * 1000)})
+
+    def order_done(self, order_id, status, filled):
+        self.record('order_done', id=str(order_id), status=status, filled=filled)
+
+    def snapshot(self):
+        """Ставит в очередь снимок текущего состояния; после его записи журнал обрезается."""
+        if not self.enabled:
+            return
+        self.state['daily_losses'] = dict(globals.daily_losses)
+        self.state['historical_losses'] = {pair: list(values) for pair, values in globals.historical_losses.items()}
+        self.state['last_day'] = globals.last_day
+        # Состояние продолжит меняться, пока фоновый поток сериализует снимок, поэтому копируется
+        # здесь; apply_event заменяет записи балансов и ордеров целиком, так что хватает копии словарей
+        state = dict(self.state, balances=dict(self.state['balances']), orders=dict(self.state['orders']))
+        self._queue.put((self.seq, state))
+        self.since_snapshot = 0
+
+    def close(self):
+        """Дописывает очередь и останавливает фоновую запись; повторный вызов ничего не делает."""
+        if not self.enabled:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+
+    def _write(self):
+        while True:
+            batch = [self._queue.get()]
+            if batch[0] is not _STOP:
+                # Даём всплеску набраться, чтобы записать его одним fsync
+                time.sleep(self.flush_interval)
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            try:
+                for item in batch:
+                    if item is _STOP:
+                        self._flush(lines)
+                        return
+                    if isinstance(item, dict):
+                        lines.append(json.dumps(item, ensure_ascii=False).encode('utf-8') + b'\n')
+                    else:
+                        self._flush(lines)
+                        lines = []
+                        self._write_snapshot(*item)
+                self._flush(lines)
+            except OSError as e:
+                logging.error(f"Ошибка записи журнала {self.directory}: {str(e)}")
+
+    def _flush(self, lines):
+        if not lines:
+            return
+        self._file.write(b''.join(lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.written += len(lines)
+
+    def _write_snapshot(self, seq, state):
+        tmp = self.snapshot_path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(json.dumps({'seq': seq, 'state': state}, ensure_ascii=False))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        _fsync_dir(self.directory)
+        # Все события до seq уже записаны перед снимком; следующие идут в пустой журнал
+        self._file.truncate(0)
+        os.fsync(self._file.fileno())
+        self.snapshots += 1
+        logging.debug("Журнал %s: снимок seq=%d", self.directory, seq)
+
+
+def restore_globals(state):
+    globals.daily_losses.update(state.get('daily_losses') or {})
+    for pair, values in (state.get('historical_losses') or {}).items():
+        globals.historical_losses[pair] = list(values)
+    if state.get('last_day'):
+        globals.last_day = state['last_day']
+
+
+def release_unfilled(balance, order, filled):
+    """Возвращает в баланс пары неисполненную часть ордера, учтённого при выставлении целиком."""
+    unfilled = order['amount'] - filled
+    if order['amount'] <= 0 or unfilled <= 0:
+        return 0.0
+    share = unfilled / order['amount']
+    if order['side'] == 'buy':
+        balance['base'] -= unfilled
+        balance['cost'] -= order['notional'] * share
+    else:
+        balance['base'] += unfilled
+        balance['revenue'] -= order['notional'] * share
+    balance['quote_binance'] -= order['quote'] * share
+    balance['total_fees'] -= order['fee'] * share
+    if balance['base'] <= 0:
+        balance['entry_price'] = 0
+    return unfilled
+
+
+async def resolve_orders(exchange, balances, journal):
+    """Итоги всех ордеров журнала за один проход: открытые одним заходом, завершённые — fetch_orders на пару.
+
+    Неисполненная часть завершённых ордеров возвращается в баланс пары.
+    Возвращает открытые ордера журнала по парам.
+    """
+    pending = defaultdict(list)
+    for order in journal.state['orders'].values():
+        if order['pair'] in balances:
+            pending[order['pair']].append(order)
+    if not pending:
+        return {}
+    open_by_pair = await fetch_open_orders_by_pair(exchange, list(pending))
+    still_open = defaultdict(list)
+    finished = defaultdict(list)
+    for pair, orders in pending.items():
+        live = {str(order['id']) for order in open_by_pair[pair]}
+        for order in orders:
+            (still_open if order['id'] in live else finished)[pair].append(order)
+    statuses = await fetch_finished_orders(exchange, finished) if finished else {}
+    for pair, orders in finished.items():
+        for order in orders:
+            status = statuses[pair].get(order['id'])
+            if status is None or status['status'] not in FINISHED_STATUSES:
+                still_open[pair].append(order)
+                continue
+            filled = status.get('filled') or 0
+            unfilled = release_unfilled(balances[pair], order, filled)
+            journal.order_done(order['id'], status['status'], filled)
+            journal.balance(pair, balances[pair])
+            if unfilled:
+                logging.info(f"{pair}: ордер {order['id']} завершён ({status['status']}), исполнено {filled} из "
+                             f"{order['amount']}, неисполненное возвращено в баланс")
+    return still_open
+
+
+async def reconcile_state(exchange, account, balances, journal):
+    """Сверка восстановленного состояния с биржей при запуске.
+
+    Итоги ордеров журнала запрашиваются пачкой, затем позиция каждой пары
+    ограничивается тем, что реально есть на аккаунте (плюс ещё не исполненные
+    покупки): продажа вручную или потерянное событие не оставит в балансе
+    монеты, которых нет.
+    """
+    still_open = await resolve_orders(exchange, balances, journal)
+    await account.refresh(force=True)
+    for pair, balance in balances.items():
+        asset = pair.split('/')[0]
+        held = account.free.get(asset, 0.0) + account.used.get(asset, 0.0)
+        held += sum(order['amount'] for order in still_open.get(pair, []) if order['side'] == 'buy')
+        if balance['base'] > held:
+            logging.warning(f"{pair}: по журналу {balance['base']} {asset}, на аккаунте {held}, позиция уменьшена")
+            balance['base'] = held
+            if held <= 0:
+                balance['entry_price'] = 0
+            journal.balance(pair, balance)
+    journal.snapshot()
+
+
+journal = Journal()
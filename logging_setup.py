@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# logging_setup.py
+import atexit
+import json
+import logging
+import queue
+from collections import OrderedDict
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from config import LOG_FILE, LOG_LEVEL, LOG_LEVELS, LOG_DEBUG_SAMPLE, LOG_JSON, LOG_QUEUE_SIZE, \
+    LOG_SAMPLE_KEYS
+
+# Атрибуты LogRecord, которые не относятся к полям extra
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class LazyValue:
+    """Значение для аргумента лога, которое вычисляется только при форматировании записи.
+
+    Форматирование идёт в потоке слушателя, поэтому func не должна зависеть от
+    данных, которые успеют измениться: df.columns.tolist подходит, сам df — нет.
+    """
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return str(self.func(*self.args))
+
+    __repr__ = __str__
+
+
+def lazy(func, *args):
+    return LazyValue(func, *args)
+
+
+def record_source(record):
+    # Весь код бота пишет в корневой логгер, поэтому уровень задаётся по модулю
+    return record.module if record.name == 'root' else record.name
+
+
+def parse_level(value):
+    """Уровень логирования из числа или имени ('DEBUG', 'info')."""
+    if isinstance(value, int):
+        return value
+    level = logging.getLevelName(str(value).upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Неизвестный уровень логирования: {value}")
+    return level
+
+
+class LevelFilter(logging.Filter):
+    """Уровни по модулям и логгерам плюс выборка DEBUG: из каждых sample записей
+    с одним и тем же шаблоном сообщения пропускается одна (первая — всегда).
+
+    Счётчики хранятся для max_keys последних шаблонов: сообщения в f-строках
+    дают новый шаблон на каждое значение, и без предела словарь рос бы всю работу.
+    """
+
+    def __init__(self, level, levels=None, sample=1, max_keys=LOG_SAMPLE_KEYS):
+        super().__init__()
+        self.level = level
+        self.levels = {name: parse_level(value) for name, value in (levels or {}).items()}
+        self.sample = sample
+        self.max_keys = max_keys
+        self.counts = OrderedDict()
+
+    def level_for(self, source):
+        while source:
+            if source in self.levels:
+                return self.levels[source]
+            source = source.rpartition('.')[0]
+        return self.level
+
+    def filter(self, record):
+        source = record_source(record)
+        if record.levelno < self.level_for(source):
+            return False
+        if record.levelno <= logging.DEBUG and self.sample > 1:
+            key = (source, record.msg if isinstance(record.msg, str) else type(record.msg))
+            count = self.counts.pop(key, 0) + 1
+            self.counts[key] = count
+            if len(self.counts) > self.max_keys:
+                self.counts.popitem(last=False)
+            return count % self.sample == 1
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, источник, сообщение и поля extra."""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'source': record_source(record),
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Кладёт записи в очередь без форматирования и без ожидания; при переполнении
+    очереди (диск не успевает) запись отбрасывается и учитывается в dropped."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Очередь внутри процесса: запись не нужно сериализовать, форматирует слушатель
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogListener(QueueListener):
+    def stop(self):
+        # Повторная остановка (явная и из atexit) ничего не делает
+        if self._thread is not None:
+            super().stop()
+
+
+def setup_logging(filename=LOG_FILE, level=LOG_LEVEL, levels=LOG_LEVELS, sample=LOG_DEBUG_SAMPLE, json_format=LOG_JSON,
+                  queue_size=LOG_QUEUE_SIZE):
+    """Настраивает корневой логгер: запись в файл идёт в фоновом потоке QueueListener.
+
+    Возвращает запущенный слушатель; при выходе из процесса он останавливается
+    и дописывает очередь.
+    """
+    level = parse_level(level)
+    levels = levels or {}
+    log_queue = queue.Queue(maxsize=queue_size)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(LevelFilter(level, levels, sample))
+
+    file_handler = logging.FileHandler(filename, encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter() if json_format else
+                              logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    listener = LogListener(log_queue, file_handler)
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    # Корневой уровень — самый подробный из настроенных, остальное отсекает LevelFilter
+    root.setLevel(min([level] + [parse_level(value) for value in levels.values()]))
+    for name, value in levels.items():
+        logging.getLogger(name).setLevel(value)
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
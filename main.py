@@ -2,18 +2,87 @@
 # -*- coding: utf-8 -*-
 import asyncio
 import logging
-from config import TRADING_PAIRS, ITERATIONS
+import signal
+import globals
+import metrics
+from config import TRADING_PAIRS, RETRAIN_INTERVAL, STREAM_ENABLED, STREAM_URL, STREAM_TESTNET_URL, CANDLE_STORE_ENABLED, \
+    JOURNAL_ENABLED, JOURNAL_RECONCILE_INTERVAL
+from account import AccountState
+from candle_store import CandleStore
 from exchange import Exchange
+from inference import BatchPredictor, load_backend
+from artifacts import load_latest_artifact
+from retraining import RetrainWorker
+from executor import compute
+from journal import journal, restore_globals, reconcile_state, resolve_orders
+from notifier import notifier
+from logging_setup import setup_logging
+from strategy import PairScanner, evaluate_pair, finalize_report
+from pair_scheduler import PairScheduler
 
-from model import train_models
-from strategy import select_profitable_pairs, trade_pair, finalize_report
 
-# Настройка логирования
-logging.basicConfig(
-    filename='trading_bot.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+async def load_or_train_models(exchange, pairs):
+    """Тёплый старт: свежие совместимые артефакты с диска, обучение — только для пар без них."""
+    models = {}
+    for pair in pairs:
+        artifact = load_latest_artifact(pair)
+        if artifact is not None:
+            models[pair] = (artifact.model, artifact.scaler)
+    missing = [pair for pair in pairs if pair not in models]
+    if missing:
+        logging.info(f"Нет подходящих артефактов моделей для {missing}, обучение")
+        from model import train_models  # TensorFlow импортируется только при обучении
+        store = CandleStore() if CANDLE_STORE_ENABLED else None
+        trained = await train_models(exchange, missing, store=store)
+        for pair, (pred_model, scaler) in trained.items():
+            models[pair] = (load_backend(pred_model), scaler)
+    return models
+
+
+def initial_balance(quote):
+    return {'base': 0.0, 'quote_binance': quote, 'quote_bingx': 0.0, 'entry_price': 0.0, 'total_fees': 0.0,
+            'cost': 0.0, 'revenue': 0.0}
+
+
+async def restore_state(exchange, account, initial_total_usdt):
+    """Балансы пар из журнала со сверкой по бирже или, при первом запуске, новое распределение."""
+    state = journal.open() if JOURNAL_ENABLED else None
+    if not state or not state['balances']:
+        balances = {pair: initial_balance(initial_total_usdt / len(TRADING_PAIRS)) for pair in TRADING_PAIRS}
+        journal.start(initial_total_usdt, balances)
+        journal.snapshot()
+        return balances, initial_total_usdt
+
+    # Пары, добавленные в конфиг после последнего запуска, начинают без средств
+    balances = {pair: dict(state['balances'].get(pair) or initial_balance(0.0)) for pair in TRADING_PAIRS}
+    restore_globals(state)
+    logging.info(f"Балансы восстановлены из журнала: {balances}")
+    try:
+        await reconcile_state(exchange, account, balances, journal)
+    except Exception as e:
+        logging.error(f"Ошибка сверки восстановленного состояния с биржей: {str(e)}")
+    return balances, state['initial_total_usdt'] or initial_total_usdt
+
+
+async def resolve_orders_periodically(exchange, balances):
+    """Итоги ордеров журнала раз в JOURNAL_RECONCILE_INTERVAL: при восстановлении сверять остаётся немного."""
+    while True:
+        await asyncio.sleep(JOURNAL_RECONCILE_INTERVAL)
+        try:
+            await resolve_orders(exchange, balances, journal)
+        except Exception as e:
+            logging.error(f"Ошибка сверки ордеров журнала: {str(e)}")
+
+
+async def start_metrics(exchanges):
+    """Gauge-метрики читаются из состояния бота в момент запроса /metrics."""
+    metrics.LOOP_LAG.set_function(lambda: compute.loop_lag)
+    metrics.OPEN_ORDERS.set_function(lambda: {pair: len(orders) for pair, orders in globals.open_orders.items()})
+    metrics.RATE_LIMIT_BUDGET.set_function(lambda: {name: exchange.scheduler.budget
+                                                    for name, exchange in exchanges.items()})
+    metrics.RATE_LIMIT_QUEUE.set_function(lambda: {name: exchange.scheduler.queue_depth
+                                                   for name, exchange in exchanges.items()})
+    return await metrics.start_server()
 
 
 async def main():
@@ -25,53 +94,78 @@ async def main():
         'bingx': Exchange('binance', testnet=True)  # bingx
     }
 
-    binance_balance = await exchanges['binance'].fetch_balance()
-    logging.info(f"Начальный баланс из API Binance: {binance_balance}")
-    usdt_data = binance_balance.get('USDT', 0)
-    INITIAL_TOTAL_USDT = float(usdt_data['free']) if isinstance(usdt_data, dict) else float(usdt_data)
-
-    # Инициализация и синхронизация баланса
-    balances = {pair: {
-        'base': 0.0,
-        'quote_binance': INITIAL_TOTAL_USDT / len(TRADING_PAIRS),
-        'quote_bingx': 0.0,
-        'entry_price': 0.0,
-        'total_fees': 0.0,
-        'cost': 0.0,
-        'revenue': 0.0
-    } for pair in TRADING_PAIRS}
+    metrics_runner = None
+    if metrics.enabled:
+        metrics_runner = await start_metrics(exchanges)
+
+    account = AccountState(exchanges['binance'])
+    account_task = None
+    if STREAM_ENABLED:
+        exchanges['binance'].start_stream()
+        stream_url = STREAM_TESTNET_URL if exchanges['binance'].testnet else STREAM_URL
+        account_task = asyncio.create_task(account.run_user_stream(stream_url))
+
+    await account.refresh(force=True)
+    logging.info(f"Начальный баланс из API Binance: free={account.free}, used={account.used}")
+    INITIAL_TOTAL_USDT = account.free.get('USDT', 0.0)
+
+    # Инициализация и синхронизация баланса: после перезапуска — из журнала
+    balances, INITIAL_TOTAL_USDT = await restore_state(exchanges['binance'], account, INITIAL_TOTAL_USDT)
     logging.info(f"Распределённый баланс: {balances}")
 
-    pred_model, scaler = await train_models(exchanges['binance'], TRADING_PAIRS[0])
-    if pred_model is None or scaler is None:
+    models = await load_or_train_models(exchanges['binance'], TRADING_PAIRS)
+    if not models:
         logging.error("Не удалось обучить модель, завершение работы")
         for exchange in exchanges.values():
             await exchange.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        journal.close()
         return
 
-    fees = {'binance': 0.001, 'bingx': 0.001}
+    predictor = BatchPredictor(models)
+
+    lag_task = asyncio.create_task(compute.monitor_loop_lag())
+    retrain_task = None
+    if RETRAIN_INTERVAL:
+        retrain_task = asyncio.create_task(RetrainWorker(exchanges['binance'], predictor, list(models)).run())
+    journal_task = None
+    if journal.enabled and JOURNAL_RECONCILE_INTERVAL:
+        journal_task = asyncio.create_task(resolve_orders_periodically(exchanges['binance'], balances))
+
+    scanner = PairScanner(exchanges, predictor, balances)
 
-    for iteration in range(ITERATIONS):
-        # Синхронизация баланса перед каждой итерацией
-        binance_balance = await exchanges['binance'].fetch_balance()
-        total_usdt_actual = binance_balance['free'].get('USDT', 0)
-        logging.info(f"Итерация {iteration + 1}: Реальный баланс USDT на Binance: {total_usdt_actual}")
+    async def handle_pair(pair, reason):
+        await evaluate_pair(exchanges, pair, scanner, balances, account, reason)
 
-        logging.info(f"Начало итерации {iteration + 1}")
-        logging.info(
-            f"Текущий баланс: Total USDT: {sum(b['quote_binance'] for b in balances.values()):.2f}, Детали по парам: {balances}")
-        profitable_pairs = await select_profitable_pairs(exchanges, fees, pred_model, scaler, balances)
-        tasks = [trade_pair(exchanges, pair_data[0], pred_model, scaler, balances, iteration + 1) for pair_data in
-                 profitable_pairs]
-        await asyncio.gather(*tasks)
-        logging.info(f"Конец итерации {iteration + 1}")
-        await asyncio.sleep(5)
+    # Каждая пара обрабатывается по своим событиям до SIGINT/SIGTERM
+    scheduler = PairScheduler(exchanges['binance'], list(models), handle_pair)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, scheduler.stop)
+    await scheduler.run()
+    logging.info(f"Бюджет запросов Binance: {exchanges['binance'].scheduler.status()}")
 
+    if retrain_task is not None:
+        retrain_task.cancel()
+    lag_task.cancel()
+    if journal_task is not None:
+        journal_task.cancel()
+    if account_task is not None:
+        account_task.cancel()
     await finalize_report(exchanges, balances, INITIAL_TOTAL_USDT)
+    journal.snapshot()
+    journal.close()
+    compute.close()
 
     for exchange in exchanges.values():
         await exchange.close()
+    await notifier.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
 
 if __name__ == "__main__":
+    # Запись лога в файл идёт в фоновом потоке, а не в цикле событий
+    setup_logging()
     asyncio.run(main())
 
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# market_stream.py
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+import aiohttp
+from price_calculator import DepthBook
+from config import STREAM_DEPTH_LIMIT, STREAM_KLINE_HISTORY, STREAM_STALE_AFTER, STREAM_RECONNECT_DELAY
+
+
+def stream_symbol(pair):
+    return pair.replace('/', '').lower()
+
+
+class LocalOrderBook:
+    """Локальный стакан Binance: снимок REST плюс diff-события с проверкой последовательности.
+
+    До загрузки снимка события копятся в буфере. После снимка применяются
+    только события с u > lastUpdateId, и каждое из них должно начинаться не
+    позже lastUpdateId + 1; пропуск означает разрыв и рассинхронизацию стакана.
+    """
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.depth = DepthBook()
+        self.last_update_id = None
+        self.synced = False
+        self.updated_at = None
+        self.buffer = []
+
+    def reset(self):
+        self.synced = False
+        self.last_update_id = None
+        self.buffer = []
+
+    def on_diff(self, event):
+        """Применяет diff-событие. Возвращает False, если обнаружен разрыв и нужен новый снимок."""
+        if not self.synced:
+            self.buffer.append(event)
+            return True
+        if event['u'] <= self.last_update_id:
+            return True
+        if event['U'] > self.last_update_id + 1:
+            logging.warning(f"{self.symbol}: разрыв в потоке стакана ({self.last_update_id} -> {event['U']})")
+            self.synced = False
+            self.buffer = [event]
+            return False
+        self._apply(event)
+        return True
+
+    def load_snapshot(self, snapshot):
+        """Загружает снимок {'bids', 'asks', 'nonce'} и догоняет его буфером.
+
+        Возвращает False, если снимок не стыкуется с буфером и его надо запросить снова.
+        """
+        last_update_id = snapshot['nonce']
+        pending = [event for event in self.buffer if event['u'] > last_update_id]
+        if pending and pending[0]['U'] > last_update_id + 1:
+            return False
+        self.depth = DepthBook(snapshot['bids'], snapshot['asks'])
+        self.last_update_id = last_update_id
+        for event in pending:
+            if event['U'] > self.last_update_id + 1:
+                return False
+            self._apply(event)
+        self.buffer = []
+        self.synced = True
+        self.updated_at = time.time()
+        return True
+
+    def _apply(self, event):
+        self.depth.apply_diff(event['b'], event['a'])
+        self.last_update_id = event['u']
+        self.updated_at = time.time()
+
+    def to_dict(self, limit=None):
+        return dict(self.depth.to_dict(limit), symbol=self.symbol, nonce=self.last_update_id,
+                    timestamp=int(self.updated_at * 1000) if self.updated_at else None)
+
+
+class MarketStream:
+    """Потоковые стаканы, лучшие цены и минутные свечи Binance через combined websocket.
+
+    rest — клиент ccxt (fetch_order_book, fetch_ohlcv) для снимков стакана и
+    начальной истории свечей. Данные отдаются только пока поток здоров: есть
+    соединение и последнее сообщение не старше STREAM_STALE_AFTER секунд;
+    иначе методы возвращают None и Exchange идёт в REST.
+    """
+
+    def __init__(self, rest, symbols, url, depth_limit=STREAM_DEPTH_LIMIT, kline_history=STREAM_KLINE_HISTORY,
+                 stale_after=STREAM_STALE_AFTER, reconnect_delay=STREAM_RECONNECT_DELAY):
+        self.rest = rest
+        self.symbols = list(symbols)
+        self.by_stream_symbol = {stream_symbol(pair): pair for pair in self.symbols}
+        self.url = url.rstrip('/')
+        self.depth_limit = depth_limit
+        self.kline_history = kline_history
+        self.stale_after = stale_after
+        self.reconnect_delay = reconnect_delay
+        self.books = {pair: LocalOrderBook(pair) for pair in self.symbols}
+        self.tickers = {}
+        self.candles = {pair: deque(maxlen=kline_history) for pair in self.symbols}
+        self.candles_ready = set()
+        self.connected = False
+        self.last_message = 0.0
+        self.running = False
+        self._tasks = set()
+        self._book_tasks = {}  # pair -> задача синхронизации стакана
+        self._updates = {}  # pair -> asyncio.Event, выставляется при новой цене
+
+    @property
+    def stream_url(self):
+        streams = []
+        for pair in self.symbols:
+            symbol = stream_symbol(pair)
+            streams += [f"{symbol}@depth@100ms", f"{symbol}@bookTicker", f"{symbol}@kline_1m"]
+        return f"{self.url}/stream?streams={'/'.join(streams)}"
+
+    def healthy(self):
+        return self.connected and time.monotonic() - self.last_message <= self.stale_after
+
+    def ticker(self, pair):
+        ticker = self.tickers.get(pair)
+        if ticker is None or not self.healthy():
+            return None
+        return dict(ticker)
+
+    def order_book(self, pair, limit=None):
+        book = self.books.get(pair)
+        if book is None or not book.synced or not self.healthy():
+            return None
+        return book.to_dict(limit)
+
+    def depth_book(self, pair):
+        """Копия стакана пары в виде DepthBook или None, если он не синхронизирован."""
+        book = self.books.get(pair)
+        if book is None or not book.synced or not self.healthy():
+            return None
+        return book.depth.copy()
+
+    def ohlcv(self, pair, timeframe='1m', since=None, limit=100):
+        """Свечи из потока в формате fetch_ohlcv или None, если их недостаточно для ответа."""
+        if timeframe != '1m' or pair not in self.candles_ready or not self.healthy():
+            return None
+        candles = self.candles[pair]
+        if since is None:
+            return [list(c) for c in list(candles)[-limit:]] if len(candles) >= limit else None
+        if not candles or candles[0][0] > since:
+            return None
+        return [list(c) for c in candles if c[0] >= since][:limit]
+
+    async def wait_update(self, pair, timeout):
+        """Ждёт обновления лучших цен пары не дольше timeout секунд."""
+        event = self._updates.setdefault(pair, asyncio.Event())
+        event.clear()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        self.running = True
+        async with aiohttp.ClientSession() as session:
+            while self.running:
+                try:
+                    async with session.ws_connect(self.stream_url, heartbeat=20) as ws:
+                        self.connected = True
+                        self.last_message = time.monotonic()
+                        logging.info(f"Поток рынка подключён: {len(self.symbols)} пар")
+                        for pair in self.symbols:
+                            self._resync_book(pair)
+                            self._spawn(self._seed_candles(pair))
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                self.last_message = time.monotonic()
+                                self.handle(json.loads(msg.data))
+                            elif msg.type in (aiohttp.WSMsgType.ERROR, aiohttp.WSMsgType.CLOSED):
+                                break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logging.error(f"Ошибка потока рынка: {str(e)}")
+                finally:
+                    self._disconnect()
+                if self.running:
+                    await asyncio.sleep(self.reconnect_delay)
+
+    def stop(self):
+        self.running = False
+        for task in list(self._tasks):
+            task.cancel()
+
+    def _disconnect(self):
+        self.connected = False
+        # Снимки стакана и история свечей прошлого соединения после переподключения не нужны
+        for task in list(self._tasks):
+            task.cancel()
+        for book in self.books.values():
+            book.reset()
+        # Свечи за время разрыва поток не пришлёт: история заново загружается из REST
+        for candles in self.candles.values():
+            candles.clear()
+        self.candles_ready.clear()
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _resync_book(self, pair):
+        # Уже идущая синхронизация подхватит новые события из буфера сама
+        task = self._book_tasks.get(pair)
+        if task is None or task.done():
+            self._book_tasks[pair] = self._spawn(self._sync_book(pair))
+
+    def handle(self, message):
+        data = message.get('data', message)
+        stream = message.get('stream', '')
+        symbol = stream.split('@', 1)[0] if stream else str(data.get('s', '')).lower()
+        pair = self.by_stream_symbol.get(symbol)
+        if pair is None:
+            return
+        if '@depth' in stream or data.get('e') == 'depthUpdate':
+            if not self.books[pair].on_diff(data):
+                self._resync_book(pair)
+        elif '@bookTicker' in stream or ('b' in data and 'a' in data and 'e' not in data):
+            ticker = self.tickers.get(pair, {})
+            self.tickers[pair] = {
+                'symbol': pair,
+                'bid': float(data['b']),
+                'bidVolume': float(data['B']),
+                'ask': float(data['a']),
+                'askVolume': float(data['A']),
+                'last': ticker.get('last'),
+                'timestamp': int(time.time() * 1000),
+            }
+            if pair in self._updates:
+                self._updates[pair].set()
+        elif data.get('e') == 'kline':
+            k = data['k']
+            candle = [int(k['t']), float(k['o']), float(k['h']), float(k['l']), float(k['c']), float(k['v'])]
+            candles = self.candles[pair]
+            if candles and candles[-1][0] == candle[0]:
+                candles[-1] = candle
+            elif not candles or candles[-1][0] < candle[0]:
+                candles.append(candle)
+            if pair in self.tickers:
+                self.tickers[pair]['last'] = candle[4]
+
+    async def _sync_book(self, pair, attempts=5):
+        book = self.books[pair]
+        for _ in range(attempts):
+            try:
+                snapshot = await self.rest.fetch_order_book(pair, self.depth_limit)
+                if book.load_snapshot(snapshot):
+                    logging.info(f"{pair}: стакан синхронизирован, lastUpdateId={book.last_update_id}")
+                    return
+            except Exception as e:
+                logging.error(f"{pair}: ошибка загрузки снимка стакана: {str(e)}")
+            await asyncio.sleep(self.reconnect_delay)
+        logging.error(f"{pair}: не удалось синхронизировать стакан")
+
+    async def _seed_candles(self, pair):
+        try:
+            history = await self.rest.fetch_ohlcv(pair, '1m', limit=self.kline_history)
+            candles = self.candles[pair]
+            # Свечи из потока свежее REST-истории, включая ещё формирующуюся
+            streamed = list(candles)
+            first_streamed = streamed[0][0] if streamed else float('inf')
+            candles.clear()
+            candles.extend(list(c) for c in history if c[0] < first_streamed)
+            candles.extend(streamed)
+            self.candles_ready.add(pair)
+        except Exception as e:
+            logging.error(f"{pair}: ошибка загрузки истории свечей для потока: {str(e)}")
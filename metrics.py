@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# metrics.py
+import asyncio
+import bisect
+import functools
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from aiohttp import web
+from config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT, METRICS_BUCKETS
+
+# Выключенные метрики ничего не считают: проверка одного флага на вызов
+enabled = METRICS_ENABLED
+
+
+def enable(flag=True):
+    global enabled
+    enabled = flag
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += self._samples()
+        return lines
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        if not enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+
+class Gauge(Metric):
+    """Текущее значение: задаётся через set или считается функцией func при каждом чтении.
+
+    func без меток возвращает число, с метками — словарь {кортеж меток: значение}.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), func=None, registry=None):
+        super().__init__(name, documentation, labels, registry)
+        self.func = func
+
+    def set(self, value, *labels):
+        if not enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+    def set_function(self, func):
+        self.func = func
+
+    def _samples(self):
+        if self.func is not None:
+            try:
+                values = self.func()
+            except Exception as e:
+                logging.error(f"Ошибка вычисления метрики {self.name}: {str(e)}")
+                return []
+            if values is None:
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+            with self._lock:
+                self._values = {labels if isinstance(labels, tuple) else (labels,): value
+                                for labels, value in values.items()}
+        return super()._samples()
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными границами корзин; хранит число попаданий по корзинам,
+    сумму и количество наблюдений для каждого набора меток."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=METRICS_BUCKETS, registry=None):
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        if not enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, *labels):
+        state = self._values.get(labels)
+        return state[2] if state else 0
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def _samples(self):
+        with self._lock:
+            values = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        lines = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket
+                labels = _format_labels(self.labels, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self.metrics[metric.name] = metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self.metrics.values():
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = Histogram('exchange_request_seconds', "Время запроса к бирже без ожидания бюджета", ('method',))
+REQUESTS = Counter('exchange_requests_total', "Запросы к бирже", ('exchange', 'method'))
+ERRORS = Counter('exchange_errors_total', "Запросы к бирже, завершившиеся ошибкой", ('exchange', 'method'))
+RETRIES = Counter('exchange_retries_total', "Повторы запросов после временных ошибок", ('method',))
+RATE_LIMIT_WAIT = Histogram('rate_limit_wait_seconds', "Ожидание бюджета запросов", ('priority',))
+STAGE_LATENCY = Histogram('stage_seconds', "Время этапов обработки: данные, признаки, модель, стратегия", ('stage',))
+CACHE = Counter('cache_requests_total', "Обращения к кэшам по результату", ('cache', 'result'))
+LOOP_LAG = Gauge('event_loop_lag_seconds', "Последняя измеренная задержка цикла событий")
+OPEN_ORDERS = Gauge('open_orders', "Отслеживаемые открытые ордера", ('pair',))
+RATE_LIMIT_BUDGET = Gauge('rate_limit_budget', "Оставшийся вес запросов в окне", ('exchange',))
+RATE_LIMIT_QUEUE = Gauge('rate_limit_queue', "Запросы в очереди планировщика", ('exchange',))
+
+
+def timed(stage):
+    """Декоратор: время вызова функции (обычной или корутины) в STAGE_LATENCY с меткой stage."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not enabled:
+                    return await func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    STAGE_LATENCY.observe(time.perf_counter() - start, stage)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    STAGE_LATENCY.observe(time.perf_counter() - start, stage)
+        return wrapper
+    return decorator
+
+
+async def start_server(host=METRICS_HOST, port=METRICS_PORT, registry=REGISTRY):
+    """HTTP-эндпоинт /metrics в текстовом формате Prometheus; возвращает runner для cleanup()."""
+
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -1,54 +1,162 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import tensorflow as tf
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import LSTM, Dense, GRU
 from sklearn.preprocessing import MinMaxScaler
 import logging
-from data import get_historical_data, prepare_lstm_data, add_features
-from config import LOOKBACK
+from data import FEATURES, prepare_training_data
+from artifacts import save_artifact
+from candle_store import training_windows
+from config import LOOKBACK, TRAINING_MODE, TRAINING_WORKERS, TRAINING_THREADS_PER_JOB, TRAINING_EPOCHS, \
+    TRAINING_BATCH_SIZE
 
-async def train_models(exchange, pair):
+def _init_training_worker(threads):
+    # Ограничиваем потоки TensorFlow до первой операции, чтобы задачи не делили ядра
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+
+def windows_dataset(sources, batch_size=TRAINING_BATCH_SIZE):
+    """tf.data поверх TrainingWindows: пачки читаются из хранилища заново на каждой эпохе."""
+    def generate():
+        for source in sources:
+            yield from source.batches(batch_size)
+
+    signature = (tf.TensorSpec((None, LOOKBACK, len(FEATURES)), tf.float32), tf.TensorSpec((None,), tf.int64))
+    return tf.data.Dataset.from_generator(generate, output_signature=signature).prefetch(2)
+
+
+def evaluate_windows(model, sources, batch_size=1024):
+    correct = samples = 0
+    for source in sources:
+        for X, y in source.batches(batch_size, shuffle=False):
+            correct += int(np.sum((model.predict(X, verbose=0).flatten() > 0.5) == y))
+            samples += len(y)
+    return correct / samples if samples else 0.0, samples
+
+
+def train_job(name, architecture, X, y, epochs=TRAINING_EPOCHS):
+    """Обучает одну архитектуру на одном наборе данных; выполняется в процессе пула.
+
+    При y=None X — список TrainingWindows, и окна читаются из хранилища свечей по частям.
+    """
+    start = time.perf_counter()
+    model = ARCHITECTURES[architecture]((LOOKBACK, len(FEATURES)))
+    if y is None:
+        model.fit(windows_dataset(X), epochs=epochs, verbose=0)
+        accuracy, samples = evaluate_windows(model, X)
+    else:
+        model.fit(X, y, epochs=epochs, batch_size=TRAINING_BATCH_SIZE, verbose=0)
+        accuracy, samples = evaluate_model(model, X, y), len(X)
+    return {
+        'name': name,
+        'architecture': architecture,
+        'weights': model.get_weights(),
+        'accuracy': float(accuracy),
+        'samples': int(samples),
+        'wall_time': time.perf_counter() - start,
+    }
+
+
+async def run_training_jobs(jobs, workers, threads):
+    """train_job для каждой пары (набор данных, архитектура) в пуле процессов.
+
+    Ошибка задачи возвращается в списке результатов как исключение и не
+    прерывает остальные задачи.
+    """
+    loop = asyncio.get_running_loop()
+    # spawn, а не fork: дочерний процесс не наследует состояние TensorFlow родителя
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_training_worker, initargs=(threads,)) as pool:
+        return await asyncio.gather(*(
+            loop.run_in_executor(pool, train_job, name, architecture, X, y)
+            for name, (X, y) in jobs.items() for architecture in ARCHITECTURES
+        ), return_exceptions=True)
+
+
+async def train_models(exchange, pairs, mode=TRAINING_MODE, workers=TRAINING_WORKERS,
+                       threads=TRAINING_THREADS_PER_JOB, store=None):
+    """Обучает LSTM и GRU по всем парам параллельно в пуле процессов.
+
+    mode='per_pair' — своя модель на каждую пару, mode='pooled' — одна модель
+    на объединённых данных всех пар (скейлер у каждой пары свой). Для каждой
+    модели выбирается архитектура с лучшей точностью. Со store (CandleStore)
+    история догружается в локальное хранилище и окна читаются из него
+    потоком, иначе обучение идёт на LOOKBACK + 100 свечах с биржи. Возвращает
+    {pair: (model, scaler)}.
+    """
     try:
-        # Получение исторических данных с биржи
-        historical_data = await get_historical_data(exchange, pair, limit=LOOKBACK + 100)
-        if historical_data is None or historical_data.empty:
-            logging.error(f"Не удалось получить исторические данные для {pair}")
-            return None, None
-
-        # Добавление признаков
-        data_with_features = await add_features(historical_data)
-        if data_with_features is None or data_with_features.empty:
-            logging.error(f"Не удалось добавить признаки для {pair}")
-            return None, None
-
-        # Подготовка данных для LSTM
-        X, y, scaler = prepare_lstm_data(data_with_features)
-        if X.size == 0 or y.size == 0:
-            logging.error(f"Подготовленные данные для {pair} пусты: X={X.shape}, y={y.shape}")
-            return None, None
-
-        logging.info(f"Подготовлены данные для LSTM: X.shape={X.shape}, y.mean={np.mean(y):.4f}")
-
-        # Построение LSTM модели
-        lstm_model = build_lstm_model((X.shape[1], X.shape[2]))
-        lstm_model.fit(X, y, epochs=10, batch_size=32, verbose=0)
-        lstm_accuracy = evaluate_model(lstm_model, X, y)
-        logging.info(f"Модель LSTM обучена, средняя точность: {lstm_accuracy:.4f}")
-
-        # Построение GRU модели
-        gru_model = build_gru_model((X.shape[1], X.shape[2]))
-        gru_model.fit(X, y, epochs=10, batch_size=32, verbose=0)
-        gru_accuracy = evaluate_model(gru_model, X, y)
-        logging.info(f"Модель GRU обучена, средняя точность: {gru_accuracy:.4f}")
+        if mode not in ('pooled', 'per_pair'):
+            raise ValueError(f"Неизвестный режим обучения: {mode}")
+        if store is not None:
+            prepared = await asyncio.gather(*(training_windows(exchange, store, pair) for pair in pairs))
+            datasets = {pair: windows for pair, windows in zip(pairs, prepared) if windows is not None}
+            scalers = {pair: windows.scaler for pair, windows in datasets.items()}
+            spans = {pair: windows.time_range() for pair, windows in datasets.items()}
+            if mode == 'pooled':
+                jobs = {'pooled': (list(datasets.values()), None)}
+            else:
+                jobs = {pair: ([windows], None) for pair, windows in datasets.items()}
+        else:
+            prepared = await asyncio.gather(*(prepare_training_data(exchange, pair) for pair in pairs))
+            datasets = {pair: data for pair, data in zip(pairs, prepared) if data is not None}
+            scalers = {pair: data[2] for pair, data in datasets.items()}
+            spans = {pair: (data[3]['timestamp'].iloc[0], data[3]['timestamp'].iloc[-1])
+                     for pair, data in datasets.items()}
+            if mode == 'pooled':
+                jobs = {'pooled': (np.concatenate([d[0] for d in datasets.values()]),
+                                   np.concatenate([d[1] for d in datasets.values()]))}
+            else:
+                jobs = {pair: (d[0], d[1]) for pair, d in datasets.items()}
+        if not datasets:
+            return {}
+        groups = {'pooled': list(datasets)} if mode == 'pooled' else {pair: [pair] for pair in datasets}
+
+        start = time.perf_counter()
+        results = await run_training_jobs(jobs, workers, threads)
+        logging.info(f"Обучение {len(results)} моделей заняло {time.perf_counter() - start:.1f} с ({workers} процессов)")
 
         # Выбор модели с лучшей точностью
-        pred_model = lstm_model if lstm_accuracy > gru_accuracy else gru_model
-        return pred_model, scaler
+        best = {}
+        for result in results:
+            if isinstance(result, Exception):
+                logging.error(f"Ошибка в задаче обучения: {str(result)}")
+                continue
+            logging.info(f"Модель {result['architecture'].upper()} для {result['name']} обучена: "
+                         f"точность {result['accuracy']:.4f}, {result['samples']} примеров, {result['wall_time']:.1f} с")
+            if result['name'] not in best or result['accuracy'] >= best[result['name']]['accuracy']:
+                best[result['name']] = result
+
+        models = {}
+        for name, result in best.items():
+            pred_model = ARCHITECTURES[result['architecture']]((LOOKBACK, len(FEATURES)))
+            pred_model.set_weights(result['weights'])
+            for pair in groups[name]:
+                scaler = scalers[pair]
+                train_start, train_end = spans[pair]
+                try:
+                    save_artifact(pair, pred_model, scaler, {
+                        'architecture': result['architecture'],
+                        'accuracy': result['accuracy'],
+                        'samples': result['samples'],
+                        'mode': mode,
+                        'train_start': str(train_start),
+                        'train_end': str(train_end),
+                    })
+                except Exception as e:
+                    logging.error(f"Не удалось сохранить артефакт модели {pair}: {str(e)}")
+                models[pair] = (pred_model, scaler)
+        return models
 
     except Exception as e:
         logging.error(f"Ошибка в train_models: {str(e)}")
-        return None, None
+        return {}
 
 def build_lstm_model(input_shape):
     model = Sequential()
@@ -70,3 +178,6 @@ def evaluate_model(model, X, y):
     predictions = model.predict(X, verbose=0)
     accuracy = np.mean((predictions.flatten() > 0.5) == y)
     return accuracy
+
+
+ARCHITECTURES = {'lstm': build_lstm_model, 'gru': build_gru_model}
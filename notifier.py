@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# notifier.py
+import asyncio
+import logging
+from collections import deque, Counter
+import aiohttp
+from config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, TELEGRAM_API_URL, NOTIFY_QUEUE_SIZE, NOTIFY_DIGEST_WINDOW, \
+    NOTIFY_MIN_INTERVAL, NOTIFY_RETRIES
+
+MAX_MESSAGE_LENGTH = 4096  # Ограничение Telegram на длину сообщения
+
+
+class Notifier:
+    """Фоновая очередь уведомлений в Telegram.
+
+    notify только кладёт сообщение в ограниченную очередь и сразу возвращается;
+    при переполнении отбрасываются самые старые сообщения и считаются в dropped.
+    Фоновая задача собирает всплеск за digest_window секунд в одно сообщение
+    (одинаковые строки схлопываются со счётчиком), отправляет не чаще раза в
+    min_interval секунд через одну переиспользуемую HTTP-сессию и соблюдает
+    retry_after из ответа 429.
+    """
+
+    def __init__(self, token=TELEGRAM_BOT_TOKEN, chat_id=TELEGRAM_CHAT_ID, api_url=TELEGRAM_API_URL,
+                 queue_size=NOTIFY_QUEUE_SIZE, digest_window=NOTIFY_DIGEST_WINDOW, min_interval=NOTIFY_MIN_INTERVAL,
+                 retries=NOTIFY_RETRIES):
+        self.token = token
+        self.chat_id = chat_id
+        self.api_url = api_url.rstrip('/')
+        self.digest_window = digest_window
+        self.min_interval = min_interval
+        self.retries = retries
+        self.queue = deque(maxlen=queue_size)
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.coalesced = 0
+        self._wakeup = None
+        self._worker = None
+        self._session = None
+        self._next_send = 0.0
+
+    @property
+    def enabled(self):
+        return bool(self.token and self.chat_id)
+
+    def notify(self, message):
+        """Ставит сообщение в очередь без ожидания; отправка идёт в фоне."""
+        if not self.enabled:
+            logging.info(f"Telegram не настроен, сообщение: {message}")
+            return
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(message)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # вне цикла событий сообщение дождётся следующего notify внутри цикла
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+        self._wakeup.set()
+
+    def stats(self):
+        return {'queued': len(self.queue), 'sent': self.sent, 'dropped': self.dropped, 'failed': self.failed,
+                'coalesced': self.coalesced}
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            # Даём всплеску набраться, чтобы отправить его одним сообщением
+            await asyncio.sleep(max(self.digest_window, self._next_send - loop.time()))
+            self._wakeup.clear()
+            batch = list(self.queue)
+            self.queue.clear()
+            if batch:
+                try:
+                    await self._deliver(batch)
+                except asyncio.CancelledError:
+                    self.queue.extendleft(reversed(batch))  # close() отправит их сам
+                    raise
+
+    @staticmethod
+    def digest(batch):
+        counts = Counter(batch)
+        lines = [message if counts[message] == 1 else f"{message} (×{counts[message]})" for message in counts]
+        text = lines[0] if len(lines) == 1 else f"Уведомлений: {len(batch)}\n" + "\n".join(lines)
+        return [text[i:i + MAX_MESSAGE_LENGTH] for i in range(0, len(text), MAX_MESSAGE_LENGTH)]
+
+    async def _deliver(self, batch):
+        self.coalesced += len(batch) - 1
+        for text in self.digest(batch):
+            if await self._send(text):
+                self.sent += 1
+                logging.info(f"Telegram сообщение: {text}")
+            else:
+                self.failed += 1
+
+    async def _send(self, text):
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        url = f"{self.api_url}/bot{self.token}/sendMessage"
+        for attempt in range(self.retries + 1):
+            await asyncio.sleep(max(0.0, self._next_send - loop.time()))
+            self._next_send = loop.time() + self.min_interval
+            try:
+                async with self._session.post(url, json={'chat_id': self.chat_id, 'text': text}) as response:
+                    if response.status == 200:
+                        return True
+                    body = await response.json(content_type=None)
+                    retry_after = (body.get('parameters') or {}).get('retry_after')
+                    logging.error(f"Ошибка отправки сообщения в Telegram: HTTP {response.status}, "
+                                  f"{body.get('description')}")
+                    if response.status == 429 and retry_after:
+                        self._next_send = loop.time() + float(retry_after)
+                    elif response.status < 500:
+                        return False
+            except Exception as e:
+                logging.error(f"Ошибка отправки сообщения в Telegram: {str(e)}")
+        return False
+
+    async def close(self, timeout=5):
+        """Отправляет накопленное (не дольше timeout секунд) и закрывает сессию."""
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        if self.queue:
+            batch = list(self.queue)
+            self.queue.clear()
+            try:
+                await asyncio.wait_for(self._deliver(batch), timeout)
+            except asyncio.TimeoutError:
+                self.dropped += len(batch)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        logging.info(f"Уведомления: {self.stats()}")
+
+
+notifier = Notifier()
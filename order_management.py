@@ -2,36 +2,129 @@
 # -*- coding: utf-8 -*-
 import logging
 import asyncio
+from collections import defaultdict
 from exchange import manage_request, send_telegram_message
+from config import TICKER_MAX_AGE
+
+FINISHED_STATUSES = ('closed', 'canceled', 'cancelled', 'expired', 'rejected')
+
+
+async def fetch_open_orders_by_pair(exchange, pairs):
+    """Открытые ордера по парам: по запросу на пару параллельно или одним запросом на все,
+    если так дешевле по весу (6 на пару против 80 за все символы)."""
+    if len(pairs) * 6 >= 80:
+        orders = await manage_request(exchange, 'fetch_open_orders')
+        by_pair = {pair: [] for pair in pairs}
+        for order in orders:
+            if order['symbol'] in by_pair:
+                by_pair[order['symbol']].append(order)
+        return by_pair
+    results = await asyncio.gather(*(manage_request(exchange, 'fetch_open_orders', pair) for pair in pairs))
+    return dict(zip(pairs, results))
+
+
+async def fetch_finished_orders(exchange, finished):
+    """Итоговые статусы ордеров, пропавших из открытых: один fetch_orders на пару."""
+    async def sweep(pair, orders):
+        since = min((order.get('timestamp') for order in orders if order.get('timestamp')), default=None)
+        statuses = {o['id']: o for o in await manage_request(exchange, 'fetch_orders', pair, since)}
+        for order in orders:
+            # Ордер старше окна fetch_orders запрашивается отдельно
+            if order['id'] not in statuses:
+                statuses[order['id']] = await manage_request(exchange, 'fetch_order', order['id'], pair)
+        return statuses
+
+    pairs = list(finished)
+    results = await asyncio.gather(*(sweep(pair, finished[pair]) for pair in pairs))
+    return dict(zip(pairs, results))
+
+
+def apply_fills(balances, fills):
+    """Применяет исполнения пачкой: по одному изменению баланса на пару."""
+    for pair, (base_delta, quote_delta) in fills.items():
+        balances[pair]['base'] += base_delta
+        balances[pair]['quote_binance'] += quote_delta
+
+
+async def reconcile_orders(exchange, balances, atrs, open_orders):
+    """Сверяет все отслеживаемые ордера за один проход.
+
+    Открытые ордера запрашиваются одним заходом на пару (или на все пары),
+    цены берутся из одного снимка рынка, отмены идут параллельно, исполнения
+    применяются к балансам пачкой, уведомление отправляется одно на проход.
+    """
+    pairs = [pair for pair in atrs if open_orders.get(pair)]
+    if not pairs:
+        return
+    open_by_pair = await fetch_open_orders_by_pair(exchange, pairs)
+    try:
+        tickers = await exchange.market_snapshot(max_age=TICKER_MAX_AGE)
+    except Exception as e:
+        logging.error(f"Ошибка получения снимка рынка при сверке ордеров: {str(e)}")
+        tickers = {}
+
+    finished = defaultdict(list)
+    to_cancel = []
+    for pair in pairs:
+        live = {order['id']: order for order in open_by_pair[pair]}
+        for order in open_orders[pair]:
+            status = live.get(order['id'])
+            if status is None:
+                finished[pair].append(order)
+                continue
+            ticker = tickers.get(pair) or await exchange.fetch_ticker(pair, max_age=TICKER_MAX_AGE)
+            current_price = ticker['last']
+            atr = atrs[pair]
+            if (order['side'] == 'buy' and current_price < status['price'] * (1 - atr)) or \
+                    (order['side'] == 'sell' and current_price > status['price'] * (1 + atr)):
+                to_cancel.append((pair, order))
+
+    async def cancel_all():
+        return await asyncio.gather(*(manage_request(exchange, 'cancel_order', order['id'], pair)
+                                      for pair, order in to_cancel), return_exceptions=True)
+
+    # Отмены и статусы завершённых ордеров запрашиваются одновременно; ошибка статусов
+    # не должна терять уже отправленные отмены, иначе следующий проход отменит их повторно
+    results, statuses = await asyncio.gather(cancel_all(), fetch_finished_orders(exchange, finished),
+                                             return_exceptions=True)
+    if isinstance(results, BaseException):
+        raise results
+    if isinstance(statuses, BaseException):
+        # Завершённые ордера остаются в open_orders и сверяются на следующем проходе
+        logging.error(f"Ошибка получения статусов завершённых ордеров: {str(statuses)}")
+        statuses = {}
+    messages = []
+    for (pair, order), result in zip(to_cancel, results):
+        if isinstance(result, Exception):
+            logging.error(f"{pair}: не удалось отменить ордер {order['id']}: {str(result)}")
+            continue
+        logging.info(f"{pair}: Ордер {order['id']} отменён из-за ATR")
+        messages.append(f"{pair}: Ордер {order['id']} отменён из-за ATR")
+        # Ответ на отмену уже содержит исполненный объём — отдельный fetch_order не нужен
+        finished[pair].append(order)
+        statuses.setdefault(pair, {})[order['id']] = dict(result, status=result.get('status') or 'canceled')
+
+    fills = defaultdict(lambda: [0.0, 0.0])
+    for pair, orders in finished.items():
+        for order in orders:
+            status = statuses.get(pair, {}).get(order['id'])
+            if status is None or status['status'] not in FINISHED_STATUSES:
+                continue
+            filled = status.get('filled') or 0
+            price = status.get('average') or status.get('price') or order.get('price', 0)
+            sign = 1 if order['side'] == 'buy' else -1
+            fills[pair][0] += sign * filled
+            fills[pair][1] -= sign * filled * price
+            logging.info(f"{pair}: Ордер {order['id']} завершён, статус: {status['status']}, исполнено: {filled}")
+            open_orders[pair].remove(order)
+    apply_fills(balances, fills)
+
+    if messages:
+        await send_telegram_message("\n".join(messages))
 
 
 async def check_and_cancel_orders(exchange, pair, balances, atr, open_orders):
     try:
-        for order in open_orders[pair][:]:  # Копируем список, чтобы избежать изменения во время итерации
-            order_id = order['id']
-            order_status = await manage_request(exchange, 'fetch_order', order_id, pair)
-            if order_status['status'] == 'closed':
-                logging.info(f"{pair}: Ордер {order_id} закрыт, статус: {order_status['status']}")
-                if order['side'] == 'buy':
-                    filled_amount = order_status.get('filled', 0)
-                    balances[pair]['base'] += filled_amount
-                    balances[pair]['quote_binance'] -= filled_amount * order_status['price']
-                elif order['side'] == 'sell':
-                    filled_amount = order_status.get('filled', 0)
-                    balances[pair]['base'] -= filled_amount
-                    balances[pair]['quote_binance'] += filled_amount * order_status['price']
-                open_orders[pair].remove(order)
-            elif order_status['status'] == 'open':
-                current_price = (await exchange.fetch_ticker(pair))['last']
-                if order['side'] == 'buy' and current_price < order_status['price'] * (1 - atr):
-                    await manage_request(exchange, 'cancel_order', order_id, pair)
-                    logging.info(f"{pair}: Ордер {order_id} отменён из-за ATR")
-                    await send_telegram_message(f"{pair}: Ордер {order_id} отменён из-за ATR")
-                    open_orders[pair].remove(order)
-                elif order['side'] == 'sell' and current_price > order_status['price'] * (1 + atr):
-                    await manage_request(exchange, 'cancel_order', order_id, pair)
-                    logging.info(f"{pair}: Ордер {order_id} отменён из-за ATR")
-                    await send_telegram_message(f"{pair}: Ордер {order_id} отменён из-за ATR")
-                    open_orders[pair].remove(order)
+        await reconcile_orders(exchange, balances, {pair: atr}, open_orders)
     except Exception as e:
         logging.error(f"Ошибка при проверке ордеров для {pair}: {str(e)}")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# pair_scheduler.py
+import asyncio
+import logging
+import time
+from collections import Counter
+import globals
+from config import PAIR_CONCURRENCY, PAIR_MOVE_THRESHOLD, PAIR_MAX_INTERVAL, PAIR_POLL_INTERVAL, \
+    PAIR_CANDLE_DELAY, PAIR_SHUTDOWN_TIMEOUT, TICKER_MAX_AGE
+from data import timeframe_to_ms
+
+
+class PairState:
+    def __init__(self):
+        self.last_run = float('-inf')
+        self.reference_price = None
+        self.next_candle = None
+        self.busy = False
+        self.triggers = Counter()
+        self.errors = 0
+        self.run_time_max = 0.0
+
+
+class PairScheduler:
+    """Долгоживущий планировщик: у каждой пары своя задача, которая срабатывает по событию.
+
+    События — закрытие свечи timeframe, движение цены на move_threshold от цены
+    последнего запуска и дедлайн max_interval без запусков. Для пары одновременно
+    выполняется не больше одного обработчика, а события, пришедшие за время его
+    работы, сливаются в один следующий запуск. Общее число одновременных
+    обработчиков ограничено concurrency. Остановка — через globals.running и stop().
+    """
+
+    def __init__(self, exchange, pairs, handler, timeframe='1m', concurrency=PAIR_CONCURRENCY,
+                 move_threshold=PAIR_MOVE_THRESHOLD, max_interval=PAIR_MAX_INTERVAL, poll_interval=PAIR_POLL_INTERVAL,
+                 candle_delay=PAIR_CANDLE_DELAY, shutdown_timeout=PAIR_SHUTDOWN_TIMEOUT):
+        self.exchange = exchange
+        self.pairs = list(pairs)
+        self.handler = handler
+        self.timeframe_ms = timeframe_to_ms(timeframe)
+        self.move_threshold = move_threshold
+        self.max_interval = max_interval
+        self.poll_interval = poll_interval
+        self.candle_delay = candle_delay
+        self.shutdown_timeout = shutdown_timeout
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.state = {pair: PairState() for pair in self.pairs}
+        self._stop = asyncio.Event()
+
+    def stop(self):
+        globals.running = False
+        self._stop.set()
+
+    def _next_candle(self):
+        # Свеча закрывается на границе таймфрейма; данные появляются с небольшой задержкой
+        now_ms = time.time() * 1000
+        return ((now_ms // self.timeframe_ms) + 1) * self.timeframe_ms / 1000 + self.candle_delay
+
+    async def run(self):
+        tasks = [asyncio.create_task(self._pair_loop(pair)) for pair in self.pairs]
+        stopper = asyncio.create_task(self._stop.wait())
+        try:
+            await asyncio.wait(tasks + [stopper], return_when=asyncio.FIRST_COMPLETED)
+            if not self._stop.is_set():
+                await asyncio.wait(tasks)
+        finally:
+            self.stop()
+            stopper.cancel()
+            # Начатые обработчики завершаются сами, зависшие отменяются по таймауту
+            done, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.report()
+
+    async def _pair_loop(self, pair):
+        state = self.state[pair]
+        state.next_candle = self._next_candle()
+        while globals.running:
+            reason = await self._next_trigger(pair, state)
+            if reason is None:
+                break
+            async with self.semaphore:
+                if not globals.running:
+                    break
+                state.busy = True
+                state.last_run = asyncio.get_running_loop().time()
+                state.triggers[reason] += 1
+                price = await self._price(pair)
+                if price is not None:
+                    state.reference_price = price
+                start = time.perf_counter()
+                try:
+                    await self.handler(pair, reason)
+                except Exception as e:
+                    state.errors += 1
+                    logging.error(f"Ошибка обработчика пары {pair} ({reason}): {str(e)}")
+                finally:
+                    state.busy = False
+                    state.run_time_max = max(state.run_time_max, time.perf_counter() - start)
+
+    async def _next_trigger(self, pair, state):
+        loop = asyncio.get_running_loop()
+        while globals.running:
+            if time.time() >= state.next_candle:
+                state.next_candle = self._next_candle()
+                return 'candle'
+            if loop.time() - state.last_run >= self.max_interval:
+                return 'deadline'
+            price = await self._price(pair)
+            if price is not None and state.reference_price and \
+                    abs(price / state.reference_price - 1) >= self.move_threshold:
+                return 'move'
+            timeout = max(0.0, min(self.poll_interval, state.next_candle - time.time(),
+                                   state.last_run + self.max_interval - loop.time()))
+            await self._wait(pair, timeout)
+        return None
+
+    async def _price(self, pair):
+        try:
+            ticker = await self.exchange.fetch_ticker(pair, max_age=TICKER_MAX_AGE)
+        except Exception as e:
+            logging.error(f"Планировщик: нет цены {pair}: {str(e)}")
+            return None
+        if ticker.get('bid') and ticker.get('ask'):
+            return (ticker['bid'] + ticker['ask']) / 2
+        return ticker.get('last')
+
+    async def _wait(self, pair, timeout):
+        """Ждёт новой цены пары, таймаута или остановки — что наступит раньше."""
+        update = asyncio.ensure_future(self.exchange.wait_for_update(pair, timeout))
+        stopper = asyncio.ensure_future(self._stop.wait())
+        try:
+            await asyncio.wait({update, stopper}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            update.cancel()
+            stopper.cancel()
+
+    def report(self):
+        for pair, state in self.state.items():
+            logging.info(f"Планировщик {pair}: запуски {dict(state.triggers)}, ошибок {state.errors}, "
+                         f"макс. время обработки {state.run_time_max:.2f} с")
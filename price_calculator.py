@@ -4,6 +4,147 @@ import pandas as pd
 import numpy as np
 import logging
 import asyncio
+from config import DEPTH_LEVELS
+
+MIN_CAPACITY = 64  # Уровней в буфере стороны пустого стакана, до первого расширения
+
+
+class DepthBook:
+    """Стакан в массивах NumPy: цены и объёмы уровней плюс накопленные объём и стоимость.
+
+    Стороны 'bids' (по убыванию цены) и 'asks' (по возрастанию). Запросы —
+    цена исполнения, максимальный объём в пределах проскальзывания, взвешенная
+    середина — решаются через cumsum и бинарный поиск по первым levels уровням.
+    apply_diff обновляет стакан пачкой уровней из diff-события.
+
+    Каждая сторона лежит в заранее выделенном буфере с запасом: diff-событие
+    находит уровень бинарным поиском и заменяет, вставляет или удаляет его на
+    месте сдвигом хвоста, без сортировки всей стороны.
+    """
+
+    def __init__(self, bids=(), asks=()):
+        self._buffers = {}
+        self._counts = {}
+        for side, levels in (('bids', bids), ('asks', asks)):
+            levels = self._normalize(levels, descending=side == 'bids')
+            self._buffers[side] = np.empty((max(MIN_CAPACITY, 2 * len(levels)), 2))
+            self._buffers[side][:len(levels)] = levels
+            self._counts[side] = len(levels)
+        self._cumulative = {}
+
+    @classmethod
+    def from_order_book(cls, order_book):
+        return cls(order_book['bids'], order_book['asks'])
+
+    @staticmethod
+    def _normalize(levels, descending):
+        levels = np.asarray(levels, dtype=np.float64).reshape(-1, 2)[:, :2]
+        levels = levels[levels[:, 1] > 0]
+        order = np.argsort(-levels[:, 0] if descending else levels[:, 0], kind='stable')
+        return levels[order]
+
+    @property
+    def sides(self):
+        return {side: buffer[:self._counts[side]] for side, buffer in self._buffers.items()}
+
+    def copy(self):
+        book = DepthBook.__new__(DepthBook)
+        book._buffers = {side: buffer.copy() for side, buffer in self._buffers.items()}
+        book._counts = dict(self._counts)
+        book._cumulative = {}
+        return book
+
+    def apply_diff(self, bids=(), asks=()):
+        """Уровни с нулевым объёмом удаляются, остальные заменяют или добавляют уровень.
+
+        Уровни события применяются по порядку, поэтому при повторе цены действует последний.
+        """
+        for side, updates in (('bids', bids), ('asks', asks)):
+            updates = np.asarray(updates, dtype=np.float64).reshape(-1, 2)
+            if not len(updates):
+                continue
+            for price, amount in updates.tolist():
+                self._set_level(side, price, amount)
+            self._cumulative.pop(side, None)
+
+    def _set_level(self, side, price, amount):
+        n = self._counts[side]
+        levels = self._buffers[side]
+        prices = levels[:n, 0]
+        if side == 'asks':
+            i = int(prices.searchsorted(price))
+        else:
+            # bids по убыванию: ищем в развёрнутом представлении первую цену не выше price
+            i = n - int(prices[::-1].searchsorted(price, side='right'))
+        if i < n and levels[i, 0] == price:
+            if amount > 0:
+                levels[i, 1] = amount
+            else:
+                levels[i:n - 1] = levels[i + 1:n]
+                self._counts[side] = n - 1
+        elif amount > 0:
+            if n == len(levels):
+                levels = self._buffers[side] = np.concatenate([levels, np.empty_like(levels)])
+            levels[i + 1:n + 1] = levels[i:n]
+            levels[i] = price, amount
+            self._counts[side] = n + 1
+
+    def _levels(self, side, levels):
+        book = self._buffers[side][:self._counts[side]]
+        if side not in self._cumulative:
+            self._cumulative[side] = (np.cumsum(book[:, 1]), np.cumsum(book[:, 0] * book[:, 1]))
+        amount, cost = self._cumulative[side]
+        n = len(amount) if levels is None else min(levels, len(amount))
+        return book[:n, 0], amount[:n], cost[:n]
+
+    def best(self, side):
+        return self._buffers[side][0, 0] if self._counts[side] else None
+
+    def fill(self, side, amount, levels=DEPTH_LEVELS):
+        """Исполнение amount по стороне side: (VWAP, худшая задетая цена, исполненный объём).
+
+        Если глубины не хватает, исполненный объём меньше запрошенного.
+        """
+        prices, cum_amount, cum_cost = self._levels(side, levels)
+        if not len(prices) or amount <= 0:
+            return None, None, 0.0
+        i = int(np.searchsorted(cum_amount, amount, side='left'))
+        if i >= len(prices):
+            return cum_cost[-1] / cum_amount[-1], prices[-1], float(cum_amount[-1])
+        before_amount = cum_amount[i - 1] if i else 0.0
+        before_cost = cum_cost[i - 1] if i else 0.0
+        cost = before_cost + (amount - before_amount) * prices[i]
+        return cost / amount, prices[i], float(amount)
+
+    def max_size(self, side, slippage, levels=DEPTH_LEVELS):
+        """Наибольший объём, VWAP которого отличается от лучшей цены не больше чем на slippage."""
+        prices, cum_amount, cum_cost = self._levels(side, levels)
+        if not len(prices):
+            return 0.0
+        sign = 1.0 if side == 'asks' else -1.0
+        limit = prices[0] * (1 + sign * slippage)
+        # VWAP на границах уровней монотонен, поэтому граница ищется бинарным поиском
+        k = int(np.searchsorted(sign * cum_cost / cum_amount, sign * limit, side='right'))
+        if k >= len(prices):
+            return float(cum_amount[-1])
+        # Часть следующего уровня: (cost_k + x * p) / (amount_k + x) = limit
+        amount_k = cum_amount[k - 1] if k else 0.0
+        cost_k = cum_cost[k - 1] if k else 0.0
+        extra = (limit * amount_k - cost_k) / (prices[k] - limit)
+        return float(amount_k + max(0.0, extra))
+
+    def depth_weighted_mid(self, levels=DEPTH_LEVELS):
+        """Середина, взвешенная глубиной: VWAP каждой стороны по levels уровням с весом объёма
+        противоположной стороны (перевес покупателей сдвигает середину к ask)."""
+        bid_prices, bid_amount, bid_cost = self._levels('bids', levels)
+        ask_prices, ask_amount, ask_cost = self._levels('asks', levels)
+        if not len(bid_prices) or not len(ask_prices):
+            return None
+        bid_vwap, ask_vwap = bid_cost[-1] / bid_amount[-1], ask_cost[-1] / ask_amount[-1]
+        return (bid_vwap * ask_amount[-1] + ask_vwap * bid_amount[-1]) / (bid_amount[-1] + ask_amount[-1])
+
+    def to_dict(self, limit=None):
+        return {side: levels[:limit].tolist() for side, levels in self.sides.items()}
 
 
 async def get_order_book(exchange, symbol):
@@ -22,23 +163,9 @@ async def get_best_price_and_amount(exchange, symbol, order_book, side, max_posi
     else:
         quote_balance = balances[symbol]['quote_bingx']
 
-    if side == 'buy':
-        orders = order_book['bids']
-        price_key, amount_key = 0, 1
-    else:
-        orders = order_book['asks']
-        price_key, amount_key = 0, 1
-
-    total_amount = 0
-    total_cost = 0
-    best_price = 0
-    for price, amount in orders:
-        available_amount = min(amount, max_position_size - total_amount)
-        if available_amount <= 0:
-            break
-        total_amount += available_amount
-        total_cost += available_amount * price
-        best_price = price
+    book = order_book if isinstance(order_book, DepthBook) else DepthBook.from_order_book(order_book)
+    # Лимитный ордер встаёт в свою сторону стакана: покупка — среди bids, продажа — среди asks
+    vwap, best_price, total_amount = book.fill('bids' if side == 'buy' else 'asks', max_position_size)
 
     if total_amount == 0:
         return None, 0
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# rate_limiter.py
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+from collections import defaultdict
+import ccxt.async_support as ccxt
+import metrics
+from config import RATE_LIMIT_WEIGHT, RATE_LIMIT_WINDOW, RATE_LIMIT_RETRIES, RATE_LIMIT_BACKOFF, RATE_LIMIT_BACKOFF_MAX
+
+# Приоритеты: меньше — раньше
+PRIORITY_ORDER = 0  # создание и отмена ордеров
+PRIORITY_ACCOUNT = 1  # статусы ордеров и баланс
+PRIORITY_MARKET = 2  # рыночные данные
+
+METHOD_PRIORITIES = {
+    'create_order': PRIORITY_ORDER,
+    'cancel_order': PRIORITY_ORDER,
+    'cancel_all_orders': PRIORITY_ORDER,
+    'fetch_order': PRIORITY_ACCOUNT,
+    'fetch_orders': PRIORITY_ACCOUNT,
+    'fetch_open_orders': PRIORITY_ACCOUNT,
+    'fetch_my_trades': PRIORITY_ACCOUNT,
+    'fetch_balance': PRIORITY_ACCOUNT,
+}
+
+# Веса эндпоинтов Binance Spot (REQUEST_WEIGHT)
+METHOD_WEIGHTS = {
+    'fetch_ticker': 2,
+    'fetch_tickers': 80,
+    'fetch_ohlcv': 2,
+    'fetch_balance': 20,
+    'fetch_order': 4,
+    'fetch_orders': 20,
+    'fetch_open_orders': 6,
+    'fetch_my_trades': 20,
+    'create_order': 1,
+    'cancel_order': 1,
+    'cancel_all_orders': 1,
+}
+
+TRANSIENT_ERRORS = (ccxt.NetworkError, ccxt.RateLimitExceeded)
+# Таймаут создания ордера не значит, что ордер не создан, поэтому такие
+# запросы повторяются только после явного отказа по лимиту
+NON_IDEMPOTENT = {'create_order'}
+
+
+def order_book_weight(limit):
+    if limit is None or limit <= 100:
+        return 5
+    if limit <= 500:
+        return 25
+    if limit <= 1000:
+        return 50
+    return 250
+
+
+def request_weight(method, args=(), kwargs=None):
+    if method == 'fetch_order_book':
+        limit = (kwargs or {}).get('limit', args[1] if len(args) > 1 else None)
+        return order_book_weight(limit)
+    if method == 'fetch_tickers':
+        symbols = (kwargs or {}).get('symbols', args[0] if args else None)
+        return 2 * len(symbols) if symbols and len(symbols) < 20 else METHOD_WEIGHTS['fetch_tickers']
+    if method == 'fetch_open_orders' and not (args and args[0]) and not (kwargs or {}).get('symbol'):
+        return 80  # открытые ордера по всем символам
+    return METHOD_WEIGHTS.get(method, 1)
+
+
+class _Waiter:
+    def __init__(self, priority, weight, future):
+        self.priority = priority
+        self.weight = weight
+        self.future = future
+
+
+class RequestScheduler:
+    """Планировщик запросов к бирже с общим бюджетом веса (token bucket).
+
+    Бюджет RATE_LIMIT_WEIGHT восполняется равномерно за RATE_LIMIT_WINDOW секунд.
+    Запросы, которым не хватает веса, ждут в очереди с приоритетом: ордера идут
+    раньше статусов и баланса, а те — раньше рыночных данных. Временные ошибки
+    повторяются с экспоненциальной паузой и случайным разбросом.
+    """
+
+    def __init__(self, capacity=RATE_LIMIT_WEIGHT, window=RATE_LIMIT_WINDOW, retries=RATE_LIMIT_RETRIES,
+                 backoff=RATE_LIMIT_BACKOFF, backoff_max=RATE_LIMIT_BACKOFF_MAX):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.tokens = float(capacity)
+        self._updated = None
+        self._queue = []
+        self._seq = itertools.count()
+        self._timer = None
+        self.retried = defaultdict(int)
+        self.wait_max = defaultdict(float)
+
+    def _refill(self):
+        now = asyncio.get_running_loop().time()
+        if self._updated is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def budget(self):
+        """Доступный сейчас вес запросов."""
+        self._refill()
+        return self.tokens
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def status(self):
+        depth = defaultdict(int)
+        for _, _, waiter in self._queue:
+            depth[waiter.priority] += 1
+        return {
+            'budget': round(self.budget, 1),
+            'capacity': self.capacity,
+            'queue_depth': self.queue_depth,
+            'queue_by_priority': dict(depth),
+            'wait_max': {priority: round(wait, 3) for priority, wait in self.wait_max.items()},
+            'retried': dict(self.retried),
+        }
+
+    def sync_used(self, used):
+        """Учитывает вес, который биржа считает уже израсходованным (x-mbx-used-weight-1m)."""
+        self._refill()
+        self.tokens = min(self.tokens, self.capacity - used)
+
+    async def acquire(self, weight=1, priority=PRIORITY_MARKET):
+        weight = min(weight, self.capacity)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        self._refill()
+        if not self._queue and self.tokens >= weight:
+            self.tokens -= weight
+            return
+        waiter = _Waiter(priority, weight, loop.create_future())
+        heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+        self._pump()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.tokens += weight  # вес уже выдан, возвращаем его
+            else:
+                self._queue = [entry for entry in self._queue if entry[2] is not waiter]
+                heapq.heapify(self._queue)
+            self._pump()
+            raise
+        self.wait_max[priority] = max(self.wait_max[priority], loop.time() - start)
+        metrics.RATE_LIMIT_WAIT.observe(loop.time() - start, priority)
+
+    def _pump(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        while self._queue:
+            waiter = self._queue[0][2]
+            if waiter.future.done():
+                heapq.heappop(self._queue)
+                continue
+            if self.tokens < waiter.weight:
+                delay = (waiter.weight - self.tokens) / self.rate
+                self._timer = asyncio.get_running_loop().call_later(delay, self._pump)
+                return
+            heapq.heappop(self._queue)
+            self.tokens -= waiter.weight
+            waiter.future.set_result(None)
+
+    async def submit(self, func, *args, weight=1, priority=PRIORITY_MARKET, name=None, **kwargs):
+        """Выполняет func(*args, **kwargs) в пределах бюджета, повторяя временные ошибки."""
+        name = name or getattr(func, '__name__', repr(func))
+        for attempt in range(self.retries + 1):
+            await self.acquire(weight, priority)
+            try:
+                with metrics.REQUEST_LATENCY.time(name):
+                    return await func(*args, **kwargs)
+            except TRANSIENT_ERRORS as e:
+                if attempt >= self.retries or (name in NON_IDEMPOTENT and not isinstance(e, ccxt.RateLimitExceeded)):
+                    raise
+                if isinstance(e, ccxt.RateLimitExceeded):
+                    # Биржа уже считает бюджет исчерпанным — обнуляем его для всех
+                    self.tokens = 0.0
+                delay = min(self.backoff_max, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+                self.retried[name] += 1
+                metrics.RETRIES.inc(name)
+                logging.warning(f"{name}: временная ошибка ({str(e)}), повтор {attempt + 1}/{self.retries} "
+                                f"через {delay:.2f} с")
+                await asyncio.sleep(delay)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# retraining.py
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler
+import globals
+from config import LOOKBACK, RETRAIN_INTERVAL, RETRAIN_HOLDOUT, RETRAIN_HISTORY, RETRAIN_MIN_GAIN, RETRAIN_WORKERS, \
+    TRAINING_THREADS_PER_JOB, TRAINING_EPOCHS
+from data import FEATURES, get_historical_data, add_features, prepare_lstm_data
+from artifacts import load_artifact, publish_artifact, discard_artifact
+
+
+def _init_worker(threads):
+    from model import _init_training_worker  # TensorFlow импортируется только в процессе обучения
+    _init_training_worker(threads)
+
+
+def retrain_job(pair, X_train, y_train, X_holdout, y_holdout, scaler, meta, epochs=TRAINING_EPOCHS):
+    """Обучает обе архитектуры, выбирает лучшую на отложенной выборке и сохраняет её неопубликованной."""
+    from model import ARCHITECTURES, evaluate_model
+    from artifacts import save_artifact
+    start = time.perf_counter()
+    best = None
+    for architecture, build in ARCHITECTURES.items():
+        model = build((X_train.shape[1], X_train.shape[2]))
+        model.fit(X_train, y_train, epochs=epochs, batch_size=32, verbose=0)
+        accuracy = float(evaluate_model(model, X_holdout, y_holdout))
+        if best is None or accuracy >= best[1]:
+            best = (architecture, accuracy, model)
+    architecture, accuracy, model = best
+    path = save_artifact(pair, model, scaler, dict(meta, architecture=architecture, holdout_accuracy=accuracy),
+                         publish=False)
+    return {'path': path, 'architecture': architecture, 'accuracy': accuracy,
+            'wall_time': time.perf_counter() - start}
+
+
+def split_training_data(df, holdout, current_scaler=None):
+    """Окна обучения и отложенной выборки по последним свечам.
+
+    Скейлер подгоняется только по свечам обучающих окон: отложенная выборка
+    масштабируется им же, иначе её min/max просочились бы в обучение.
+    Вместе с ними возвращаются окна отложенной выборки в масштабе скейлера
+    текущей модели. None, если окон мало для разбиения.
+    """
+    windows = len(df) - LOOKBACK
+    split = int(windows * (1 - holdout))
+    if split <= 0 or split >= windows:
+        return None
+    scaler = MinMaxScaler().fit(df[FEATURES].iloc[:split + LOOKBACK - 1].to_numpy(dtype=np.float64))
+    X, y, _ = prepare_lstm_data(df, scaler)
+    current = None
+    if current_scaler is not None:
+        X_current, y_current, _ = prepare_lstm_data(df, current_scaler)
+        current = (X_current[split:], y_current[split:])
+    return (X[:split], y[:split]), (X[split:], y[split:]), scaler, current
+
+
+def holdout_accuracy(model, X, y):
+    predictions = model.predict(X, verbose=0)
+    return float(np.mean((predictions.flatten() > 0.5) == y))
+
+
+class RetrainWorker:
+    """Периодически переобучает модели пар в отдельном процессе и подменяет их в predictor.
+
+    Новая модель публикуется и подменяется, только если на отложенной выборке
+    она не хуже текущей. Все тяжёлые вычисления идут в пуле процессов или в
+    потоке, цикл событий занят лишь загрузкой свечей.
+    """
+
+    def __init__(self, exchange, predictor, pairs, interval=RETRAIN_INTERVAL, holdout=RETRAIN_HOLDOUT,
+                 history=RETRAIN_HISTORY, min_gain=RETRAIN_MIN_GAIN, workers=RETRAIN_WORKERS):
+        self.exchange = exchange
+        self.predictor = predictor
+        self.pairs = list(pairs)
+        self.interval = interval
+        self.holdout = holdout
+        self.history = history
+        self.min_gain = min_gain
+        self.workers = workers
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_init_worker, initargs=(TRAINING_THREADS_PER_JOB,))
+        return self._pool
+
+    async def run(self):
+        try:
+            while globals.running:
+                await asyncio.sleep(self.interval)
+                for pair in self.pairs:
+                    if not globals.running:
+                        break
+                    await self.retrain_pair(pair)
+        finally:
+            self.close()
+
+    async def load_history(self, pair):
+        """Последние self.history свечей пары с признаками или None."""
+        historical_data = await get_historical_data(self.exchange, pair, limit=self.history)
+        if historical_data is None or historical_data.empty:
+            logging.error(f"Не удалось получить исторические данные для {pair}")
+            return None
+        data_with_features = await add_features(historical_data)
+        if data_with_features is None or data_with_features.empty:
+            logging.error(f"Не удалось добавить признаки для {pair}")
+            return None
+        return data_with_features
+
+    async def retrain_pair(self, pair):
+        try:
+            data_with_features = await self.load_history(pair)
+            if data_with_features is None:
+                return False
+            loop = asyncio.get_running_loop()
+            current = self.predictor.models.get(pair)
+            # Текущая модель проверяется на тех же свечах, но в масштабе своего скейлера
+            prepared = await loop.run_in_executor(None, split_training_data, data_with_features, self.holdout,
+                                                  current[1] if current is not None else None)
+            if prepared is None:
+                logging.error(f"Переобучение {pair}: мало данных для отложенной выборки "
+                              f"({len(data_with_features)} свечей)")
+                return False
+            (X_train, y_train), (X_holdout, y_holdout), scaler, current_holdout = prepared
+
+            meta = {
+                'samples': len(X_train),
+                'mode': 'retrain',
+                'train_start': str(data_with_features['timestamp'].iloc[0]),
+                'train_end': str(data_with_features['timestamp'].iloc[-1]),
+            }
+            result = await loop.run_in_executor(self._get_pool(), retrain_job, pair, X_train, y_train,
+                                                X_holdout, y_holdout, scaler, meta)
+
+            current_accuracy = None
+            if current is not None:
+                current_accuracy = await loop.run_in_executor(None, holdout_accuracy, current[0], *current_holdout)
+
+            logging.info(f"Переобучение {pair}: {result['architecture'].upper()} точность {result['accuracy']:.4f}, "
+                         f"текущая {current_accuracy}, {result['wall_time']:.1f} с")
+            if current_accuracy is not None and result['accuracy'] < current_accuracy + self.min_gain:
+                discard_artifact(result['path'])
+                return False
+
+            path = publish_artifact(result['path'])
+            artifact = await loop.run_in_executor(None, load_artifact, path)
+            self.predictor.swap(pair, artifact.model, artifact.scaler)
+            logging.info(f"Модель {pair} заменена на {artifact.version}")
+            return True
+        except Exception as e:
+            logging.error(f"Ошибка переобучения {pair}: {str(e)}")
+            return False
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
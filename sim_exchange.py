@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# sim_exchange.py
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections import defaultdict
+import ccxt.async_support as ccxt
+import numpy as np
+from config import TRADING_PAIRS, BACKTEST_DATA_DIR, SIM_BALANCE, SIM_FEE, SIM_SPREAD, SIM_DEPTH_LEVELS, \
+    SIM_DEPTH_FRACTION, SIM_PARTICIPATION, SIM_LATENCY, SIM_JITTER, SIM_WEIGHT_LIMIT, SIM_HISTORY
+from data import OHLCV_COLUMNS
+from exchange import Exchange
+from rate_limiter import request_weight
+
+MINUTE_MS = 60_000
+
+
+class SimOrderBook:
+    """Заявки участников одной пары с приоритетом цена-время.
+
+    Стороны — кучи (ключ цены, порядковый номер, ордер): у bids ключ -price,
+    у asks — price. Исполненные и отменённые ордера удаляются из кучи лениво,
+    когда оказываются на вершине.
+    """
+
+    def __init__(self):
+        self.sides = {'buy': [], 'sell': []}
+
+    def push(self, order, seq):
+        key = -order['price'] if order['side'] == 'buy' else order['price']
+        heapq.heappush(self.sides[order['side']], (key, seq, order))
+
+    def best(self, side):
+        heap = self.sides[side]
+        while heap and heap[0][2]['status'] != 'open':
+            heapq.heappop(heap)
+        return heap[0][2] if heap else None
+
+    def levels(self, side):
+        """Открытые заявки стороны, сгруппированные по цене: {price: объём}."""
+        levels = defaultdict(float)
+        for _, _, order in self.sides[side]:
+            if order['status'] == 'open':
+                levels[order['price']] += order['remaining']
+        return levels
+
+
+class SimulatedVenue:
+    """Локальная биржа с интерфейсом клиента ccxt для нагрузочных тестов без сети.
+
+    Рынок воспроизводится по минутным свечам из файлов: на каждом шаге step
+    текущей становится следующая свеча, вокруг её close выставляется
+    ликвидность маркет-мейкера (depth_levels уровней с шагом spread, объём —
+    depth_fraction объёма свечи). Заявки бота встают в SimOrderBook и
+    исполняются с приоритетом цена-время: сразу при пересечении с лучшей
+    ценой встречной стороны либо на следующих свечах, если рынок прошёл через
+    их цену (не больше participation объёма свечи за шаг). При равной цене
+    ликвидность маркет-мейкера выставлена раньше и исполняется первой.
+
+    Каждый вызов ждёт latency ± jitter секунд и расходует вес запроса в окне
+    минуты, как Binance; сверх weight_limit вызов отклоняется RateLimitExceeded,
+    а заголовок x-mbx-used-weight-1m отдаётся как у настоящей биржи.
+    """
+
+    def __init__(self, candles, balance=None, fee=SIM_FEE, spread=SIM_SPREAD, depth_levels=SIM_DEPTH_LEVELS,
+                 depth_fraction=SIM_DEPTH_FRACTION, participation=SIM_PARTICIPATION, latency=SIM_LATENCY,
+                 jitter=SIM_JITTER, weight_limit=SIM_WEIGHT_LIMIT, history=SIM_HISTORY, seed=None):
+        self.symbols = list(candles)
+        self.fee = fee
+        self.spread = spread
+        self.depth_levels = depth_levels
+        self.depth_fraction = depth_fraction
+        self.participation = participation
+        self.latency = latency
+        self.jitter = jitter
+        self.weight_limit = weight_limit
+        self._random = random.Random(seed)
+        self.candles = {}
+        # Время свечей сдвигается к текущему, чтобы кэши бота видели «живые» данные
+        now_ms = int(time.time() * 1000) // MINUTE_MS * MINUTE_MS
+        length = min(len(rows) for rows in candles.values())
+        self.cursor = min(history, length - 1)
+        for symbol, rows in candles.items():
+            rows = np.asarray(rows[OHLCV_COLUMNS] if hasattr(rows, 'columns') else rows, dtype=np.float64)[:length]
+            rows[:, 0] = rows[:, 0] - rows[self.cursor, 0] + now_ms
+            self.candles[symbol] = rows
+        self.books = {symbol: SimOrderBook() for symbol in self.symbols}
+        self.liquidity = {}  # symbol -> {'buy': [[price, amount], ...], 'sell': [...]} маркет-мейкера
+        self.orders = {}
+        self.orders_by_symbol = defaultdict(list)
+        self.balance = defaultdict(lambda: {'free': 0.0, 'used': 0.0})
+        for asset, amount in (balance or SIM_BALANCE).items():
+            self.balance[asset]['free'] = float(amount)
+        self.last_response_headers = {}
+        self.stats = defaultdict(int)
+        self._seq = itertools.count()
+        self._ids = itertools.count(1)
+        self._window = None
+        self._used_weight = 0
+        for symbol in self.symbols:
+            self._quote_market(symbol)
+
+    @classmethod
+    def from_files(cls, symbols=TRADING_PAIRS, directory=BACKTEST_DATA_DIR, **kwargs):
+        from backtest import load_candles
+        return cls({symbol: load_candles(symbol, directory) for symbol in symbols}, **kwargs)
+
+    @property
+    def exhausted(self):
+        return self.cursor >= min(len(rows) for rows in self.candles.values()) - 1
+
+    def candle(self, symbol):
+        return self.candles[symbol][self.cursor]
+
+    def now_ms(self):
+        return int(self.candles[self.symbols[0]][self.cursor, 0]) if self.symbols else int(time.time() * 1000)
+
+    # Воспроизведение рынка
+
+    def step(self):
+        """Переход к следующей свече всех пар; False, если данные кончились."""
+        if self.exhausted:
+            return False
+        self.cursor += 1
+        for symbol in self.symbols:
+            self._quote_market(symbol)
+            self._match_resting(symbol)
+        return True
+
+    async def run(self, interval=60.0):
+        """Шаг рынка каждые interval секунд (меньше 60 — ускоренное воспроизведение)."""
+        while self.step():
+            await asyncio.sleep(interval)
+        logging.info("Симулятор: данные для воспроизведения закончились")
+
+    def _quote_market(self, symbol):
+        _, _, _, _, close, volume = self.candle(symbol)
+        size = volume * self.depth_fraction / self.depth_levels
+        steps = np.arange(self.depth_levels)
+        bids = close * (1 - self.spread / 2 - steps * self.spread)
+        asks = close * (1 + self.spread / 2 + steps * self.spread)
+        self.liquidity[symbol] = {'buy': [[price, size] for price in bids.tolist()],
+                                  'sell': [[price, size] for price in asks.tolist()]}
+
+    def _match_resting(self, symbol):
+        """Исполняет заявки бота, через цену которых прошла свеча или котировка маркет-мейкера."""
+        _, _, high, low, _, volume = self.candle(symbol)
+        book = self.books[symbol]
+        for side in ('buy', 'sell'):
+            available = volume * self.participation
+            opposite = self.liquidity[symbol]['sell' if side == 'buy' else 'buy']
+            while available > 0:
+                order = book.best(side)
+                if order is None:
+                    break
+                price = order['price']
+                if side == 'buy' and not (low < price or opposite[0][0] <= price):
+                    break
+                if side == 'sell' and not (high > price or opposite[0][0] >= price):
+                    break
+                amount = min(order['remaining'], available)
+                self._fill(order, amount, price)
+                available -= amount
+                if order['status'] == 'open':
+                    break  # объём свечи исчерпан
+
+    # Ордера и баланс
+
+    def _fill(self, order, amount, price):
+        base, quote = order['symbol'].split('/')
+        cost = amount * price
+        fee = cost * self.fee
+        if order['side'] == 'buy':
+            # Резерв брался по цене ордера, исполнение может быть лучше
+            self.balance[quote]['used'] -= amount * order['price'] * (1 + self.fee)
+            self.balance[quote]['free'] += amount * order['price'] * (1 + self.fee) - cost - fee
+            self.balance[base]['free'] += amount
+        else:
+            self.balance[base]['used'] -= amount
+            self.balance[quote]['free'] += cost - fee
+        order['filled'] += amount
+        order['remaining'] = max(0.0, order['remaining'] - amount)
+        order['cost'] += cost
+        order['average'] = order['cost'] / order['filled']
+        order['fee']['cost'] += fee
+        order['trades'].append({'timestamp': self.now_ms(), 'price': price, 'amount': amount, 'cost': cost})
+        order['lastTradeTimestamp'] = self.now_ms()
+        if order['remaining'] <= 1e-12:
+            order['remaining'] = 0.0
+            order['status'] = 'closed'
+        self.stats['fills'] += 1
+
+    def _match_incoming(self, order):
+        """Встречные заявки бота и маркет-мейкера по цене, при равной цене — маркет-мейкер первым."""
+        side = 'sell' if order['side'] == 'buy' else 'buy'
+        book = self.books[order['symbol']]
+        liquidity = self.liquidity[order['symbol']][side]
+        better = (lambda a, b: a < b) if order['side'] == 'buy' else (lambda a, b: a > b)
+        while order['status'] == 'open':
+            level = next((level for level in liquidity if level[1] > 0), None)
+            resting = book.best(side)
+            if level is not None and (resting is None or not better(resting['price'], level[0])):
+                price = level[0]
+                if better(order['price'], price):
+                    break
+                amount = min(order['remaining'], level[1])
+                level[1] -= amount
+                self._fill(order, amount, price)
+            elif resting is not None:
+                price = resting['price']
+                if better(order['price'], price):
+                    break
+                amount = min(order['remaining'], resting['remaining'])
+                self._fill(resting, amount, price)
+                self._fill(order, amount, price)
+            else:
+                break
+
+    def _reserve(self, symbol, side, amount, price):
+        base, quote = symbol.split('/')
+        asset, required = (quote, amount * price * (1 + self.fee)) if side == 'buy' else (base, amount)
+        if self.balance[asset]['free'] < required:
+            raise ccxt.InsufficientFunds(f"Недостаточно {asset}: нужно {required}, доступно "
+                                         f"{self.balance[asset]['free']}")
+        self.balance[asset]['free'] -= required
+        self.balance[asset]['used'] += required
+
+    def _release(self, order):
+        base, quote = order['symbol'].split('/')
+        if order['side'] == 'buy':
+            amount = order['remaining'] * order['price'] * (1 + self.fee)
+            self.balance[quote]['used'] -= amount
+            self.balance[quote]['free'] += amount
+        else:
+            self.balance[base]['used'] -= order['remaining']
+            self.balance[base]['free'] += order['remaining']
+
+    def _order(self, order_id, symbol=None):
+        order = self.orders.get(str(order_id))
+        if order is None or (symbol is not None and order['symbol'] != symbol):
+            raise ccxt.OrderNotFound(f"Ордер {order_id} не найден")
+        return order
+
+    def _check_symbol(self, symbol):
+        if symbol not in self.candles:
+            raise ccxt.BadSymbol(f"Неизвестная пара {symbol}")
+
+    # Интерфейс клиента ccxt
+
+    async def _call(self, method, args, kwargs):
+        delay = self._random.gauss(self.latency, self.jitter) if self.latency or self.jitter else 0.0
+        if delay > 0:
+            await asyncio.sleep(delay)
+        window = int(asyncio.get_running_loop().time() // 60)
+        if window != self._window:
+            self._window = window
+            self._used_weight = 0
+        self._used_weight += request_weight(method, args, kwargs)
+        self.last_response_headers = {'x-mbx-used-weight-1m': str(self._used_weight)}
+        self.stats['requests'] += 1
+        if self._used_weight > self.weight_limit:
+            self.stats['rejected'] += 1
+            raise ccxt.RateLimitExceeded(f"429 Too Many Requests: вес {self._used_weight} > {self.weight_limit}")
+
+    async def fetch_ticker(self, symbol, params=None):
+        await self._call('fetch_ticker', (symbol,), {})
+        return self._ticker(symbol)
+
+    def _ticker(self, symbol):
+        self._check_symbol(symbol)
+        timestamp, _, high, low, close, volume = self.candle(symbol).tolist()
+        book = self.books[symbol]
+        bid, ask = self.liquidity[symbol]['buy'][0][0], self.liquidity[symbol]['sell'][0][0]
+        best_bid, best_ask = book.best('buy'), book.best('sell')
+        if best_bid is not None:
+            bid = max(bid, best_bid['price'])
+        if best_ask is not None:
+            ask = min(ask, best_ask['price'])
+        return {'symbol': symbol, 'timestamp': int(timestamp), 'bid': bid, 'ask': ask, 'last': close,
+                'close': close, 'high': high, 'low': low, 'baseVolume': volume}
+
+    async def fetch_tickers(self, symbols=None, params=None):
+        await self._call('fetch_tickers', (symbols,), {})
+        return {symbol: self._ticker(symbol) for symbol in (symbols or self.symbols)}
+
+    async def fetch_order_book(self, symbol, limit=None, params=None):
+        await self._call('fetch_order_book', (symbol, limit), {})
+        self._check_symbol(symbol)
+        result = {'symbol': symbol, 'timestamp': self.now_ms(), 'nonce': self.cursor}
+        for side, key in (('buy', 'bids'), ('sell', 'asks')):
+            levels = self.books[symbol].levels(side)
+            for price, amount in self.liquidity[symbol][side]:
+                if amount > 0:
+                    levels[price] += amount
+            prices = sorted(levels, reverse=side == 'buy')[:limit]
+            result[key] = [[price, levels[price]] for price in prices]
+        return result
+
+    async def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params=None):
+        await self._call('fetch_ohlcv', (symbol, timeframe), {})
+        self._check_symbol(symbol)
+        if timeframe != '1m':
+            raise ccxt.NotSupported(f"Симулятор воспроизводит только свечи 1m, запрошен {timeframe}")
+        rows = self.candles[symbol][:self.cursor + 1]
+        if since is not None:
+            rows = rows[np.searchsorted(rows[:, 0], since):]
+            rows = rows[:limit] if limit else rows
+        elif limit:
+            rows = rows[-limit:]
+        return [[int(row[0])] + row[1:].tolist() for row in rows]
+
+    async def fetch_balance(self, params=None):
+        await self._call('fetch_balance', (), {})
+        result = {'free': {}, 'used': {}, 'total': {}}
+        for asset, amounts in self.balance.items():
+            total = amounts['free'] + amounts['used']
+            result[asset] = {'free': amounts['free'], 'used': amounts['used'], 'total': total}
+            result['free'][asset] = amounts['free']
+            result['used'][asset] = amounts['used']
+            result['total'][asset] = total
+        return result
+
+    async def create_order(self, symbol, type, side, amount, price=None, params=None):
+        await self._call('create_order', (symbol, type, side, amount, price), {})
+        self._check_symbol(symbol)
+        if type != 'limit' or price is None:
+            raise ccxt.NotSupported("Симулятор принимает только лимитные ордера")
+        if amount <= 0 or price <= 0:
+            raise ccxt.InvalidOrder(f"Некорректный ордер: amount={amount}, price={price}")
+        self._reserve(symbol, side, amount, price)
+        order = {
+            'id': str(next(self._ids)), 'clientOrderId': None, 'symbol': symbol, 'type': 'limit', 'side': side,
+            'price': float(price), 'amount': float(amount), 'filled': 0.0, 'remaining': float(amount),
+            'cost': 0.0, 'average': None, 'status': 'open', 'timestamp': self.now_ms(),
+            'lastTradeTimestamp': None, 'fee': {'currency': symbol.split('/')[1], 'cost': 0.0}, 'trades': [],
+        }
+        self.orders[order['id']] = order
+        self.orders_by_symbol[symbol].append(order)
+        self.stats['orders'] += 1
+        self._match_incoming(order)
+        if order['status'] == 'open':
+            self.books[symbol].push(order, next(self._seq))
+        return dict(order)
+
+    async def cancel_order(self, id, symbol=None, params=None):
+        await self._call('cancel_order', (id, symbol), {})
+        order = self._order(id, symbol)
+        if order['status'] != 'open':
+            # Как Binance: отменить можно только открытый ордер
+            raise ccxt.OrderNotFound(f"Ордер {id} уже {order['status']}")
+        self._release(order)
+        order['status'] = 'canceled'
+        self.stats['cancels'] += 1
+        return dict(order)
+
+    async def fetch_order(self, id, symbol=None, params=None):
+        await self._call('fetch_order', (id, symbol), {})
+        return dict(self._order(id, symbol))
+
+    async def fetch_orders(self, symbol=None, since=None, limit=None, params=None):
+        await self._call('fetch_orders', (symbol, since, limit), {})
+        orders = self.orders_by_symbol[symbol] if symbol else list(self.orders.values())
+        orders = [dict(order) for order in orders if since is None or order['timestamp'] >= since]
+        return orders[-limit:] if limit else orders
+
+    async def fetch_open_orders(self, symbol=None, since=None, limit=None, params=None):
+        await self._call('fetch_open_orders', (symbol,), {})
+        orders = self.orders_by_symbol[symbol] if symbol else self.orders.values()
+        return [dict(order) for order in orders if order['status'] == 'open']
+
+    async def close(self):
+        logging.info(f"Симулятор: {dict(self.stats)}")
+
+
+def sim_exchange(venue, name='binance', symbols=None):
+    """Exchange поверх симулятора: кэши, планировщик запросов и метрики — те же, что с биржей."""
+    return Exchange(name, symbols=symbols or venue.symbols, client=venue)
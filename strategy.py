@@ -1,130 +1,272 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from config import MIN_ORDER_SIZE, TRADING_PAIRS, LOOKBACK, MAX_PREDICTION, MAX_PROB, MIN_SELL_SIZE
-from data import get_historical_data, prepare_lstm_data, add_features
+from config import MIN_ORDER_SIZE, TRADING_PAIRS, LOOKBACK, MAX_PREDICTION, MAX_PROB, MIN_SELL_SIZE, SCAN_CONCURRENCY, \
+    SCAN_TIMEOUT, TICKER_MAX_AGE, MAX_SLIPPAGE, PAIR_BATCH_WINDOW
+from data import get_historical_data, update_features
 from exchange import send_telegram_message
+from executor import compute
+from journal import journal
 from limits import calculate_optimal_limit
+import metrics
 import logging
 import asyncio
 
 
-async def select_profitable_pairs(exchanges, fees, pred_model, scaler, balances):
+MIN_ATR = 0.0005
+MIN_SPREAD = 0.0001
+BUY_THRESHOLD = 0.5  # Покупка при предсказании выше порога
+SELL_THRESHOLD = 0.4  # Продажа при предсказании ниже порога
+
+
+def is_profitable(max_spread, atr, prediction, min_spread=MIN_SPREAD, max_prediction=MAX_PREDICTION, min_atr=MIN_ATR):
+    # & и | вместо and/or: тот же предикат считает маски бэктеста по массивам NumPy
+    return ((max_spread > min_spread) | (prediction > max_prediction)) & (atr > min_atr)
+
+
+def buy_signal(prediction, threshold=BUY_THRESHOLD):
+    return prediction > threshold
+
+
+def sell_signal(prediction, threshold=SELL_THRESHOLD):
+    return prediction < threshold
+
+
+@metrics.timed('analyze_pair')
+async def analyze_pair(exchanges, pair, predictor):
+    """Спред, ATR и запрос на предсказание для одной пары; None, если данных нет."""
+    binance_ticker, prediction_data = await asyncio.gather(
+        exchanges['binance'].fetch_ticker(pair, max_age=TICKER_MAX_AGE),
+        get_historical_data(exchanges['binance'], pair, limit=LOOKBACK + 100),
+    )
+    bingx_ticker = binance_ticker
+
+    binance_bid = binance_ticker['bid']
+    binance_ask = binance_ticker['ask']
+    bingx_bid = bingx_ticker['bid']
+    bingx_ask = bingx_ticker['ask']
+
+    spread_buy_binance_sell_bingx = (bingx_ask - binance_bid) / min(binance_bid, bingx_ask) if binance_bid < bingx_ask else 0
+    spread_buy_bingx_sell_binance = (binance_ask - bingx_bid) / min(bingx_bid, binance_ask) if bingx_bid < binance_ask else 0
+    max_spread = max(spread_buy_binance_sell_bingx, spread_buy_bingx_sell_binance)
+
+    prediction_data = await update_features(pair, prediction_data)
+    if prediction_data.empty:
+        logging.error(f"Данные для {pair} пусты после add_features, пропускаем пару")
+        return None
+    request = predictor.prepare(pair, prediction_data)
+    if request is None:
+        logging.error(f"Подготовленные данные для {pair} пусты, пропускаем пару")
+        return None
+    return max_spread, prediction_data['ATR'][-1], request
+
+
+async def select_profitable_pairs(exchanges, fees, predictor, balances, pairs=TRADING_PAIRS):
+    """Отбор прибыльных пар из pairs с одним пакетным предсказанием на все пары.
+
+    Пары вне pairs с открытой позицией занимают места в лимите
+    MAX_OPEN_ORDERS, поэтому отбор части пар (пакет планировщика) не откроет
+    позиций больше, чем отбор всех пар сразу.
+    """
     global MAX_OPEN_ORDERS
     MAX_OPEN_ORDERS = await calculate_optimal_limit(balances)
 
     profitable_pairs = []
-    min_atr = 0.0005  # Добавлен фильтр по ATR
-    for pair in TRADING_PAIRS:
-        try:
-            binance_ticker = await exchanges['binance'].fetch_ticker(pair)
-            bingx_ticker = binance_ticker
-
-            binance_bid = binance_ticker['bid']
-            binance_ask = binance_ticker['ask']
-            bingx_bid = bingx_ticker['bid']
-            bingx_ask = bingx_ticker['ask']
-
-            spread_buy_binance_sell_bingx = (bingx_ask - binance_bid) / min(binance_bid, bingx_ask) if binance_bid < bingx_ask else 0
-            spread_buy_bingx_sell_binance = (binance_ask - bingx_bid) / min(bingx_bid, binance_ask) if bingx_bid < binance_ask else 0
-            max_spread = max(spread_buy_binance_sell_bingx, spread_buy_bingx_sell_binance)
-
-            min_spread = 0.0001
-
-            prediction_data = await get_historical_data(exchanges['binance'], pair, limit=LOOKBACK + 100)
-            prediction_data = await add_features(prediction_data)
-            if prediction_data.empty:
-                logging.error(f"Данные для {pair} пусты после add_features, пропускаем пару")
-                continue
-            X, _, pred_scaler = prepare_lstm_data(prediction_data)
-            if X.size == 0:
-                logging.error(f"Подготовленные данные для {pair} пусты, пропускаем пару")
-                continue
-            prediction = pred_model.predict(X[-1:], verbose=0)[0][0]
-            atr = prediction_data['ATR'].iloc[-1]
-
-            score = max_spread * 100 + prediction
-
-            logging.info(f"{pair}: max_spread={max_spread:.6f}, min_spread={min_spread:.6f}, prediction={prediction:.6f}, atr={atr:.6f}, score={score:.6f}")
-
-            if (max_spread > min_spread or prediction > MAX_PREDICTION) and atr > min_atr:
-                profitable_pairs.append((pair, score, max_spread, atr, prediction))
-                logging.info(f"{pair} выбрана как прибыльная")
-            else:
-                logging.info(f"{pair} не выбрана: max_spread <= min_spread, prediction <= {MAX_PREDICTION}, или atr <= {min_atr}")
-        except Exception as e:
-            logging.error(f"Ошибка при анализе пары {pair}: {str(e)}")
+
+    # Пары анализируются параллельно, но не более SCAN_CONCURRENCY одновременно;
+    # ошибка или таймаут одной пары не задерживает остальные
+    semaphore = asyncio.Semaphore(SCAN_CONCURRENCY)
+    try:
+        # Один fetch_tickers на все пары; дальше fetch_ticker отдаёт тикеры из снимка
+        await exchanges['binance'].market_snapshot(max_age=TICKER_MAX_AGE)
+    except Exception as e:
+        logging.error(f"Ошибка получения снимка рынка: {str(e)}")
+
+    async def bounded(pair):
+        async with semaphore:
+            return await asyncio.wait_for(analyze_pair(exchanges, pair, predictor), SCAN_TIMEOUT)
+
+    results = await asyncio.gather(*(bounded(pair) for pair in pairs), return_exceptions=True)
+    candidates = {}
+    requests = {}
+    for pair, result in zip(pairs, results):
+        if isinstance(result, asyncio.TimeoutError):
+            logging.error(f"Таймаут анализа пары {pair} ({SCAN_TIMEOUT} с)")
+        elif isinstance(result, BaseException):
+            # Сюда же попадает CancelledError отменённой задачи пары: она не Exception
+            logging.error(f"Ошибка при анализе пары {pair}: {result!r}")
+        elif result is not None:
+            max_spread, atr, requests[pair] = result
+            candidates[pair] = (max_spread, atr)
+
+    # Одно пакетное предсказание по всем парам вместо вызова predict на каждую
+    try:
+        predictions = await compute.run(predictor.predict_many, requests) if requests else {}
+    except Exception as e:
+        logging.error(f"Ошибка пакетного предсказания: {str(e)}")
+        predictions = {}
+
+    for pair, (max_spread, atr) in candidates.items():
+        if pair not in predictions:
             continue
+        prediction = predictions[pair]
+        score = max_spread * 100 + prediction
 
+        logging.debug("%s: max_spread=%.6f, min_spread=%.6f, prediction=%.6f, atr=%.6f, score=%.6f",
+                      pair, max_spread, MIN_SPREAD, prediction, atr, score)
+
+        if is_profitable(max_spread, atr, prediction):
+            profitable_pairs.append((pair, score, max_spread, atr, prediction))
+            logging.info(f"{pair} выбрана как прибыльная")
+        else:
+            logging.debug("%s не выбрана: max_spread <= min_spread, prediction <= %s, или atr <= %s",
+                          pair, MAX_PREDICTION, MIN_ATR)
+
+    # Сортировка устойчива: при равном score сохраняется порядок pairs
     profitable_pairs.sort(key=lambda x: x[1], reverse=True)
-    selected_pairs = [(pair[0], pair[4], pair[2], pair[3]) for pair in profitable_pairs[:MAX_OPEN_ORDERS]]
+    occupied = sum(1 for pair, balance in balances.items() if pair not in pairs and balance['base'] > 0)
+    slots = max(MAX_OPEN_ORDERS - occupied, 0)
+    selected_pairs = [(pair[0], pair[4], pair[2], pair[3]) for pair in profitable_pairs[:slots]]
 
     if not selected_pairs:
         logging.info("Нет прибыльных пар, баланс остаётся неизменным")
     else:
         total_binance = max(sum(balance['quote_binance'] for balance in balances.values()), 0)
-        allocation_per_pair = total_binance / len(TRADING_PAIRS)
-        for pair in TRADING_PAIRS:
+        allocation_per_pair = total_binance / len(balances)
+        for pair in pairs:
             if pair in [p[0] for p in selected_pairs]:
                 balances[pair]['quote_binance'] = min(allocation_per_pair, balances[pair]['quote_binance'] + allocation_per_pair)
+                journal.balance(pair, balances[pair])
 
     logging.info(f"Выбраны пары: {selected_pairs} с лимитом {MAX_OPEN_ORDERS}")
     return selected_pairs
 
 
-async def trade_pair(exchanges, pair, pred_model, scaler, balances, iteration):
+class PairScanner:
+    """Сводит пары, сработавшие в планировщике почти одновременно, в один select_profitable_pairs.
+
+    Первая пара открывает пакет, пары, пришедшие за window секунд, добавляются
+    к нему. На закрытии свечи срабатывают все пары сразу, и они отбираются
+    одним ограниченным сканом с одним пакетным предсказанием. Торгует каждая
+    пара уже сама, поэтому медленный ордер одной пары не держит остальные.
+    """
+
+    def __init__(self, exchanges, predictor, balances, window=PAIR_BATCH_WINDOW):
+        self.exchanges = exchanges
+        self.predictor = predictor
+        self.balances = balances
+        self.window = window
+        self._batch = None
+
+    async def select(self, pair):
+        """Предсказание для pair, если пара отобрана в своём пакете, иначе None."""
+        if self._batch is None:
+            self._batch = (set(), asyncio.ensure_future(self._scan()))
+        pairs, task = self._batch
+        pairs.add(pair)
+        selected = await asyncio.shield(task)
+        return selected.get(pair)
+
+    async def _scan(self):
+        await asyncio.sleep(self.window)
+        pairs = self._batch[0]
+        self._batch = None
+        # Порядок пар — как в balances, чтобы ранжирование не зависело от порядка срабатывания
+        pairs = [pair for pair in self.balances if pair in pairs]
+        selected = await select_profitable_pairs(self.exchanges, None, self.predictor, self.balances, pairs)
+        return {pair: prediction for pair, prediction, _, _ in selected}
+
+
+@metrics.timed('evaluate_pair')
+async def evaluate_pair(exchanges, pair, scanner, balances, account, reason):
+    """Обработка одной пары по событию планировщика: отбор в пакете PairScanner и торговля."""
+    prediction = await scanner.select(pair)
+    if prediction is None:
+        logging.debug("%s (%s): не выбрана", pair, reason)
+        return
+    await trade_pair(exchanges, pair, prediction, balances, reason, account)
+
+
+@metrics.timed('trade_pair')
+async def trade_pair(exchanges, pair, prediction, balances, reason, account):
+    """Покупка или продажа пары по предсказанию, уже посчитанному при отборе."""
     try:
         exchange_binance = exchanges['binance']
-        ticker = await exchange_binance.fetch_ticker(pair)
+        ticker, book = await asyncio.gather(exchange_binance.fetch_ticker(pair, max_age=TICKER_MAX_AGE),
+                                            exchange_binance.fetch_depth_book(pair))
         bid, ask = ticker['bid'], ticker['ask']
+        if book.best('bids') is None or book.best('asks') is None:
+            logging.warning(f"Стакан {pair} пуст или не синхронизирован, пара пропущена ({reason})")
+            return
 
-        # Получаем реальный баланс с биржи и синхронизируем
-        binance_balance = await exchange_binance.fetch_balance()
-        usdt_free = float(binance_balance['free'].get('USDT', 0))
+        # Общий снимок баланса аккаунта вместо fetch_balance в каждой задаче пары
+        await account.refresh()
+        usdt_free = account.available('USDT')
         # Обновляем доступный баланс для пары, если он больше реального
         if balances[pair]['quote_binance'] > usdt_free:
             balances[pair]['quote_binance'] = usdt_free
+            journal.balance(pair, balances[pair])
 
-        # Предсказание
-        historical_data = await get_historical_data(exchange_binance, pair, limit=LOOKBACK + 100)
-        data_with_features = await add_features(historical_data)
-        X, _, scaler = prepare_lstm_data(data_with_features)
-        prediction = pred_model.predict(X[-1:], verbose=0)[0][0]
-        logging.info(f"Итерация {iteration}: Предсказание для {pair}: {prediction}")
+        logging.debug("%s (%s): предсказание %s", pair, reason, prediction)
 
         # Логика покупки
-        if prediction > 0.5 and balances[pair]['quote_binance'] > 0:
-            amount = balances[pair]['quote_binance'] / bid
+        if buy_signal(prediction) and balances[pair]['quote_binance'] > 0:
+            # Пассивная заявка по bid встаёт в очередь bids: объём не больше глубины этой стороны
+            # в пределах MAX_SLIPPAGE от лучшей цены, а не только баланса
+            amount = min(balances[pair]['quote_binance'] / bid, book.max_size('bids', MAX_SLIPPAGE))
             cost = amount * bid
             fee = cost * 0.001  # Комиссия Binance
             total_cost = cost + fee
             logging.info(
                 f"Попытка покупки {pair}: amount={amount}, cost={cost}, fee={fee}, total_cost={total_cost}, usdt_free={usdt_free}")
-            if usdt_free >= total_cost:
-                order = await exchange_binance.create_limit_buy_order(pair, amount, bid)
+            # Резерв сразу уменьшает доступный USDT для параллельных задач других пар
+            reservation = await account.reserve('USDT', total_cost)
+            if reservation is not None:
+                try:
+                    order = await exchange_binance.create_limit_buy_order(pair, amount, bid)
+                except Exception:
+                    account.release(reservation)
+                    raise
+                account.commit(reservation)
                 balances[pair]['quote_binance'] -= total_cost
                 balances[pair]['base'] += amount
                 balances[pair]['cost'] += cost
                 balances[pair]['total_fees'] += fee
                 balances[pair]['entry_price'] = bid
+                journal.order(pair, order, 'buy', amount, bid, cost, fee, -total_cost)
+                journal.balance(pair, balances[pair])
                 logging.info(f"Куплено {amount} {pair} по {bid}, стоимость: {cost}, комиссия: {fee}")
             else:
                 logging.warning(
-                    f"Недостаточно средств для покупки {pair}: требуется {total_cost}, доступно {usdt_free}")
+                    f"Недостаточно средств для покупки {pair}: требуется {total_cost}, доступно {account.available('USDT')}")
         else:
-            logging.info(
-                f"Покупка {pair} не выполнена: prediction={prediction} <= 0.5 или quote_binance={balances[pair]['quote_binance']} <= 0")
+            logging.debug("Покупка %s не выполнена: prediction=%s <= %s или quote_binance=%s <= 0",
+                          pair, prediction, BUY_THRESHOLD, balances[pair]['quote_binance'])
 
         # Логика продажи
-        if prediction < 0.4 and balances[pair]['base'] > 0:
-            amount = balances[pair]['base']
-            order = await exchange_binance.create_limit_sell_order(pair, amount, ask)
+        if sell_signal(prediction) and balances[pair]['base'] > 0:
+            # Продажа по ask — так же пассивная, в очереди asks
+            amount = min(balances[pair]['base'], book.max_size('asks', MAX_SLIPPAGE))
+            base_asset = pair.split('/')[0]
+            reservation = await account.reserve(base_asset, amount)
+            if reservation is None:
+                logging.warning(f"Недостаточно {base_asset} для продажи {amount}, доступно {account.available(base_asset)}")
+                return
+            try:
+                order = await exchange_binance.create_limit_sell_order(pair, amount, ask)
+            except Exception:
+                account.release(reservation)
+                raise
+            account.commit(reservation)
             revenue = amount * ask
             fee = revenue * 0.001  # Комиссия Binance
             balances[pair]['quote_binance'] += revenue - fee
-            balances[pair]['base'] = 0
+            balances[pair]['base'] -= amount
             balances[pair]['revenue'] += revenue
             balances[pair]['total_fees'] += fee
-            balances[pair]['entry_price'] = 0
+            if balances[pair]['base'] <= 0:
+                balances[pair]['entry_price'] = 0
+            journal.order(pair, order, 'sell', amount, ask, revenue, fee, revenue - fee)
+            journal.balance(pair, balances[pair])
             logging.info(f"Продано {amount} {pair} по {ask}, выручка: {revenue}, комиссия: {fee}")
 
     except Exception as e:
@@ -133,27 +275,43 @@ async def trade_pair(exchanges, pair, pred_model, scaler, balances, iteration):
 
 async def finalize_report(exchanges, balances, initial_total_usdt):
     exchange_binance = exchanges['binance']
-    total_usdt = 0
-    total_fees = 0
 
     logging.info("Финализация остатков и создание отчёта")
+    try:
+        # Один запрос тикеров на все пары вместо fetch_ticker на каждую
+        await exchange_binance.market_snapshot(max_age=TICKER_MAX_AGE)
+    except Exception as e:
+        logging.error(f"Ошибка получения снимка рынка: {str(e)}")
     for pair in balances:
         amount = balances[pair]['base']
         if amount > 0:  # Проверяем, что есть что продавать
-            ticker = await exchange_binance.fetch_ticker(pair)
+            ticker = await exchange_binance.fetch_ticker(pair, max_age=TICKER_MAX_AGE)
             ask = ticker['ask']
             if ask:
                 order = await exchange_binance.create_limit_sell_order(pair, amount, ask)
                 balances[pair]['revenue'] += amount * ask
                 balances[pair]['base'] = 0
+                journal.order(pair, order, 'sell', amount, ask, amount * ask, 0.0, 0.0)
+                journal.balance(pair, balances[pair])
                 logging.info(f"Проданы все остатки {amount} {pair} по {ask}")
+    return balance_report(balances, initial_total_usdt)
+
+
+def balance_report(balances, initial_total_usdt, log=True):
+    """Итоговый отчёт по балансам пар (общий для торговли и бэктеста)."""
+    total_usdt = 0
+    total_fees = 0
+    for pair in balances:
         total_usdt += balances[pair]['quote_binance'] + balances[pair]['revenue'] - balances[pair]['cost']
         total_fees += balances[pair]['total_fees']
 
     profit_loss = total_usdt - initial_total_usdt
     roi = (profit_loss / initial_total_usdt) * 100 if initial_total_usdt > 0 else 0
+    pairs = {pair: balances[pair]['revenue'] - balances[pair]['cost'] for pair in balances}
 
-    logging.info(f"Итоговый отчёт: Начальный баланс: {initial_total_usdt:.2f} USDT, Конечный баланс: {total_usdt:.2f} USDT, Комиссии: {total_fees:.2f} USDT, Прибыль/Убыток: {profit_loss:.2f} USDT (ROI: {roi:.2f}%)")
-    for pair in balances:
-        pl = balances[pair]['revenue'] - balances[pair]['cost']
-        logging.info(f"{pair}: Остатки {balances[pair]['base']:.4f}, USDT: {balances[pair]['quote_binance']:.2f}, Прибыль/Убыток: {pl:.2f} USDT")
+    if log:
+        logging.info(f"Итоговый отчёт: Начальный баланс: {initial_total_usdt:.2f} USDT, Конечный баланс: {total_usdt:.2f} USDT, Комиссии: {total_fees:.2f} USDT, Прибыль/Убыток: {profit_loss:.2f} USDT (ROI: {roi:.2f}%)")
+        for pair in balances:
+            logging.info(f"{pair}: Остатки {balances[pair]['base']:.4f}, USDT: {balances[pair]['quote_binance']:.2f}, Прибыль/Убыток: {pairs[pair]:.2f} USDT")
+    return {'initial': initial_total_usdt, 'total': total_usdt, 'fees': total_fees, 'profit_loss': profit_loss,
+            'roi': roi, 'pairs': pairs}
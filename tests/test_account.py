@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+from account import AccountState
+
+
+class BalanceStub:
+    def __init__(self, usdt):
+        self.usdt = usdt
+        self.calls = 0
+
+    async def fetch_balance(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return {'free': {'USDT': self.usdt}, 'used': {'USDT': 0.0}}
+
+
+def test_parallel_reservations_do_not_overcommit():
+    async def scenario():
+        exchange = BalanceStub(100.0)
+        account = AccountState(exchange, max_age=60)
+        reservations = await asyncio.gather(*(account.reserve('USDT', 30.0) for _ in range(5)))
+        return exchange.calls, reservations, account
+
+    calls, reservations, account = asyncio.run(scenario())
+    assert calls == 1
+    granted = [r for r in reservations if r is not None]
+    assert len(granted) == 3
+    assert account.available('USDT') == 10.0
+    account.release(granted[0])
+    assert account.available('USDT') == 40.0
+
+
+def test_commit_survives_snapshot_requested_before_order():
+    async def scenario():
+        exchange = BalanceStub(100.0)
+        account = AccountState(exchange, max_age=0)
+        await account.refresh()
+        reservation = await account.reserve('USDT', 60.0)
+        # Снимок запрошен до выставления ордера и вернёт прежние 100 USDT
+        refresh = asyncio.ensure_future(account.refresh(force=True))
+        await asyncio.sleep(0.002)
+        account.commit(reservation)
+        await refresh
+        return account
+
+    account = asyncio.run(scenario())
+    assert account.free['USDT'] == 40.0
+    assert account.used['USDT'] == 60.0
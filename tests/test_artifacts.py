@@ -0,0 +1,112 @@
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+from sklearn.preprocessing import MinMaxScaler
+
+import artifacts
+from artifacts import save_artifact, load_latest_artifact, list_versions, publish_artifact
+from data import FEATURES
+from inference import NumpyRNNModel
+
+UNITS = 4
+
+
+class LSTM:
+    def __init__(self, weights):
+        self.weights = weights
+
+    def get_weights(self):
+        return self.weights
+
+
+class Dense(LSTM):
+    pass
+
+
+class FakeKerasModel:
+    """Слои с именами классов Keras: NumpyRNNModel.from_keras работает без TensorFlow."""
+
+    def __init__(self, seed=0, fail=False):
+        rng = np.random.default_rng(seed)
+        self.layers = [LSTM([rng.normal(0, 0.1, (len(FEATURES), 4 * UNITS)).astype(np.float32),
+                             rng.normal(0, 0.1, (UNITS, 4 * UNITS)).astype(np.float32),
+                             np.zeros(4 * UNITS, dtype=np.float32)]),
+                       Dense([rng.normal(0, 0.1, (UNITS, 1)).astype(np.float32), np.zeros(1, dtype=np.float32)])]
+        self.fail = fail
+
+    def save(self, path):
+        if self.fail:
+            raise OSError('диск заполнен')
+        with open(path, 'wb') as f:
+            f.write(b'keras')
+
+
+def make_scaler():
+    return MinMaxScaler().fit(np.random.default_rng(0).random((50, len(FEATURES))))
+
+
+def edit_meta(path, **changes):
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    meta.update(changes)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def test_round_trip_restores_weights_scaler_and_meta(tmp_path):
+    model, scaler = FakeKerasModel(), make_scaler()
+    path = save_artifact('ETH/USDT', model, scaler, {'architecture': 'lstm'}, root=str(tmp_path))
+
+    artifact = load_latest_artifact('ETH/USDT', root=str(tmp_path))
+
+    assert artifact.path == path and artifact.version == os.path.basename(path)
+    assert artifact.meta['architecture'] == 'lstm' and artifact.meta['features'] == list(FEATURES)
+    X = np.random.default_rng(1).random((3, 20, len(FEATURES))).astype(np.float32)
+    np.testing.assert_allclose(artifact.model.predict(X), NumpyRNNModel.from_keras(model).predict(X))
+    np.testing.assert_array_equal(artifact.scaler.data_max_, scaler.data_max_)
+
+
+def test_incompatible_versions_are_skipped(tmp_path):
+    root = str(tmp_path)
+    older = save_artifact('ETH/USDT', FakeKerasModel(), make_scaler(), {}, root=root)
+    newer = save_artifact('ETH/USDT', FakeKerasModel(), make_scaler(), {}, root=root)
+    edit_meta(newer, features=list(FEATURES)[:-1])
+
+    assert load_latest_artifact('ETH/USDT', root=root).path == older
+    assert load_latest_artifact('ETH/USDT', root=root, backend='onnx') is None
+
+
+def test_stale_newest_version_stops_search(tmp_path):
+    root = str(tmp_path)
+    save_artifact('ETH/USDT', FakeKerasModel(), make_scaler(), {}, root=root)
+    newer = save_artifact('ETH/USDT', FakeKerasModel(), make_scaler(), {}, root=root)
+    edit_meta(newer, created_at=time.time() - 7200)
+
+    assert load_latest_artifact('ETH/USDT', root=root, max_age=3600) is None
+    assert load_latest_artifact('ETH/USDT', root=root, max_age=None).path == newer
+
+
+def test_unpublished_and_failed_saves_are_invisible(tmp_path):
+    root = str(tmp_path)
+    tmp = save_artifact('ETH/USDT', FakeKerasModel(), make_scaler(), {}, root=root, publish=False)
+    assert tmp.endswith('.tmp') and list_versions('ETH/USDT', root) == []
+    with pytest.raises(OSError):
+        save_artifact('ETH/USDT', FakeKerasModel(fail=True), make_scaler(), {}, root=root)
+
+    path = publish_artifact(tmp)
+
+    assert list_versions('ETH/USDT', root) == [path]
+    assert sorted(os.listdir(artifacts.pair_dir('ETH/USDT', root))) == [os.path.basename(path)]
+
+
+def test_versions_in_the_same_millisecond_do_not_collide(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts.time, 'time', lambda: 1_700_000_000.123)
+    root = str(tmp_path)
+
+    paths = [save_artifact('ETH/USDT', FakeKerasModel(seed), make_scaler(), {}, root=root) for seed in range(3)]
+
+    assert len(set(paths)) == 3
+    assert list_versions('ETH/USDT', root) == paths[::-1]
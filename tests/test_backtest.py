@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import PairHistory, prepare_history, run_backtest, sweep
+
+
+class LastCloseModel:
+    """Предсказание — масштабированная цена закрытия последней свечи окна."""
+
+    def predict(self, X, verbose=0):
+        return X[:, -1, :1]
+
+
+def make_candles(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, rows)))
+    return pd.DataFrame({
+        'timestamp': 1_700_000_000_000 + np.arange(rows) * 60_000,
+        'open': close,
+        'high': close * 1.001,
+        'low': close * 0.999,
+        'close': close,
+        'volume': rng.random(rows) + 1,
+    })
+
+
+def test_prepare_history_does_not_look_ahead():
+    candles = make_candles(600)
+    # Скейлер фиксируется, чтобы масштаб не зависел от длины истории
+    from data import prepare_lstm_data
+    from indicators import compute_features
+    _, _, scaler = prepare_lstm_data(compute_features(candles.copy()).reset_index(drop=True))
+    full = prepare_history('ETH/USDT', candles, LastCloseModel(), scaler, batch_size=64)
+    prefix = prepare_history('ETH/USDT', candles.iloc[:400], LastCloseModel(), scaler)
+
+    assert len(full) > len(prefix) > 0
+    np.testing.assert_array_equal(full.timestamp[:len(prefix)], prefix.timestamp)
+    np.testing.assert_allclose(full.prediction[:len(prefix)], prefix.prediction)
+    assert full.timestamp[0] == candles['timestamp'].iloc[49 + 120]
+
+
+def history(prediction, close, low=None, high=None, pair='ETH/USDT'):
+    close = np.asarray(close, dtype=float)
+    return PairHistory(pair, np.arange(len(close)) * 60_000, close,
+                       close if high is None else high, close if low is None else low,
+                       np.ones(len(close)), prediction)
+
+
+def test_run_backtest_fills_limits_on_next_candle():
+    # Покупка на свече 0 исполняется (low свечи 1 ниже bid), продажа на свече 2 — на свече 3;
+    # без спреда сделки проходят фильтр is_profitable только при prediction > MAX_PREDICTION
+    eth = history([0.9, 0.45, 0.3, 0.45], [100, 100, 110, 110], low=[100, 99, 110, 110], high=[100, 100, 110, 111])
+    report = run_backtest([eth], {'spread': 0.0, 'fee': 0.001}, initial_total_usdt=1000.0)
+
+    amount = 1000 / (100 * 1.001)
+    assert report['trades'] == 2
+    assert report['fees'] == pytest.approx(amount * 100 * 0.001 + amount * 110 * 0.001)
+    assert report['pairs']['ETH/USDT'] == pytest.approx(amount * 10)
+
+
+def test_unfilled_buy_and_position_limit():
+    # Свеча 1 не доходит до bid: покупки нет; вторая пара не открывается при лимите в одну позицию
+    eth = history([0.9, 0.45, 0.45], [100, 100, 100], low=[100, 101, 100])
+    btc = history([0.45, 0.9, 0.45], [50, 50, 50], low=[50, 49, 49], pair='BTC/USDT')
+    xrp = history([0.9, 0.45, 0.45], [1, 1, 1], low=[1, 0.9, 1], pair='XRP/USDT')
+    report = run_backtest([eth, btc, xrp], {'spread': 0.0}, initial_total_usdt=300.0)
+
+    assert report['trades'] == 1  # только XRP: ETH не исполнилась, BTC упёрлась в лимит позиций
+    assert report['pairs']['ETH/USDT'] == 0 and report['pairs']['BTC/USDT'] == 0
+
+
+def test_parallel_sweep_matches_serial():
+    rng = np.random.default_rng(1)
+    histories = []
+    for pair in ('ETH/USDT', 'BTC/USDT'):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, 5000)))
+        histories.append(history(rng.random(5000), close, low=close * 0.999, high=close * 1.001, pair=pair))
+    grid = {'buy_threshold': [0.5, 0.7], 'sell_threshold': [0.3, 0.4]}
+
+    serial = sweep(histories, grid, workers=1)
+    parallel = sweep(histories, grid, workers=2)
+
+    assert [params for params, _ in serial] == [params for params, _ in parallel]
+    assert [report['profit_loss'] for _, report in serial] == \
+        pytest.approx([report['profit_loss'] for _, report in parallel])
+    assert all(report['trades'] > 0 for _, report in serial)
+
+
+def test_signals_use_live_predicates():
+    from backtest import DEFAULT_PARAMS, signals
+    from strategy import buy_signal, is_profitable, sell_signal
+
+    rng = np.random.default_rng(2)
+    close = np.full(200, 100.0)
+    eth = PairHistory('ETH/USDT', np.arange(200), close, close, close, rng.random(200) * 0.001, rng.random(200))
+    params = dict(DEFAULT_PARAMS, spread=0.0)
+    buy, sell, _, _ = signals(eth, params)
+
+    # Без спреда оба ордера исполняются на каждой свече, кроме последней
+    expected_buy = [bool(is_profitable(0.0, atr, prediction) and buy_signal(prediction))
+                    for atr, prediction in zip(eth.atr, eth.prediction)]
+    expected_sell = [bool(is_profitable(0.0, atr, prediction) and sell_signal(prediction))
+                     for atr, prediction in zip(eth.atr, eth.prediction)]
+    assert buy[:-1].tolist() == expected_buy[:-1] and sell[:-1].tolist() == expected_sell[:-1]
+
+
+def test_buy_and_sell_on_the_same_candle():
+    # При buy_threshold < sell_threshold на свече 0 срабатывают оба порога: как в trade_pair,
+    # сначала покупка, затем продажа купленного
+    eth = history([0.9, 0.9], [100, 100], low=[100, 99], high=[100, 101])
+    report = run_backtest([eth], {'spread': 0.0, 'fee': 0.0, 'buy_threshold': 0.5, 'sell_threshold': 0.95})
+
+    assert report['trades'] == 2
+    assert report['pairs']['ETH/USDT'] == pytest.approx(0.0)
+
+
+def test_small_balance_is_not_filtered():
+    # В trade_pair нет порога MIN_ORDER_SIZE, поэтому и бэктест покупает на любой положительный баланс
+    eth = history([0.9, 0.45, 0.3, 0.45], [100, 100, 110, 110], low=[100, 99, 110, 110], high=[100, 100, 110, 111])
+    report = run_backtest([eth], {'spread': 0.0, 'fee': 0.0}, initial_total_usdt=5.0)
+
+    assert report['trades'] == 2
+    assert report['pairs']['ETH/USDT'] == pytest.approx(0.5)
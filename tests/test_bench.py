@@ -0,0 +1,75 @@
+import asyncio
+
+import bench
+
+
+def test_quick_suite_reports_latency_throughput_and_memory(tmp_path):
+    report = asyncio.run(bench.run_suite(quick=True, only=['prepare_lstm_data', 'predict', 'get_best_price_and_amount'],
+                                         repeat=3))
+
+    assert set(report['results']) == {'prepare_lstm_data[history=500]', 'predict[batch=1]', 'predict[batch=64]',
+                                      'get_best_price_and_amount[levels=20]'}
+    for result in report['results'].values():
+        assert 0 < result['p50_ms'] <= result['p99_ms']
+        assert result['throughput'] > 0
+        assert result['peak_mb'] >= 0
+    # Пропускная способность predict считается в окнах: пачка из 64 обрабатывает больше окон в секунду
+    assert report['results']['predict[batch=64]']['throughput'] > report['results']['predict[batch=1]']['throughput']
+
+    path = tmp_path / 'bench.json'
+    bench.save(report, path)
+    assert bench.load(path) == report
+
+
+def test_compare_flags_regressions_over_threshold():
+    baseline = {'results': {'a[x=1]': {'p50_ms': 10.0}, 'b[x=1]': {'p50_ms': 10.0}, 'gone[x=1]': {'p50_ms': 1.0}}}
+    report = {'results': {'a[x=1]': {'p50_ms': 11.0}, 'b[x=1]': {'p50_ms': 13.0}, 'new[x=1]': {'p50_ms': 1.0}}}
+
+    rows = bench.compare(report, baseline, threshold=0.2)
+
+    assert [(key, regression) for key, _, _, _, regression in rows] == [('a[x=1]', False), ('b[x=1]', True)]
+
+
+def test_synthetic_data_is_reproducible():
+    assert bench.synthetic_candles(50, seed=3).equals(bench.synthetic_candles(50, seed=3))
+    assert bench.synthetic_order_book(10, seed=1) == bench.synthetic_order_book(10, seed=1)
+
+
+def test_loop_lag_reports_event_loop_delay():
+    report = asyncio.run(bench.run_suite(quick=True, only=['loop_lag'], repeat=3))
+
+    result = report['results']['loop_lag[pairs=2]']
+    assert 0 <= result['lag_p99_ms'] <= result['lag_max_ms']
+    assert result['throughput'] > 0
+    assert result['peak_mb'] is None
+
+
+def test_measure_profiles_memory_on_in_process_equivalent():
+    async def offloaded():
+        await asyncio.sleep(0)
+
+    # Работа «в пуле» в этом процессе не аллоцирует; память берётся с её аналога в процессе
+    result = asyncio.run(bench.measure(offloaded, 2, profile=lambda: bytearray(8 * 2 ** 20)))
+    skipped = asyncio.run(bench.measure(offloaded, 2, profile=False))
+
+    assert result['peak_mb'] >= 8
+    assert skipped['peak_mb'] is None
+
+
+def test_decision_drives_the_scheduler_path(monkeypatch):
+    import strategy
+
+    evaluated = []
+    evaluate_pair = strategy.evaluate_pair
+
+    async def spy(exchanges, pair, scanner, *args):
+        evaluated.append((pair, type(scanner).__name__))
+        return await evaluate_pair(exchanges, pair, scanner, *args)
+
+    monkeypatch.setattr(strategy, 'evaluate_pair', spy)
+    report = asyncio.run(bench.run_suite(quick=True, only=['decision'], repeat=2))
+
+    result = report['results']['decision[pairs=2]']
+    assert 0 < result['p50_ms'] <= result['p99_ms']
+    # Прогрев и повторы: каждая пара проходит через PairScanner на каждом прогоне
+    assert len(evaluated) >= 2 * 2 and {scanner for _, scanner in evaluated} == {'PairScanner'}
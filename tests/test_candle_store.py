@@ -0,0 +1,121 @@
+import asyncio
+import os
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bench import synthetic_candles
+from candle_store import CandleStore, TrainingWindows
+from data import prepare_lstm_data
+from indicators import compute_features
+from sim_exchange import SimulatedVenue, sim_exchange
+
+
+def rows(df):
+    return df.to_numpy(dtype=np.float64).tolist()
+
+
+def test_append_skips_duplicates_and_repairs_torn_write(tmp_path):
+    store = CandleStore(str(tmp_path))
+    candles = synthetic_candles(10)
+    assert store.append('ETH/USDT', '1m', rows(candles.iloc[:6])) == 6
+    # Повтор страницы с перекрытием дописывает только новые свечи
+    assert store.append('ETH/USDT', '1m', rows(candles.iloc[4:8])) == 2
+
+    # Обрыв записи: close успел получить на строку больше остальных столбцов
+    with open(os.path.join(store.path('ETH/USDT', '1m'), 'close.bin'), 'ab') as f:
+        f.write(np.float64(1.0).tobytes())
+    assert len(store.series('ETH/USDT')) == 8
+    assert store.append('ETH/USDT', '1m', rows(candles.iloc[8:])) == 2
+
+    series = store.series('ETH/USDT')
+    pd.testing.assert_frame_equal(series.frame(), candles, check_dtype=False)
+    assert series.index_of(candles['timestamp'].iloc[3]) == 3
+
+
+def test_backfill_pages_and_resumes_after_interruption(tmp_path):
+    candles = synthetic_candles(1200)
+    venue = SimulatedVenue({'ETH/USDT': candles}, latency=0.0, jitter=0.0, history=1100)
+    exchange = sim_exchange(venue)
+    store = CandleStore(str(tmp_path))
+    since = int(venue.candles['ETH/USDT'][0, 0])
+    calls = []
+
+    class Flaky:
+        name = 'flaky'
+
+        async def fetch_ohlcv(self, *args, **kwargs):
+            calls.append(kwargs['since'])
+            if len(calls) == 3:
+                raise ConnectionError('обрыв')
+            return await exchange.fetch_ohlcv(*args, **kwargs)
+
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await store.backfill(Flaky(), 'ETH/USDT', since=since, page=300)
+        assert len(store.series('ETH/USDT')) == 600
+        return await store.backfill(exchange, 'ETH/USDT', since=since, page=300)
+
+    added = asyncio.run(scenario())
+
+    series = store.series('ETH/USDT')
+    # Текущая (формирующаяся) свеча симулятора в хранилище не попадает
+    assert added == 500 and len(series) == 1100
+    np.testing.assert_array_equal(np.asarray(series.timestamps), venue.candles['ETH/USDT'][:1100, 0].astype(np.int64))
+    np.testing.assert_allclose(np.asarray(series.columns['close']), candles['close'].to_numpy()[:1100])
+
+
+def test_streamed_windows_match_full_history(tmp_path):
+    store = CandleStore(str(tmp_path))
+    candles = synthetic_candles(3000)
+    store.append('ETH/USDT', '1m', rows(candles))
+
+    X_full, y_full, scaler = prepare_lstm_data(compute_features(candles.copy()).reset_index(drop=True))
+    windows = TrainingWindows(store, 'ETH/USDT', chunk=700, warmup=500)
+    windows.fit_scaler()
+    np.testing.assert_allclose(windows.scaler.data_min_, scaler.data_min_)
+    np.testing.assert_allclose(windows.scaler.data_max_, scaler.data_max_)
+
+    parts = list(windows.windows())
+    X = np.concatenate([part[0] for part in parts])
+    y = np.concatenate([part[1] for part in parts])
+    assert len(parts) == 5
+    np.testing.assert_array_equal(y, y_full)
+    np.testing.assert_allclose(X, X_full, atol=1e-6)
+    assert sum(len(batch_y) for _, batch_y in windows.batches(64)) == len(y_full)
+
+
+def test_streaming_memory_does_not_grow_with_history(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.append('SHORT/USDT', '1m', rows(synthetic_candles(10_000)))
+    store.append('LONG/USDT', '1m', rows(synthetic_candles(40_000)))
+
+    def peak(symbol):
+        windows = TrainingWindows(store, symbol, chunk=2000, warmup=500)
+        windows.fit_scaler()
+        tracemalloc.start()
+        try:
+            for _ in windows.batches(256):
+                pass
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    assert peak('LONG/USDT') < peak('SHORT/USDT') * 1.5
+
+
+def test_train_job_streams_windows_from_store(tmp_path):
+    pytest.importorskip('tensorflow')
+    from model import train_job
+
+    store = CandleStore(str(tmp_path))
+    store.append('ETH/USDT', '1m', rows(synthetic_candles(800)))
+    windows = TrainingWindows(store, 'ETH/USDT', chunk=400)
+    windows.fit_scaler()
+
+    result = train_job('ETH/USDT', 'gru', [windows], None, epochs=1)
+
+    assert result['samples'] == 800 - 49 - 120
+    assert 0 <= result['accuracy'] <= 1
@@ -0,0 +1,180 @@
+import asyncio
+import gc
+import time
+
+import data
+import metrics
+from bench import synthetic_candles
+from data import OHLCVCache, feature_engines, update_features
+
+MINUTE = 60_000
+
+
+def current_minute():
+    return int(time.time() * 1000) // MINUTE * MINUTE
+
+
+class OHLCVStub:
+    """fetch_ohlcv по минутной сетке, последняя свеча (end) ещё формируется."""
+
+    name = 'binance'
+
+    def __init__(self, end=None):
+        self.end = current_minute() if end is None else end
+        self.close = 1.0
+        self.calls = []
+
+    async def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=100):
+        self.calls.append((since, limit))
+        await asyncio.sleep(0.01)
+        start = self.end - (limit - 1) * MINUTE if since is None else since
+        stop = min(self.end, start + (limit - 1) * MINUTE)
+        return [[ts, 1.0, 2.0, 0.5, self.close, 10.0] for ts in range(start, stop + 1, MINUTE)]
+
+
+def test_incremental_fetch_replaces_forming_candle():
+    cache = OHLCVCache(max_age=0)
+    exchange = OHLCVStub()
+
+    async def scenario():
+        first = await cache.get(exchange, 'ETH/USDT', '1m', 10)
+        exchange.close = 1.5
+        return first, await cache.get(exchange, 'ETH/USDT', '1m', 10)
+
+    first, second = asyncio.run(scenario())
+
+    assert exchange.calls[0] == (None, 10)
+    # Догружается только с последней свечи, а не вся история
+    since, limit = exchange.calls[1]
+    assert since == first[-1][0] and limit <= 3
+    assert [c[0] for c in second] == [c[0] for c in first]
+    assert second[-1][4] == 1.5 and second[0][4] == 1.0
+
+
+def test_full_reload_when_cache_is_too_old_or_short():
+    cache = OHLCVCache(max_age=0)
+    # Последняя закэшированная свеча час назад: догрузка больше limit
+    exchange = OHLCVStub(end=current_minute() - 60 * MINUTE)
+
+    async def scenario():
+        await cache.get(exchange, 'ETH/USDT', '1m', 10)
+        exchange.end = current_minute()
+        fresh = await cache.get(exchange, 'ETH/USDT', '1m', 10)
+        longer = await cache.get(exchange, 'ETH/USDT', '1m', 20)
+        return fresh, longer
+
+    fresh, longer = asyncio.run(scenario())
+
+    assert exchange.calls == [(None, 10), (None, 10), (None, 20)]
+    assert fresh[-1][0] == exchange.end and len(longer) == 20
+
+
+def test_concurrent_requests_share_one_fetch_per_client():
+    cache = OHLCVCache()
+    main, testnet = OHLCVStub(), OHLCVStub()
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get(exchange, 'ETH/USDT', '1m', 10)
+                                      for exchange in (main, main, main, testnet)))
+
+    results = asyncio.run(scenario())
+
+    assert all(len(candles) == 10 for candles in results)
+    assert main.calls == [(None, 10)]
+    # Клиенты с одинаковым именем биржи кэшируются раздельно
+    assert testnet.calls == [(None, 10)]
+
+
+def test_cache_metrics_separate_incremental_fetches_from_hits():
+    cache = OHLCVCache(max_age=0)
+    exchange = OHLCVStub()
+
+    async def scenario():
+        await asyncio.gather(*(cache.get(exchange, 'ETH/USDT', '1m', 10) for _ in range(3)))
+        await cache.get(exchange, 'ETH/USDT', '1m', 10)
+
+    metrics.enable(True)
+    try:
+        asyncio.run(scenario())
+        counts = {result: metrics.CACHE.value('ohlcv', result) for result in ('miss', 'incremental', 'hit')}
+    finally:
+        metrics.enable(False)
+        metrics.REGISTRY.clear()
+
+    # Догрузка — тоже запрос к бирже, хитом считаются только присоединившиеся к идущему запросу
+    assert len(exchange.calls) == 2
+    assert counts == {'miss': 1, 'incremental': 1, 'hit': 2}
+
+
+def test_fresh_candles_are_served_from_memory_until_the_candle_closes():
+    cache = OHLCVCache(max_age=60)
+    current = OHLCVStub()
+    # Последняя свеча уже закрыта: данные устарели, хотя загружены только что
+    lagging = OHLCVStub(end=current_minute() - MINUTE)
+
+    async def scenario():
+        for exchange in (current, lagging):
+            await cache.get(exchange, 'ETH/USDT', '1m', 10)
+            await cache.get(exchange, 'ETH/USDT', '1m', 10)
+        # Больше свечей, чем в кэше, — запрос к бирже
+        await cache.get(current, 'ETH/USDT', '1m', 20)
+
+    metrics.enable(True)
+    try:
+        asyncio.run(scenario())
+        counts = {result: metrics.CACHE.value('ohlcv', result) for result in ('miss', 'incremental', 'hit')}
+    finally:
+        metrics.enable(False)
+        metrics.REGISTRY.clear()
+
+    assert current.calls == [(None, 10), (None, 20)]
+    assert len(lagging.calls) == 2
+    assert counts['hit'] == 1
+
+
+def test_new_client_does_not_inherit_candles_of_a_collected_one():
+    cache = OHLCVCache()
+
+    async def fetch(close):
+        exchange = OHLCVStub()
+        exchange.close = close
+        candles = await cache.get(exchange, 'ETH/USDT', '1m', 10)
+        return candles, exchange.calls
+
+    async def scenario():
+        first = await fetch(1.0)
+        gc.collect()
+        return first, await fetch(2.0)
+
+    (first, first_calls), (second, second_calls) = asyncio.run(scenario())
+
+    # Новый объект может получить тот же id(), но его свечи загружаются заново целиком
+    assert first_calls == second_calls == [(None, 10)]
+    assert {c[4] for c in first} == {1.0} and {c[4] for c in second} == {2.0}
+
+
+def test_only_bootstrap_leaves_the_event_loop(monkeypatch):
+    candles = synthetic_candles(300)
+    offloaded = []
+    run = data.compute.run
+
+    async def recorded(func, *args, name=None, **kwargs):
+        offloaded.append(name)
+        return await run(func, *args, name=name, **kwargs)
+
+    monkeypatch.setattr(data.compute, 'run', recorded)
+
+    async def scenario():
+        for end in range(220, 225):
+            window = await update_features('ETH/USDT', candles.iloc[end - 220:end])
+        # Разрыв истории снова требует полной загрузки
+        await update_features('ETH/USDT', candles.iloc[230:300])
+        return window
+
+    try:
+        window = asyncio.run(scenario())
+    finally:
+        feature_engines.clear()
+
+    assert offloaded == ['IndicatorEngine.bootstrap', 'IndicatorEngine.bootstrap']
+    assert window['timestamp'][-1] == candles['timestamp'].iloc[223]
@@ -0,0 +1,67 @@
+import asyncio
+
+from exchange import Exchange
+
+
+class TickersStub:
+    """Клиент ccxt: fetch_tickers возвращает только пары из returned."""
+
+    def __init__(self, returned):
+        self.returned = returned
+        self.calls = []
+
+    async def fetch_tickers(self, symbols=None):
+        self.calls.append('fetch_tickers')
+        await asyncio.sleep(0.05)
+        return {pair: {'symbol': pair, 'bid': 1.0, 'ask': 2.0, 'last': 1.5} for pair in symbols
+                if pair in self.returned}
+
+    async def fetch_ticker(self, pair):
+        self.calls.append('fetch_ticker')
+        return {'symbol': pair, 'bid': 3.0, 'ask': 4.0, 'last': 3.5}
+
+    async def close(self):
+        pass
+
+
+def make_exchange(returned=('ETH/USDT', 'BTC/USDT')):
+    return Exchange('binance', symbols=['ETH/USDT', 'BTC/USDT'], client=TickersStub(returned))
+
+
+def test_ticker_is_served_from_snapshot_within_max_age():
+    exchange = make_exchange()
+
+    async def scenario():
+        await exchange.fetch_ticker('ETH/USDT', max_age=5)
+        await exchange.fetch_ticker('BTC/USDT', max_age=5)
+        # Тикер старше max_age запрашивается заново
+        exchange._tickers['ETH/USDT'] = (exchange._tickers['ETH/USDT'][0] - 10, exchange._tickers['ETH/USDT'][1])
+        return await exchange.fetch_ticker('ETH/USDT', max_age=5)
+
+    ticker = asyncio.run(scenario())
+
+    assert ticker['bid'] == 1.0
+    assert exchange.exchange.calls == ['fetch_tickers', 'fetch_tickers']
+
+
+def test_stale_ticker_missing_from_snapshot_falls_back_to_fetch_ticker():
+    exchange = make_exchange(returned=('BTC/USDT',))
+    exchange._tickers['ETH/USDT'] = (0.0, {'symbol': 'ETH/USDT', 'bid': 0.5, 'ask': 0.6, 'last': 0.55})
+
+    ticker = asyncio.run(exchange.fetch_ticker('ETH/USDT', max_age=5))
+
+    assert ticker['bid'] == 3.0
+    assert exchange.exchange.calls == ['fetch_tickers', 'fetch_ticker']
+
+
+def test_concurrent_callers_share_one_fetch_tickers():
+    exchange = make_exchange()
+
+    async def scenario():
+        return await asyncio.gather(*(exchange.fetch_ticker(pair, max_age=5)
+                                      for pair in ['ETH/USDT', 'BTC/USDT'] * 5))
+
+    tickers = asyncio.run(scenario())
+
+    assert len(tickers) == 10 and all(ticker['bid'] == 1.0 for ticker in tickers)
+    assert exchange.exchange.calls == ['fetch_tickers']
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+from indicators import IndicatorEngine, compute_features, FEATURE_COLUMNS
+
+
+def make_candles(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.5, n))
+    high = close + rng.uniform(0, 0.3, n)
+    low = close - rng.uniform(0, 0.3, n)
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=n, freq='min'),
+        'open': close + rng.normal(0, 0.1, n),
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': rng.uniform(1, 100, n),
+    })
+
+
+def assert_matches_batch(window, candles):
+    features = window.to_frame()
+    expected = compute_features(candles.copy())[FEATURE_COLUMNS].tail(len(features)).reset_index(drop=True)
+    assert features['timestamp'].equals(expected['timestamp'])
+    numeric = FEATURE_COLUMNS[1:]
+    np.testing.assert_allclose(features[numeric].to_numpy(float), expected[numeric].to_numpy(float),
+                               rtol=1e-7, atol=1e-7)
+
+
+def test_streaming_matches_batch():
+    candles = make_candles(400)
+    engine = IndicatorEngine(history=171)
+    engine.sync(candles.iloc[:220])
+    for end in range(221, 401):
+        features = engine.sync(candles.iloc[end - 220:end])
+    assert len(features) == 171
+    assert_matches_batch(features, candles)
+
+
+def test_forming_candle_is_revised():
+    candles = make_candles(300, seed=1)
+    engine = IndicatorEngine()
+    engine.sync(candles.iloc[:299])
+    partial = candles.iloc[:300].copy()
+    partial.loc[299, 'close'] = partial.loc[299, 'close'] + 5
+    engine.sync(partial)
+    features = engine.sync(candles.iloc[:300])
+    assert_matches_batch(features, candles.iloc[:300])
+
+
+def test_gap_triggers_bootstrap():
+    candles = make_candles(600, seed=2)
+    engine = IndicatorEngine()
+    engine.sync(candles.iloc[:220])
+    features = engine.sync(candles.iloc[380:600])
+    assert_matches_batch(features, candles.iloc[380:600])
+
+
+def test_sync_returns_a_view_of_the_preallocated_ring():
+    candles = make_candles(300, seed=3)
+    engine = IndicatorEngine()
+    engine.sync(candles.iloc[:220])
+    buffer = engine.values
+    for end in range(221, 300):
+        window = engine.sync(candles.iloc[end - 220:end])
+    # Новая свеча пишется в тот же буфер, окно — его срез без копирования
+    assert engine.values is buffer and np.shares_memory(window.values, buffer)
+    assert window['ATR'][-1] == window.to_frame()['ATR'].iloc[-1]
+    assert_matches_batch(window, candles.iloc[:299])
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+from data import FEATURES
+from inference import BatchPredictor, NumpyRNNModel
+
+
+@pytest.mark.parametrize('architecture', ['lstm', 'gru'])
+def test_numpy_backend_matches_keras(architecture, tmp_path):
+    pytest.importorskip('tensorflow')
+    from model import ARCHITECTURES
+    X = np.random.default_rng(0).random((4, 120, 10)).astype(np.float32)
+    model = ARCHITECTURES[architecture]((120, 10))
+    backend = NumpyRNNModel.from_keras(model)
+    expected = model.predict(X, verbose=0)
+    np.testing.assert_allclose(backend.predict(X), expected, atol=1e-5)
+    backend.save(tmp_path / 'weights.npz')
+    np.testing.assert_allclose(NumpyRNNModel.load(tmp_path / 'weights.npz').predict(X), expected, atol=1e-5)
+
+
+def make_features(value, rows=130, start='2024-01-01'):
+    df = pd.DataFrame(value, index=range(rows), columns=FEATURES)
+    df['timestamp'] = pd.date_range(start, periods=rows, freq='min')
+    return df
+
+
+class LastValueModel:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, X, verbose=0):
+        self.calls.append(len(X))
+        return X[:, -1, :1]
+
+
+def test_batch_predictor_caches_by_last_candle():
+    model = LastValueModel()
+    predictor = BatchPredictor({'ETH/USDT': (model, None), 'BTC/USDT': (model, None)})
+    requests = {'ETH/USDT': predictor.prepare('ETH/USDT', make_features(0.0).assign(close=np.arange(130.0))),
+                'BTC/USDT': predictor.prepare('BTC/USDT', make_features(0.0).assign(close=np.arange(130.0) * 2))}
+    predictions = predictor.predict_many(requests)
+    assert predictions['ETH/USDT'] == pytest.approx(128 / 129)
+    assert predictor.predict('ETH/USDT', requests['ETH/USDT']) == predictions['ETH/USDT']
+    assert model.calls == [2]
+    newer = predictor.prepare('ETH/USDT', make_features(0.0, start='2024-01-02'))
+    predictor.predict('ETH/USDT', newer)
+    assert model.calls == [2, 1]
+
+
+def test_swap_keeps_in_flight_request_consistent():
+    old, new = LastValueModel(), LastValueModel()
+    predictor = BatchPredictor({'ETH/USDT': (old, None)})
+    request = predictor.prepare('ETH/USDT', make_features(1.0))
+    predictor.swap('ETH/USDT', new, None)
+    predictor.predict('ETH/USDT', request)
+    predictor.predict('ETH/USDT', predictor.prepare('ETH/USDT', make_features(1.0)))
+    assert old.calls == [1] and new.calls == [1]
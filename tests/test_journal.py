@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from account import AccountState
+from journal import Journal, reconcile_state
+from sim_exchange import SimulatedVenue, sim_exchange
+
+
+def balance(base=0.0, quote=1000.0):
+    return {'base': base, 'quote_binance': quote, 'quote_bingx': 0.0, 'entry_price': 0.0, 'total_fees': 0.0,
+            'cost': 0.0, 'revenue': 0.0}
+
+
+def test_state_survives_restart_and_torn_tail(tmp_path):
+    journal = Journal(str(tmp_path), flush_interval=0.0)
+    journal.open()
+    journal.start(2000.0, {'ETH/USDT': balance(), 'BTC/USDT': balance()})
+    journal.order('ETH/USDT', {'id': 7, 'timestamp': 1}, 'buy', 2.0, 100.0, 200.0, 0.2, -200.2)
+    journal.balance('ETH/USDT', dict(balance(2.0, 799.8), cost=200.0, total_fees=0.2, entry_price=100.0))
+    journal.close()
+    # Процесс упал посреди записи следующей пачки
+    with open(tmp_path / 'journal.log', 'ab') as f:
+        f.write(b'{"type": "balance", "pair": "ETH/US')
+
+    restored = Journal(str(tmp_path))
+    state = restored.open()
+    restored.close()
+
+    assert state == dict(journal.state, daily_losses={}, historical_losses={}, last_day=None)
+    assert state['initial_total_usdt'] == 2000.0 and list(state['orders']) == ['7']
+    assert state['balances']['ETH/USDT']['base'] == 2.0
+    assert restored.replayed == 5
+    assert (tmp_path / 'journal.log').read_bytes().endswith(b'}\n')
+
+
+def test_snapshot_bounds_replay(tmp_path):
+    journal = Journal(str(tmp_path), flush_interval=0.0, snapshot_every=10)
+    journal.open()
+    for i in range(25):
+        journal.balance('ETH/USDT', balance(quote=float(i)))
+    journal.close()
+
+    lines = (tmp_path / 'journal.log').read_text().splitlines()
+    snapshot = json.loads((tmp_path / 'snapshot.json').read_text())
+    assert snapshot['seq'] == 20 and len(lines) == 5
+
+    # Падение между записью снимка и обрезкой журнала: события до снимка не применяются повторно
+    with open(tmp_path / 'journal.log', 'w') as f:
+        for seq in range(15, 26):
+            f.write(json.dumps({'type': 'balance', 'pair': 'ETH/USDT', 'values': balance(quote=float(seq - 1)),
+                                'seq': seq}) + '\n')
+    restored = Journal(str(tmp_path), snapshot_every=10)
+    state = restored.open()
+    restored.close()
+
+    assert restored.replayed == 5 and restored.seq == 25
+    assert state['balances']['ETH/USDT']['quote_binance'] == 24.0
+
+
+def test_snapshot_is_serialized_from_a_copy(tmp_path):
+    # Фоновый поток пишет снимок позже: события после него не должны в него попасть
+    journal = Journal(str(tmp_path), flush_interval=0.2, snapshot_every=10)
+    journal.open()
+    for i in range(13):
+        journal.balance('ETH/USDT', balance(quote=float(i)))
+    journal.order('ETH/USDT', {'id': 7}, 'buy', 1.0, 100.0, 100.0, 0.1, -100.1)
+    journal.close()
+
+    snapshot = json.loads((tmp_path / 'snapshot.json').read_text())
+    assert snapshot['seq'] == 10 and snapshot['state']['orders'] == {}
+    assert snapshot['state']['balances']['ETH/USDT']['quote_binance'] == 9.0
+
+
+def test_reconcile_returns_unfilled_and_caps_positions(tmp_path):
+    candles = pd.DataFrame({'timestamp': np.arange(20) * 60_000, 'open': 100.0, 'high': 100.5, 'low': 99.5,
+                            'close': 100.0, 'volume': 1000.0})
+    venue = SimulatedVenue({'ETH/USDT': candles, 'BTC/USDT': candles.copy()}, balance={'USDT': 10000.0},
+                           latency=0.0, jitter=0.0, history=5, spread=0.01, fee=0.0)
+    exchange = sim_exchange(venue)
+    journal = Journal(str(tmp_path), flush_interval=0.0)
+    journal.open()
+
+    async def scenario():
+        # Две покупки ниже рынка учтены в балансе при выставлении как исполненные
+        balances = {'ETH/USDT': balance(), 'BTC/USDT': balance()}
+        canceled = await exchange.create_limit_buy_order('ETH/USDT', 2.0, 90.0)
+        resting = await exchange.create_limit_buy_order('BTC/USDT', 1.0, 90.0)
+        for pair, order, amount in (('ETH/USDT', canceled, 2.0), ('BTC/USDT', resting, 1.0)):
+            balances[pair].update(base=amount, quote_binance=1000.0 - amount * 90.09, cost=amount * 90.0,
+                                  total_fees=amount * 0.09, entry_price=90.0)
+            journal.order(pair, order, 'buy', amount, 90.0, amount * 90.0, amount * 0.09, -amount * 90.09)
+        # Пока бот лежал, один ордер отменили, а на аккаунте ETH нет
+        await venue.cancel_order(canceled['id'], 'ETH/USDT')
+        balances['ETH/USDT']['base'] += 3.0
+        await reconcile_state(exchange, AccountState(exchange), balances, journal)
+        return balances, resting
+
+    balances, resting = asyncio.run(scenario())
+    journal.close()
+
+    assert balances['ETH/USDT'] == pytest.approx(balance(base=0.0))
+    assert balances['BTC/USDT']['base'] == 1.0
+    assert list(journal.state['orders']) == [resting['id']]
+    assert journal.state['balances']['ETH/USDT'] == balances['ETH/USDT']
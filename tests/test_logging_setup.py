@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import json
+import logging
+import pytest
+from logging_setup import setup_logging, lazy
+
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def test_json_records_levels_sampling_and_lazy_payloads(root_logger, tmp_path):
+    path = tmp_path / 'bot.log'
+    listener = setup_logging(str(path), 'INFO', {'test_logging_setup': 'DEBUG', 'noisy': 'ERROR'}, sample=5)
+    evaluated = []
+
+    def columns():
+        evaluated.append(1)
+        return ['open', 'close']
+
+    for i in range(12):
+        logging.debug("Окно %d: columns=%s", i, lazy(columns))
+    logging.info("Ордер создан", extra={'pair': 'ETH/USDT', 'amount': 0.5})
+    logging.getLogger('noisy').warning("не попадёт в лог")
+    listener.stop()
+
+    records = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert [r['msg'] for r in records] == ["Окно 0: columns=['open', 'close']", "Окно 5: columns=['open', 'close']",
+                                           "Окно 10: columns=['open', 'close']", "Ордер создан"]
+    assert len(evaluated) == 3
+    assert records[-1]['pair'] == 'ETH/USDT' and records[-1]['amount'] == 0.5
+    assert records[-1]['source'] == 'test_logging_setup' and records[-1]['level'] == 'INFO'
+
+
+def test_sampling_counters_are_bounded():
+    from logging_setup import LevelFilter, parse_level
+
+    level_filter = LevelFilter(logging.DEBUG, {'noisy': 'warning'}, sample=3, max_keys=4)
+    passed = []
+    for i in range(100):
+        # f-строка даёт новый шаблон на каждую запись
+        record = logging.LogRecord('root', logging.DEBUG, __file__, 1, f"Пара {i}", (), None)
+        passed.append(level_filter.filter(record))
+
+    assert all(passed) and len(level_filter.counts) == 4
+    assert level_filter.levels == {'noisy': logging.WARNING} and parse_level(15) == 15
+    with pytest.raises(ValueError):
+        parse_level('LOUD')
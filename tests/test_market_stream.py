@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+from aiohttp import web
+from exchange import Exchange
+from market_stream import LocalOrderBook, MarketStream
+
+
+def depth(first, last, bids=(), asks=()):
+    return {'e': 'depthUpdate', 'U': first, 'u': last, 'b': [list(b) for b in bids], 'a': [list(a) for a in asks]}
+
+
+def test_order_book_sequence_and_gap():
+    book = LocalOrderBook('ETH/USDT')
+    book.on_diff(depth(95, 99, bids=[('10', '5')]))
+    book.on_diff(depth(100, 102, bids=[('10', '2')], asks=[('11.5', '1')]))
+    assert book.load_snapshot({'nonce': 100, 'bids': [[10, 1]], 'asks': [[11, 1]]})
+    assert book.to_dict()['bids'] == [[10.0, 2.0]]
+    assert book.to_dict()['asks'] == [[11.0, 1.0], [11.5, 1.0]]
+
+    assert book.on_diff(depth(103, 103, asks=[('11', '0')]))
+    assert book.to_dict()['asks'] == [[11.5, 1.0]]
+    assert not book.on_diff(depth(105, 106, bids=[('9', '1')]))
+    assert not book.synced
+    # Снимок раньше буферизованного события не стыкуется с ним
+    assert not book.load_snapshot({'nonce': 103, 'bids': [], 'asks': []})
+    assert book.load_snapshot({'nonce': 105, 'bids': [[10, 2]], 'asks': [[11.5, 1]]})
+    assert book.to_dict()['bids'] == [[10.0, 2.0], [9.0, 1.0]]
+
+
+class RestStub:
+    def __init__(self):
+        self.calls = []
+
+    async def fetch_order_book(self, pair, limit=None):
+        self.calls.append('order_book')
+        await asyncio.sleep(0.1)
+        return {'nonce': 100, 'bids': [[2000, 1]], 'asks': [[2001, 1]]}
+
+    async def fetch_ohlcv(self, pair, timeframe='1m', since=None, limit=100):
+        self.calls.append('ohlcv')
+        return [[60000 * i, 1, 2, 0.5, 1.5, 10] for i in range(3)]
+
+    async def fetch_tickers(self, symbols=None):
+        self.calls.append('tickers')
+        return {pair: {'symbol': pair, 'bid': 1, 'ask': 2, 'last': 1.5} for pair in symbols}
+
+    async def close(self):
+        pass
+
+
+REPLAY = [
+    {'stream': 'ethusdt@depth@100ms', 'data': depth(99, 101, bids=[('2000', '3')])},
+    {'stream': 'ethusdt@bookTicker', 'data': {'u': 1, 's': 'ETHUSDT', 'b': '2000', 'B': '3', 'a': '2001', 'A': '1'}},
+    {'stream': 'ethusdt@kline_1m', 'data': {'e': 'kline', 's': 'ETHUSDT',
+                                            'k': {'t': 120000, 'o': '1', 'h': '3', 'l': '1', 'c': '2.5', 'v': '7'}}},
+    {'stream': 'ethusdt@kline_1m', 'data': {'e': 'kline', 's': 'ETHUSDT',
+                                            'k': {'t': 180000, 'o': '2.5', 'h': '3', 'l': '2', 'c': '2.75', 'v': '1'}}},
+    {'stream': 'ethusdt@depth@100ms', 'data': depth(102, 103, asks=[('2001', '0'), ('2002', '4')])},
+]
+
+
+async def replay_server(close):
+    async def handler(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        for message in REPLAY:
+            await ws.send_str(json.dumps(message))
+        await close.wait()
+        await ws.close()
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/stream', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, f"ws://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+async def wait_for(condition, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_exchange_reads_stream_and_falls_back_to_rest():
+    async def scenario():
+        close = asyncio.Event()
+        runner, url = await replay_server(close)
+        exchange = Exchange('binance', symbols=['ETH/USDT'])
+        await exchange.exchange.close()
+        exchange.exchange = rest = RestStub()
+        stream = exchange.start_stream(url)
+        stream.reconnect_delay = 60
+        try:
+            await wait_for(lambda: stream.order_book('ETH/USDT') is not None and stream.ohlcv('ETH/USDT', limit=4))
+            await wait_for(lambda: stream.books['ETH/USDT'].last_update_id == 103)
+            rest.calls.clear()
+
+            book = await exchange.fetch_order_book('ETH/USDT')
+            assert book['bids'] == [[2000.0, 3.0]] and book['asks'] == [[2002.0, 4.0]]
+            ticker = await exchange.fetch_ticker('ETH/USDT')
+            assert (ticker['bid'], ticker['ask'], ticker['last']) == (2000.0, 2001.0, 2.75)
+            candles = await exchange.fetch_ohlcv('ETH/USDT', '1m', since=60000, limit=10)
+            assert [c[0] for c in candles] == [60000, 120000, 180000] and candles[1][4] == 2.5
+            assert rest.calls == []
+
+            close.set()
+            await wait_for(lambda: not stream.connected)
+            await exchange.fetch_order_book('ETH/USDT')
+            await exchange.fetch_ticker('ETH/USDT')
+            assert rest.calls == ['order_book', 'tickers']
+        finally:
+            close.set()
+            await exchange.close()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+def kline(minute, close=1.0):
+    return {'stream': 'ethusdt@kline_1m', 'data': {'e': 'kline', 's': 'ETHUSDT', 'k': {
+        't': 60000 * minute, 'o': '1', 'h': '2', 'l': '0.5', 'c': str(close), 'v': '1'}}}
+
+
+class ReconnectRest(RestStub):
+    """REST-история всегда заканчивается текущей минутой, которая растёт между соединениями."""
+
+    def __init__(self):
+        super().__init__()
+        self.now_minute = 20
+
+    async def fetch_ohlcv(self, pair, timeframe='1m', since=None, limit=100):
+        self.calls.append('ohlcv')
+        return [[60000 * i, 1, 2, 0.5, 1.5, 10] for i in range(max(0, self.now_minute - limit + 1), self.now_minute + 1)]
+
+
+def test_reconnect_reloads_candles_missed_during_outage():
+    async def scenario():
+        rest = ReconnectRest()
+        connections = []
+        close = asyncio.Event()
+
+        async def handler(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            connections.append(ws)
+            if len(connections) == 1:
+                await ws.send_str(json.dumps(kline(20)))
+                await asyncio.sleep(0.2)
+                # Обрыв: пока соединения нет, проходят минуты 21-29
+                rest.now_minute = 30
+            else:
+                await ws.send_str(json.dumps(kline(30, close=3.0)))
+                await close.wait()
+            await ws.close()
+            return ws
+
+        app = web.Application()
+        app.router.add_get('/stream', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        stream = MarketStream(rest, ['ETH/USDT'], f"ws://127.0.0.1:{site._server.sockets[0].getsockname()[1]}",
+                              kline_history=50, reconnect_delay=0.05)
+        task = asyncio.create_task(stream.run())
+        try:
+            await wait_for(lambda: len(connections) == 2 and stream.ohlcv('ETH/USDT', limit=31)
+                           and stream.ohlcv('ETH/USDT', limit=1)[0][4] == 3.0)
+            candles = stream.ohlcv('ETH/USDT', since=0, limit=100)
+            assert [c[0] for c in candles] == [60000 * i for i in range(31)]
+            # Снимки стакана прошлого соединения отменены, а не висят параллельно новым
+            assert len(stream._tasks) <= 1
+        finally:
+            close.set()
+            stream.stop()
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await runner.cleanup()
+
+    asyncio.run(scenario())
@@ -0,0 +1,88 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def enabled():
+    metrics.enable(True)
+    try:
+        yield
+    finally:
+        metrics.enable(False)
+        metrics.REGISTRY.clear()
+
+
+def test_histogram_renders_cumulative_buckets(enabled):
+    registry = metrics.Registry()
+    histogram = metrics.Histogram('latency_seconds', "Задержка", ('stage',), buckets=(0.1, 1), registry=registry)
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value, 'predict')
+
+    text = registry.render()
+
+    assert '# TYPE latency_seconds histogram' in text
+    assert 'latency_seconds_bucket{stage="predict",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{stage="predict",le="1.0"} 3' in text
+    assert 'latency_seconds_bucket{stage="predict",le="+Inf"} 4' in text
+    assert 'latency_seconds_sum{stage="predict"} 4.05' in text
+    assert 'latency_seconds_count{stage="predict"} 4' in text
+
+
+def test_disabled_metrics_record_nothing():
+    registry = metrics.Registry()
+    counter = metrics.Counter('calls_total', "Вызовы", registry=registry)
+
+    @metrics.timed('noop')
+    def work(x):
+        return x * 2
+
+    assert work(2) == 4
+    counter.inc()
+    assert counter.value() == 0
+    assert metrics.STAGE_LATENCY.count('noop') == 0
+
+
+def test_timed_records_sync_and_async_stages(enabled):
+    @metrics.timed('sync_stage')
+    def work():
+        return 1
+
+    @metrics.timed('async_stage')
+    async def async_work():
+        await asyncio.sleep(0)
+        raise ValueError('ошибка')
+
+    work()
+    with pytest.raises(ValueError):
+        asyncio.run(async_work())
+
+    assert metrics.STAGE_LATENCY.count('sync_stage') == 1
+    assert metrics.STAGE_LATENCY.count('async_stage') == 1
+
+
+def test_endpoint_serves_prometheus_text(enabled):
+    registry = metrics.Registry()
+    counter = metrics.Counter('requests_total', "Запросы", ('method',), registry=registry)
+    metrics.Gauge('budget', "Бюджет", ('exchange',), func=lambda: {'binance': 4700.0}, registry=registry)
+    counter.inc('fetch_ticker', amount=3)
+
+    async def scenario():
+        runner = await metrics.start_server('127.0.0.1', 0, registry=registry)
+        try:
+            port = runner.addresses[0][1]
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f'http://127.0.0.1:{port}/metrics') as response:
+                    return response.status, response.headers['Content-Type'], await response.text()
+        finally:
+            await runner.cleanup()
+
+    status, content_type, text = asyncio.run(scenario())
+
+    assert status == 200
+    assert content_type.startswith('text/plain')
+    assert 'requests_total{method="fetch_ticker"} 3.0' in text
+    assert 'budget{exchange="binance"} 4700.0' in text
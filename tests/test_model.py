@@ -0,0 +1,86 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('tensorflow')
+import model  # noqa: E402
+
+ACCURACY = {('ETH/USDT', 'lstm'): 0.6, ('ETH/USDT', 'gru'): 0.7, ('BTC/USDT', 'lstm'): 0.55,
+            ('pooled', 'lstm'): 0.52, ('pooled', 'gru'): 0.51}
+
+
+class BuiltModel:
+    def __init__(self, architecture):
+        self.architecture = architecture
+        self.weights = None
+
+    def set_weights(self, weights):
+        self.weights = weights
+
+
+def fake_train_job(name, architecture, X, y):
+    # Для BTC/USDT задача GRU падает: остальные задачи должны дойти до конца
+    if (name, architecture) not in ACCURACY:
+        raise RuntimeError(f"{name} {architecture}: нехватка памяти")
+    return {'name': name, 'architecture': architecture, 'weights': [len(X)], 'accuracy': ACCURACY[name, architecture],
+            'samples': len(X), 'wall_time': 0.0}
+
+
+@pytest.fixture
+def orchestrator(monkeypatch):
+    saved = []
+    jobs_seen = []
+
+    async def prepare(exchange, pair):
+        rows = {'ETH/USDT': 10, 'BTC/USDT': 6}[pair]
+        df = pd.DataFrame({'timestamp': pd.date_range('2024-01-01', periods=rows, freq='min')})
+        return np.zeros((rows, 3)), np.zeros(rows), f"scaler-{pair}", df
+
+    async def run_jobs(jobs, workers, threads):
+        jobs_seen.append({name: len(X) for name, (X, y) in jobs.items()})
+        results = []
+        for name, (X, y) in jobs.items():
+            for architecture in model.ARCHITECTURES:
+                try:
+                    results.append(fake_train_job(name, architecture, X, y))
+                except Exception as e:
+                    results.append(e)
+        return results
+
+    monkeypatch.setattr(model, 'prepare_training_data', prepare)
+    monkeypatch.setattr(model, 'run_training_jobs', run_jobs)
+    monkeypatch.setattr(model, 'ARCHITECTURES', {'lstm': lambda shape: BuiltModel('lstm'),
+                                                 'gru': lambda shape: BuiltModel('gru')})
+    monkeypatch.setattr(model, 'save_artifact', lambda pair, pred_model, scaler, meta: saved.append((pair, meta)))
+    return saved, jobs_seen
+
+
+def test_per_pair_picks_best_architecture_and_survives_failed_job(orchestrator):
+    saved, jobs_seen = orchestrator
+
+    models = asyncio.run(model.train_models(None, ['ETH/USDT', 'BTC/USDT'], mode='per_pair'))
+
+    assert jobs_seen == [{'ETH/USDT': 10, 'BTC/USDT': 6}]
+    assert models['ETH/USDT'][0].architecture == 'gru' and models['ETH/USDT'][1] == 'scaler-ETH/USDT'
+    assert models['BTC/USDT'][0].architecture == 'lstm' and models['BTC/USDT'][0].weights == [6]
+    meta = dict(saved)['ETH/USDT']
+    assert meta['architecture'] == 'gru' and meta['accuracy'] == 0.7 and meta['samples'] == 10
+    assert meta['mode'] == 'per_pair'
+    assert (meta['train_start'], meta['train_end']) == ('2024-01-01 00:00:00', '2024-01-01 00:09:00')
+
+
+def test_pooled_trains_one_model_with_per_pair_scalers(orchestrator):
+    saved, jobs_seen = orchestrator
+
+    models = asyncio.run(model.train_models(None, ['ETH/USDT', 'BTC/USDT'], mode='pooled'))
+
+    assert jobs_seen == [{'pooled': 16}]
+    assert models['ETH/USDT'][0] is models['BTC/USDT'][0]
+    assert models['ETH/USDT'][0].architecture == 'lstm'
+    assert {pair: scaler for pair, (_, scaler) in models.items()} == {'ETH/USDT': 'scaler-ETH/USDT',
+                                                                     'BTC/USDT': 'scaler-BTC/USDT'}
+    assert [pair for pair, _ in saved] == ['ETH/USDT', 'BTC/USDT']
+    assert all(meta['mode'] == 'pooled' and meta['samples'] == 16 for _, meta in saved)
+    assert dict(saved)['BTC/USDT']['train_end'] == '2024-01-01 00:05:00'
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from aiohttp import web
+from notifier import Notifier
+
+
+async def telegram_stand_in(responses):
+    received = []
+
+    async def send_message(request):
+        received.append((time.monotonic(), request.match_info['token'], await request.json()))
+        status, body = responses.pop(0) if responses else (200, {'ok': True})
+        return web.json_response(body, status=status)
+
+    app = web.Application()
+    app.router.add_post('/bot{token}/sendMessage', send_message)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}", received
+
+
+def test_burst_is_coalesced_without_blocking_callers():
+    async def scenario():
+        runner, url, received = await telegram_stand_in([])
+        notifier = Notifier('token', 42, url, queue_size=4, digest_window=0.05, min_interval=0)
+        start = time.perf_counter()
+        for i in range(6):
+            notifier.notify(f"Ордер {i % 5} отменён")
+        enqueue_time = time.perf_counter() - start
+        await asyncio.sleep(0.3)
+        await notifier.close()
+        await runner.cleanup()
+        return enqueue_time, received, notifier.stats()
+
+    enqueue_time, received, stats = asyncio.run(scenario())
+    assert enqueue_time < 0.01
+    assert len(received) == 1
+    _, token, payload = received[0]
+    assert token == 'token' and payload['chat_id'] == 42
+    # Очередь на 4 сообщения: два самых старых отброшены
+    assert payload['text'] == "Уведомлений: 4\nОрдер 2 отменён\nОрдер 3 отменён\nОрдер 4 отменён\nОрдер 0 отменён"
+    assert stats == {'queued': 0, 'sent': 1, 'dropped': 2, 'failed': 0, 'coalesced': 3}
+
+
+def test_retry_after_is_respected():
+    async def scenario():
+        runner, url, received = await telegram_stand_in(
+            [(429, {'ok': False, 'description': 'Too Many Requests', 'parameters': {'retry_after': 0.2}})])
+        notifier = Notifier('token', 42, url, digest_window=0, min_interval=0)
+        notifier.notify("Проверка")
+        await asyncio.sleep(0.5)
+        await notifier.close()
+        await runner.cleanup()
+        return received, notifier.stats()
+
+    received, stats = asyncio.run(scenario())
+    assert len(received) == 2
+    assert received[1][0] - received[0][0] >= 0.2
+    assert stats['sent'] == 1 and stats['failed'] == 0
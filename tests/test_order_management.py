@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import order_management
+from order_management import reconcile_orders
+
+
+class OrdersStub:
+    name = 'stub'
+
+    def __init__(self):
+        self.calls = []
+
+    async def fetch_open_orders(self, pair=None):
+        self.calls.append('fetch_open_orders')
+        return [{'id': '1', 'symbol': 'ETH/USDT', 'price': 100.0}, {'id': '2', 'symbol': 'ETH/USDT', 'price': 95.0}]
+
+    async def fetch_orders(self, pair, since=None, limit=None):
+        self.calls.append('fetch_orders')
+        return [{'id': '3', 'status': 'closed', 'filled': 2.0, 'price': 100.0, 'average': 99.0}]
+
+    async def cancel_order(self, order_id, pair):
+        self.calls.append('cancel_order')
+        return {'id': order_id, 'status': 'canceled', 'filled': 0.5, 'price': 100.0}
+
+    async def market_snapshot(self, max_age=None):
+        self.calls.append('market_snapshot')
+        return {'ETH/USDT': {'last': 90.0}}
+
+
+def test_reconcile_sweeps_once_and_applies_fills(monkeypatch):
+    async def no_message(message):
+        pass
+
+    monkeypatch.setattr(order_management, 'send_telegram_message', no_message)
+    exchange = OrdersStub()
+    open_orders = {'ETH/USDT': [{'id': str(i), 'side': 'buy', 'timestamp': i} for i in (1, 2, 3)]}
+    balances = {'ETH/USDT': {'base': 0.0, 'quote_binance': 1000.0}}
+    asyncio.run(reconcile_orders(exchange, balances, {'ETH/USDT': 0.08}, open_orders))
+
+    # Ордер 1 ушёл дальше ATR и отменён, 2 остаётся, 3 исполнен по средней цене
+    assert sorted(exchange.calls) == ['cancel_order', 'fetch_open_orders', 'fetch_orders', 'market_snapshot']
+    assert [order['id'] for order in open_orders['ETH/USDT']] == ['2']
+    assert balances['ETH/USDT'] == {'base': 2.5, 'quote_binance': 1000.0 - 2.0 * 99.0 - 0.5 * 100.0}
+
+
+def test_reconcile_applies_cancels_when_status_sweep_fails(monkeypatch):
+    async def no_message(message):
+        pass
+
+    class FailingSweep(OrdersStub):
+        async def fetch_orders(self, pair, since=None, limit=None):
+            self.calls.append('fetch_orders')
+            raise RuntimeError('timeout')
+
+    monkeypatch.setattr(order_management, 'send_telegram_message', no_message)
+    exchange = FailingSweep()
+    open_orders = {'ETH/USDT': [{'id': str(i), 'side': 'buy', 'timestamp': i} for i in (1, 2, 3)]}
+    balances = {'ETH/USDT': {'base': 0.0, 'quote_binance': 1000.0}}
+    asyncio.run(reconcile_orders(exchange, balances, {'ETH/USDT': 0.08}, open_orders))
+
+    # Отмена ордера 1 применена, ордер 3 без статуса ждёт следующего прохода
+    assert [order['id'] for order in open_orders['ETH/USDT']] == ['2', '3']
+    assert balances['ETH/USDT'] == {'base': 0.5, 'quote_binance': 1000.0 - 0.5 * 100.0}
+
+    asyncio.run(reconcile_orders(exchange, balances, {'ETH/USDT': 0.08}, open_orders))
+    assert exchange.calls.count('cancel_order') == 1
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import numpy as np
+import pandas as pd
+import globals
+import strategy
+from data import FEATURES
+from inference import BatchPredictor
+from pair_scheduler import PairScheduler
+
+
+class PriceFeed:
+    name = 'feed'
+
+    def __init__(self, prices):
+        self.prices = prices
+        self.updated = asyncio.Event()
+
+    async def fetch_ticker(self, pair, max_age=None):
+        return {'bid': self.prices[pair], 'ask': self.prices[pair]}
+
+    async def wait_for_update(self, pair, timeout):
+        try:
+            await asyncio.wait_for(self.updated.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+def test_pairs_run_independently_on_their_own_events():
+    async def scenario():
+        feed = PriceFeed({'ETH/USDT': 100.0, 'BTC/USDT': 100.0})
+        calls = []
+        started = asyncio.Event()
+
+        async def handler(pair, reason):
+            calls.append((pair, reason))
+            if pair == 'BTC/USDT' and reason == 'deadline':
+                started.set()
+                await asyncio.sleep(10)  # медленная пара не задерживает остальные
+
+        scheduler = PairScheduler(feed, ['ETH/USDT', 'BTC/USDT'], handler, timeframe='1h', concurrency=2,
+                                  move_threshold=0.01, max_interval=3600, poll_interval=0.01, shutdown_timeout=0.1)
+        runner = asyncio.create_task(scheduler.run())
+        await started.wait()
+        await asyncio.sleep(0.05)
+        feed.prices['ETH/USDT'] = 101.5
+        feed.updated.set()
+        await asyncio.sleep(0.05)
+        scheduler.stop()
+        await asyncio.wait_for(runner, 1)
+        return calls, scheduler
+
+    try:
+        calls, scheduler = asyncio.run(scenario())
+    finally:
+        globals.running = True
+    assert calls.count(('ETH/USDT', 'deadline')) == 1
+    assert calls.count(('ETH/USDT', 'move')) == 1
+    assert ('BTC/USDT', 'move') not in calls
+    assert scheduler.state['BTC/USDT'].triggers == {'deadline': 1}
+
+
+class BatchSizeModel:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, X, verbose=0):
+        self.calls.append(len(X))
+        return np.full((len(X), 1), 0.9)
+
+
+def test_pairs_triggered_together_are_predicted_in_one_batch(monkeypatch):
+    pairs = ['ETH/USDT', 'BTC/USDT', 'XRP/USDT']
+    model = BatchSizeModel()
+    predictor = BatchPredictor({pair: (model, None) for pair in pairs})
+    features = pd.DataFrame(0.5, index=range(130), columns=FEATURES)
+    features['timestamp'] = pd.date_range('2024-01-01', periods=130, freq='min')
+    traded = []
+
+    async def analyze(exchanges, pair, predictor):
+        return 0.001, 0.01, predictor.prepare(pair, features)
+
+    async def trade(exchanges, pair, prediction, balances, reason, account):
+        traded.append((pair, reason))
+
+    async def market_snapshot(max_age=None):
+        return {}
+
+    monkeypatch.setattr(strategy, 'analyze_pair', analyze)
+    monkeypatch.setattr(strategy, 'trade_pair', trade)
+
+    async def scenario():
+        feed = PriceFeed({pair: 100.0 for pair in pairs})
+        feed.market_snapshot = market_snapshot
+        balances = {pair: {'base': 0.0, 'quote_binance': 5000.0, 'quote_bingx': 5000.0} for pair in pairs}
+        scanner = strategy.PairScanner({'binance': feed}, predictor, balances, window=0.02)
+
+        async def handler(pair, reason):
+            await strategy.evaluate_pair({'binance': feed}, pair, scanner, balances, None, reason)
+
+        scheduler = PairScheduler(feed, pairs, handler, timeframe='1h', concurrency=len(pairs),
+                                  max_interval=3600, poll_interval=0.01, shutdown_timeout=0.1)
+        runner = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.2)
+        scheduler.stop()
+        await asyncio.wait_for(runner, 1)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        globals.running = True
+    # Все пары сработали по дедлайну при старте: один скан и один вызов predict на три окна
+    assert model.calls == [3]
+    assert sorted(traded) == sorted((pair, 'deadline') for pair in pairs)
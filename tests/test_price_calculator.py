@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from price_calculator import DepthBook
+
+
+def walk(levels, amount):
+    left, cost = amount, 0.0
+    for price, size in levels:
+        take = min(size, left)
+        cost += take * price
+        left -= take
+        if left <= 0:
+            return cost / amount, price
+    return None
+
+
+def test_fill_matches_level_walk():
+    rng = np.random.default_rng(1)
+    asks = np.column_stack([100 + np.cumsum(rng.random(20)), rng.random(20) * 3])
+    book = DepthBook([[99, 1]], asks)
+    for amount in rng.random(50) * asks[:, 1].sum():
+        vwap, worst, filled = book.fill('asks', amount, levels=None)
+        assert filled == pytest.approx(amount)
+        assert (vwap, worst) == pytest.approx(walk(asks, amount))
+
+
+def test_max_size_and_incremental_diffs():
+    book = DepthBook([[100, 1], [99, 2], [98, 3]], [[101, 1], [102, 2], [103, 5]])
+    for side, best in (('asks', 101), ('bids', 100)):
+        size = book.max_size(side, 0.005)
+        assert book.fill(side, size)[0] == pytest.approx(best * (1 + (0.005 if side == 'asks' else -0.005)))
+    assert book.depth_weighted_mid() == pytest.approx((98 + 2 / 3) * 8 / 14 + 102.5 * 6 / 14)
+
+    book.apply_diff(bids=[[100, 0], [99.5, 4], [99.5, 3]], asks=[[101, 0.5]])
+    assert book.to_dict() == {'bids': [[99.5, 3.0], [99.0, 2.0], [98.0, 3.0]],
+                              'asks': [[101.0, 0.5], [102.0, 2.0], [103.0, 5.0]]}
+    assert book.fill('asks', 100)[2] == 7.5
+
+
+def test_diffs_update_levels_in_place_like_a_full_rebuild():
+    rng = np.random.default_rng(2)
+    bids = np.column_stack([100 - np.arange(300) * 0.01, rng.random(300) + 0.1])
+    asks = np.column_stack([100.01 + np.arange(300) * 0.01, rng.random(300) + 0.1])
+    book = DepthBook(bids, asks)
+    expected = {'bids': dict(bids.tolist()), 'asks': dict(asks.tolist())}
+    buffers = dict(book._buffers)
+    for _ in range(200):
+        for side, base, sign in (('bids', 100.0, -1), ('asks', 100.01, 1)):
+            prices = np.round(base + sign * rng.integers(0, 320, 10) * 0.01, 2)
+            amounts = np.where(rng.random(10) < 0.4, 0.0, rng.random(10))
+            updates = np.column_stack([prices, amounts])
+            book.apply_diff(**{side: updates})
+            for price, amount in updates.tolist():
+                if amount > 0:
+                    expected[side][price] = amount
+                else:
+                    expected[side].pop(price, None)
+
+    for side in ('bids', 'asks'):
+        rebuilt = DepthBook._normalize(list(expected[side].items()), descending=side == 'bids')
+        np.testing.assert_array_equal(book.sides[side], rebuilt)
+        # Уровни менялись в исходном буфере, без пересборки стороны на каждое событие
+        assert book._buffers[side] is buffers[side]
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import ccxt.async_support as ccxt
+import pytest
+from rate_limiter import RequestScheduler, PRIORITY_ORDER, PRIORITY_MARKET, request_weight
+
+
+def test_orders_overtake_queued_market_data():
+    async def scenario():
+        scheduler = RequestScheduler(capacity=10, window=0.1)
+        order = []
+
+        async def call(name):
+            order.append(name)
+
+        await scheduler.submit(call, 'warmup', weight=10)
+        tasks = [asyncio.ensure_future(scheduler.submit(call, f"ohlcv{i}", weight=5, priority=PRIORITY_MARKET))
+                 for i in range(3)]
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth == 3
+        tasks.append(asyncio.ensure_future(scheduler.submit(call, 'cancel', weight=1, priority=PRIORITY_ORDER)))
+        await asyncio.gather(*tasks)
+        return order, scheduler.status()
+
+    order, status = asyncio.run(scenario())
+    assert order[:2] == ['warmup', 'cancel']
+    assert order[2:] == ['ohlcv0', 'ohlcv1', 'ohlcv2']
+    assert status['queue_depth'] == 0
+
+
+def test_transient_errors_are_retried_but_order_timeouts_are_not():
+    async def scenario():
+        scheduler = RequestScheduler(capacity=100, backoff=0.001)
+        attempts = {'fetch_ohlcv': 0, 'create_order': 0}
+
+        async def flaky(name):
+            attempts[name] += 1
+            if attempts[name] < 3:
+                raise ccxt.RequestTimeout('timeout')
+            return 'ok'
+
+        assert await scheduler.submit(flaky, 'fetch_ohlcv', name='fetch_ohlcv') == 'ok'
+        with pytest.raises(ccxt.RequestTimeout):
+            await scheduler.submit(flaky, 'create_order', name='create_order')
+        return attempts, scheduler.status()
+
+    attempts, status = asyncio.run(scenario())
+    assert attempts == {'fetch_ohlcv': 3, 'create_order': 1}
+    assert status['retried'] == {'fetch_ohlcv': 2}
+
+
+def test_request_weights():
+    assert request_weight('fetch_order_book', ('ETH/USDT', 1000)) == 50
+    assert request_weight('fetch_tickers', (['ETH/USDT', 'BTC/USDT'],)) == 4
+    assert request_weight('cancel_order', ('1', 'ETH/USDT')) == 1
@@ -0,0 +1,83 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from sklearn.preprocessing import MinMaxScaler
+
+import retraining
+from bench import synthetic_candles
+from config import LOOKBACK
+from data import FEATURES
+from indicators import compute_features
+from inference import BatchPredictor
+from retraining import RetrainWorker
+
+
+class ConstantModel:
+    def __init__(self, value):
+        self.value = value
+
+    def predict(self, X, verbose=0):
+        return np.full((len(X), 1), self.value)
+
+
+class Artifact:
+    def __init__(self, path):
+        self.model = ConstantModel(0.0)
+        self.scaler = 'new-scaler'
+        self.version = path
+
+
+def make_worker(monkeypatch, gain):
+    features = compute_features(synthetic_candles(600)).reset_index(drop=True)
+    # Выброс в последних свечах: попадёт только в отложенную выборку
+    features.loc[len(features) - 5:, FEATURES[0]] = features[FEATURES[0]].max() * 10
+    current = ConstantModel(1.0)
+    scaler = MinMaxScaler().fit(features[FEATURES].to_numpy())
+    predictor = BatchPredictor({'ETH/USDT': (current, scaler)})
+    events = []
+
+    def fake_retrain_job(pair, X_train, y_train, X_holdout, y_holdout, scaler, meta):
+        events.append(('train', X_train.max(), X_holdout.max(), scaler, meta))
+        # Текущая модель всегда предсказывает рост: её точность — доля роста на отложенной выборке
+        return {'path': 'models/new.tmp', 'architecture': 'gru', 'accuracy': float(y_holdout.mean()) + gain,
+                'wall_time': 0.0}
+
+    monkeypatch.setattr(retraining, 'retrain_job', fake_retrain_job)
+    monkeypatch.setattr(retraining, 'publish_artifact', lambda path: events.append(('publish', path)) or 'models/new')
+    monkeypatch.setattr(retraining, 'discard_artifact', lambda path: events.append(('discard', path)))
+    monkeypatch.setattr(retraining, 'load_artifact', lambda path: Artifact(path))
+    worker = RetrainWorker(None, predictor, ['ETH/USDT'], holdout=0.2)
+    worker._pool = ThreadPoolExecutor(1)
+
+    async def load_history(pair):
+        return features
+
+    worker.load_history = load_history
+    return worker, predictor, current, events, len(features)
+
+
+def test_worse_model_is_discarded(monkeypatch):
+    worker, predictor, current, events, _ = make_worker(monkeypatch, gain=-0.05)
+
+    assert not asyncio.run(worker.retrain_pair('ETH/USDT'))
+    worker.close()
+
+    assert predictor.models['ETH/USDT'][0] is current
+    assert [event[0] for event in events] == ['train', 'discard']
+
+
+def test_better_model_is_published_and_swapped(monkeypatch):
+    worker, predictor, current, events, rows = make_worker(monkeypatch, gain=0.05)
+
+    assert asyncio.run(worker.retrain_pair('ETH/USDT'))
+    worker.close()
+
+    assert predictor.models['ETH/USDT'] == (predictor.models['ETH/USDT'][0], 'new-scaler')
+    assert predictor.models['ETH/USDT'][0] is not current
+    assert [event[0] for event in events] == ['train', 'publish']
+    _, train_max, holdout_max, scaler, meta = events[0]
+    # Скейлер подогнан только по обучающим окнам: выброс отложенной выборки выходит за [0, 1]
+    assert train_max == pytest.approx(1.0) and holdout_max > 1.5
+    assert meta['samples'] == int((rows - LOOKBACK) * 0.8) and len(scaler.data_max_) == len(FEATURES)
@@ -0,0 +1,103 @@
+import asyncio
+
+import ccxt.async_support as ccxt
+import numpy as np
+import pandas as pd
+import pytest
+
+from sim_exchange import SimulatedVenue, sim_exchange
+
+
+def make_venue(rows=20, **kwargs):
+    candles = pd.DataFrame({
+        'timestamp': np.arange(rows) * 60_000,
+        'open': 100.0, 'high': 100.5, 'low': 99.5, 'close': 100.0, 'volume': 1000.0,
+    })
+    kwargs.setdefault('latency', 0.0)
+    kwargs.setdefault('jitter', 0.0)
+    kwargs.setdefault('history', 5)
+    kwargs.setdefault('balance', {'USDT': 10000.0, 'ETH': 100.0})
+    return SimulatedVenue({'ETH/USDT': candles}, spread=0.01, fee=0.0, **kwargs)
+
+
+def test_incoming_order_matches_by_price_then_time():
+    venue = make_venue()
+
+    async def scenario():
+        first = await venue.create_order('ETH/USDT', 'limit', 'buy', 1, 99.0)
+        second = await venue.create_order('ETH/USDT', 'limit', 'buy', 1, 99.0)
+        better = await venue.create_order('ETH/USDT', 'limit', 'buy', 1, 99.2)
+        # Продажа по 99.0: лучший bid маркет-мейкера 99.5, затем 99.2 бота, затем 99.0 по времени
+        sell = await venue.create_order('ETH/USDT', 'limit', 'sell', 7, 99.0)
+        return [await venue.fetch_order(order['id']) for order in (first, second, better, sell)]
+
+    first, second, better, sell = asyncio.run(scenario())
+
+    assert better['status'] == 'closed'
+    assert first['status'] == 'closed' and first['average'] == 99.0
+    assert second['status'] == 'open' and second['filled'] == 0
+    assert sell['status'] == 'closed'
+    assert sell['trades'][0]['price'] == 99.5 and sell['trades'][0]['amount'] == 5  # 10% объёма свечи на 20 уровней
+    assert [trade['price'] for trade in sell['trades'][1:]] == [99.2, 99.0]
+
+
+def test_resting_order_fills_when_market_trades_through():
+    venue = make_venue()
+    venue.candles['ETH/USDT'][6, 1:5] = [99.0, 99.0, 98.0, 98.5]
+
+    async def scenario():
+        order = await venue.create_order('ETH/USDT', 'limit', 'buy', 2, 98.8)
+        balance = await venue.fetch_balance()
+        assert balance['used']['USDT'] == pytest.approx(2 * 98.8)
+        venue.step()
+        return await venue.fetch_order(order['id']), await venue.fetch_balance()
+
+    order, balance = asyncio.run(scenario())
+
+    assert order['status'] == 'closed'
+    assert balance['ETH']['total'] == pytest.approx(102)
+    assert balance['USDT']['total'] == pytest.approx(10000 - 2 * 98.8)
+    assert balance['USDT']['used'] == pytest.approx(0)
+
+
+def test_exchange_wrapper_places_cancels_and_replays_candles():
+    venue = make_venue()
+    exchange = sim_exchange(venue)
+
+    async def scenario():
+        order = await exchange.create_limit_buy_order('ETH/USDT', 1, 90.0)
+        open_orders = await exchange.fetch_open_orders('ETH/USDT')
+        canceled = await exchange.cancel_order(order['id'], 'ETH/USDT')
+        with pytest.raises(ccxt.OrderNotFound):
+            await venue.cancel_order(order['id'], 'ETH/USDT')
+        candles = await exchange.fetch_ohlcv('ETH/USDT', '1m', limit=3)
+        venue.step()
+        newer = await exchange.fetch_ohlcv('ETH/USDT', '1m', since=candles[-1][0], limit=10)
+        ticker = await exchange.fetch_ticker('ETH/USDT')
+        balance = await exchange.fetch_balance()
+        await exchange.close()
+        return open_orders, canceled, candles, newer, ticker, balance
+
+    open_orders, canceled, candles, newer, ticker, balance = asyncio.run(scenario())
+
+    assert [o['id'] for o in open_orders] == ['1']
+    assert canceled['status'] == 'canceled'
+    assert balance['free']['USDT'] == 10000.0
+    assert len(candles) == 3 and candles[1][0] - candles[0][0] == 60_000
+    assert [c[0] for c in newer] == [candles[-1][0], candles[-1][0] + 60_000]
+    assert ticker['bid'] == pytest.approx(99.5) and ticker['ask'] == pytest.approx(100.5)
+
+
+def test_rate_limit_emulation_rejects_over_budget():
+    venue = make_venue(weight_limit=10)
+
+    async def scenario():
+        for _ in range(5):
+            await venue.fetch_ticker('ETH/USDT')  # вес 2
+        with pytest.raises(ccxt.RateLimitExceeded):
+            await venue.fetch_ticker('ETH/USDT')
+
+    asyncio.run(scenario())
+
+    assert venue.stats['rejected'] == 1
+    assert venue.last_response_headers['x-mbx-used-weight-1m'] == '12'
@@ -0,0 +1,208 @@
+import asyncio
+
+import strategy
+from account import AccountState
+from bench import sim_setup
+from data import feature_engines, ohlcv_cache
+from strategy import PairScanner, evaluate_pair, select_profitable_pairs
+
+PAIRS = ['A/USDT', 'B/USDT', 'C/USDT', 'D/USDT', 'E/USDT', 'F/USDT']
+
+
+class SnapshotStub:
+    async def market_snapshot(self, max_age=None):
+        return {}
+
+
+class PredictorStub:
+    def __init__(self, predictions):
+        self.predictions = predictions
+
+        self.batches = []
+
+    def prepare(self, pair, df):
+        return df['timestamp'][-1], None, None
+
+    def predict_many(self, requests):
+        self.batches.append(sorted(requests))
+        return {pair: self.predictions[pair] for pair in requests}
+
+
+def balances():
+    return {pair: {'base': 0.0, 'quote_binance': 10000.0, 'quote_bingx': 10000.0} for pair in PAIRS}
+
+
+def test_scan_is_bounded_and_isolates_slow_and_failed_pairs(monkeypatch):
+    monkeypatch.setattr(strategy, 'SCAN_CONCURRENCY', 2)
+    monkeypatch.setattr(strategy, 'SCAN_TIMEOUT', 0.2)
+    active = []
+    peak = [0]
+
+    async def analyze(exchanges, pair, predictor):
+        active.append(pair)
+        peak[0] = max(peak[0], len(active))
+        try:
+            if pair == 'B/USDT':
+                await asyncio.sleep(10)
+            await asyncio.sleep(0.02)
+            if pair == 'C/USDT':
+                raise ValueError('нет стакана')
+            if pair == 'D/USDT':
+                raise asyncio.CancelledError()
+            return 0.001, 0.01, pair
+        finally:
+            active.remove(pair)
+
+    monkeypatch.setattr(strategy, 'analyze_pair', analyze)
+    predictor = PredictorStub({pair: 0.5 for pair in PAIRS})
+
+    async def scenario():
+        start = asyncio.get_running_loop().time()
+        selected = await select_profitable_pairs({'binance': SnapshotStub()}, None, predictor, balances(), PAIRS)
+        return selected, asyncio.get_running_loop().time() - start
+
+    selected, elapsed = asyncio.run(scenario())
+
+    assert peak[0] == 2
+    # Зависшая пара отваливается по таймауту и не держит остальные до конца своего sleep
+    assert elapsed < 1
+    assert [pair for pair, *_ in selected] == ['A/USDT', 'E/USDT', 'F/USDT']
+
+
+def test_selection_order_is_by_score_then_input_order(monkeypatch):
+    spreads = {'A/USDT': 0.001, 'B/USDT': 0.003, 'C/USDT': 0.001, 'D/USDT': 0.003, 'E/USDT': 0.002, 'F/USDT': 0.0}
+
+    async def analyze(exchanges, pair, predictor):
+        # Пары завершаются в обратном порядке: порядок результата от этого не зависит
+        await asyncio.sleep(0.01 * (len(PAIRS) - PAIRS.index(pair)))
+        return spreads[pair], 0.01, pair
+
+    monkeypatch.setattr(strategy, 'analyze_pair', analyze)
+    predictor = PredictorStub({pair: 0.5 for pair in PAIRS})
+
+    selected = asyncio.run(select_profitable_pairs({'binance': SnapshotStub()}, None, predictor, balances(), PAIRS))
+
+    assert [pair for pair, *_ in selected] == ['B/USDT', 'D/USDT', 'E/USDT', 'A/USDT', 'C/USDT', 'F/USDT']
+
+
+def test_pairs_triggered_together_share_one_scan_and_prediction(monkeypatch):
+    async def analyze(exchanges, pair, predictor):
+        return 0.001, 0.01, pair
+
+    monkeypatch.setattr(strategy, 'analyze_pair', analyze)
+    predictor = PredictorStub({pair: 0.5 for pair in PAIRS})
+    scanner = PairScanner({'binance': SnapshotStub()}, predictor, balances(), window=0.02)
+
+    async def scenario():
+        together = await asyncio.gather(*(scanner.select(pair) for pair in ('C/USDT', 'A/USDT', 'B/USDT')))
+        alone = await scanner.select('D/USDT')
+        return together, alone
+
+    together, alone = asyncio.run(scenario())
+
+    assert together == [0.5, 0.5, 0.5] and alone == 0.5
+    assert predictor.batches == [['A/USDT', 'B/USDT', 'C/USDT'], ['D/USDT']]
+
+
+def test_open_positions_outside_the_batch_take_limit_slots(monkeypatch):
+    async def analyze(exchanges, pair, predictor):
+        return 0.001, 0.01, pair
+
+    async def limit(balances):
+        return 2
+
+    monkeypatch.setattr(strategy, 'analyze_pair', analyze)
+    monkeypatch.setattr(strategy, 'calculate_optimal_limit', limit)
+    state = balances()
+    state['F/USDT']['base'] = 1.0
+    predictor = PredictorStub({pair: 0.5 for pair in PAIRS})
+
+    selected = asyncio.run(select_profitable_pairs({'binance': SnapshotStub()}, None, predictor, state,
+                                                   ['A/USDT', 'B/USDT', 'C/USDT']))
+
+    assert [pair for pair, *_ in selected] == ['A/USDT']
+
+
+def test_decision_fetches_candles_once_and_trades_on_the_scan_prediction():
+    pair = 'P000/USDT'
+    venue, exchange = sim_setup([pair], 300)
+    exchanges = {'binance': exchange, 'bingx': exchange}
+    calls = []
+    fetch_ohlcv = venue.fetch_ohlcv
+
+    async def counted(*args, **kwargs):
+        calls.append(args)
+        return await fetch_ohlcv(*args, **kwargs)
+
+    venue.fetch_ohlcv = counted
+    state = {pair: {'base': 0.0, 'quote_binance': 1000.0, 'quote_bingx': 0.0, 'entry_price': 0.0,
+                    'total_fees': 0.0, 'cost': 0.0, 'revenue': 0.0}}
+    predictor = PredictorStub({pair: 0.9})
+    scanner = PairScanner(exchanges, predictor, state, window=0.0)
+
+    async def scenario():
+        try:
+            await evaluate_pair(exchanges, pair, scanner, state, AccountState(exchange), 'candle')
+        finally:
+            await exchange.close()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        ohlcv_cache.clear()
+        feature_engines.clear()
+
+    # trade_pair берёт предсказание отбора, а не загружает свечи и признаки второй раз
+    assert len(calls) == 1
+    assert predictor.batches == [[pair]]
+    assert state[pair]['base'] > 0
+
+
+def test_batch_survives_a_hung_pair_and_a_cancelled_waiter(monkeypatch):
+    monkeypatch.setattr(strategy, 'SCAN_TIMEOUT', 0.1)
+
+    async def analyze(exchanges, pair, predictor):
+        if pair == 'B/USDT':
+            await asyncio.sleep(10)
+        await asyncio.sleep(0.02)
+        return 0.001, 0.01, pair
+
+    monkeypatch.setattr(strategy, 'analyze_pair', analyze)
+    predictor = PredictorStub({pair: 0.5 for pair in PAIRS})
+    scanner = PairScanner({'binance': SnapshotStub()}, predictor, balances(), window=0.01)
+
+    async def scenario():
+        waiters = {pair: asyncio.ensure_future(scanner.select(pair)) for pair in ('A/USDT', 'B/USDT', 'C/USDT')}
+        await asyncio.sleep(0.02)
+        # Отмена обработчика одной пары (остановка планировщика) не отменяет общий скан
+        waiters['C/USDT'].cancel()
+        results = await asyncio.gather(*waiters.values(), return_exceptions=True)
+        return dict(zip(waiters, results))
+
+    results = asyncio.run(scenario())
+
+    assert results['A/USDT'] == 0.5 and results['B/USDT'] is None
+    assert isinstance(results['C/USDT'], asyncio.CancelledError)
+    assert predictor.batches == [['A/USDT', 'C/USDT']]
+
+
+def test_trade_skips_pair_with_empty_book(caplog):
+    from price_calculator import DepthBook
+
+    class EmptyBookExchange:
+        async def fetch_ticker(self, pair, max_age=None):
+            return {'bid': 100.0, 'ask': 100.1}
+
+        async def fetch_depth_book(self, pair):
+            return DepthBook()
+
+    class NoAccount:
+        async def refresh(self):
+            raise AssertionError('баланс не нужен, если стакан пуст')
+
+    state = balances()
+    asyncio.run(strategy.trade_pair({'binance': EmptyBookExchange()}, 'A/USDT', 0.9, state, 'candle', NoAccount()))
+
+    assert state['A/USDT']['base'] == 0.0
+    assert 'Стакан A/USDT пуст' in caplog.text
+    assert 'Недостаточно средств' not in caplog.text